@@ -1,10 +1,15 @@
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 import jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
 from .database import SessionLocal
 from .models import User
 
@@ -14,17 +19,13 @@ security = HTTPBearer()
 
 JWT_SECRET = "cognito_dev_secret"  # 可迁移至环境变量
 JWT_EXPIRE_MINUTES = 120
-
-
-def get_db():
-    """
-    获取数据库会话依赖。
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_INVALIDATE_CHANNEL = "auth:invalidate"
+# 用户角色、密码变更或删除的时间戳（auth:revoked:<用户名>），签发早于它的令牌声明不再可信
+AUTH_REVOKED_PREFIX = "auth:revoked:"
+# Redis 不可用后暂停读取吊销时间戳的秒数（避免每次缓存未命中都等待连接超时）
+AUTH_REVOKED_RETRY_SECONDS = 30
 
 
 def hash_password(password: str) -> str:
@@ -65,28 +66,240 @@ def create_access_token(username: str, role: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 
-def get_current_user(
-    creds: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-):
+class AuthUser(NamedTuple):
     """
-    FastAPI 依赖：解析与校验JWT，返回当前用户。
+    已鉴权用户的轻量快照（可安全缓存与跨会话使用）。
 
-    参数:
-        creds: 授权头部凭证。
-        db: 数据库会话。
-    返回值:
-        User 对象。
+    字段:
+        id: 用户ID（仅凭令牌声明解析时为 None）。
+        username: 用户名。
+        role: 角色。
     """
-    token = creds.credentials
+    id: Optional[int]
+    username: str
+    role: str
+
+
+class _TokenCache:
+    """
+    令牌 → 用户快照的有界 TTL 缓存（LRU 淘汰），线程安全。
+    条目过期时间取 AUTH_CACHE_TTL 与令牌 exp 的较小者；按用户名维护反向索引以便失效。
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, AuthUser, bool]]" = OrderedDict()
+        self._by_user: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[tuple[AuthUser, bool]]:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(token)
+            if hit is None:
+                return None
+            expires, user, verified = hit
+            if expires <= now:
+                self._remove(token)
+                return None
+            self._data.move_to_end(token)
+            return user, verified
+
+    def put(self, token: str, user: AuthUser, verified: bool, exp: Optional[float]) -> None:
+        expires = time.monotonic() + self.ttl
+        if exp is not None:
+            expires = min(expires, time.monotonic() + (exp - time.time()))
+        with self._lock:
+            self._remove(token)
+            self._data[token] = (expires, user, verified)
+            self._by_user.setdefault(user.username, set()).add(token)
+            while len(self._data) > self.max_size:
+                self._remove(next(iter(self._data)))
+
+    def invalidate_user(self, username: str) -> None:
+        with self._lock:
+            for token in list(self._by_user.get(username, ())):
+                self._remove(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+
+    def _remove(self, token: str) -> None:
+        hit = self._data.pop(token, None)
+        if hit is not None:
+            tokens = self._by_user.get(hit[1].username)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    self._by_user.pop(hit[1].username, None)
+
+
+token_cache = _TokenCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+_listener_pid: Optional[int] = None
+_revoked_down_until = 0.0
+
+
+def _listen_invalidations() -> None:
+    """
+    订阅 Redis 失效广播，使其它 API 副本上修改的用户也能及时失效本地缓存。
+    """
+    from .redis_client import get_redis
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(AUTH_INVALIDATE_CHANNEL)
+            for msg in pubsub.listen():
+                if msg.get("type") == "message":
+                    token_cache.invalidate_user(msg["data"].decode())
+        except Exception:
+            # Redis 不可用时依赖 TTL 兜底，稍后重连
+            time.sleep(5)
+
+
+def _ensure_listener() -> None:
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    _listener_pid = os.getpid()
+    threading.Thread(target=_listen_invalidations, name="auth-invalidate", daemon=True).start()
+
+
+def invalidate_user(username: str) -> None:
+    """
+    使某用户的全部缓存令牌失效，记录吊销时间戳并广播到其它进程。
+    角色或密码变更、删除用户时调用（已通过 ORM 事件在事务提交后自动触发）。
+    """
+    token_cache.invalidate_user(username)
+    try:
+        from .redis_client import get_redis
+        pipe = get_redis().pipeline()
+        pipe.set(AUTH_REVOKED_PREFIX + username, time.time(), ex=JWT_EXPIRE_MINUTES * 60)
+        pipe.publish(AUTH_INVALIDATE_CHANNEL, username)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def _claims_revoked(payload: dict) -> bool:
+    """令牌签发后用户是否发生过角色/密码变更或被删除；Redis 不可用时视为未吊销（由 TTL 与令牌过期兜底）。"""
+    global _revoked_down_until
+    if time.monotonic() < _revoked_down_until:
+        return False
+    try:
+        from .redis_client import get_redis
+        stamp = get_redis().get(AUTH_REVOKED_PREFIX + payload["sub"])
+    except Exception:
+        _revoked_down_until = time.monotonic() + AUTH_REVOKED_RETRY_SECONDS
+        return False
+    # iat 为整秒，同一秒内签发的令牌也按已吊销处理（回退到数据库确认，结果仍正确）
+    return stamp is not None and float(stamp) >= float(payload.get("iat") or 0)
+
+
+def _pending_invalidations(target) -> Optional[set]:
+    session = object_session(target)
+    return None if session is None else session.info.setdefault("auth_invalidate", set())
+
+
+# flush 时只记录待失效的用户，事务提交后再失效：提交前失效的话，并发请求仍可能从数据库读到旧角色并重新写入缓存
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.password_hash.history.has_changes():
+        pending = _pending_invalidations(target)
+        if pending is None:
+            invalidate_user(target.username)
+        else:
+            pending.add(target.username)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    pending = _pending_invalidations(target)
+    if pending is None:
+        invalidate_user(target.username)
+    else:
+        pending.add(target.username)
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session):
+    for username in session.info.pop("auth_invalidate", ()):
+        invalidate_user(username)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _session_rolled_back(session, previous_transaction):
+    # 回滚后数据库仍是旧值，缓存无需失效
+    if not session.in_transaction():
+        session.info.pop("auth_invalidate", None)
+
+
+def _decode(token: str) -> dict:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="无效令牌")
-    username = payload.get("sub")
-    if not username:
+    if not payload.get("sub"):
         raise HTTPException(status_code=401, detail="令牌缺失用户信息")
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
+    return payload
+
+
+def _load_user(token: str, payload: dict) -> AuthUser:
+    """查询数据库确认用户存在并取当前角色，结果按令牌缓存。"""
+    db = SessionLocal()
+    try:
+        row = db.query(User.id, User.username, User.role).filter(User.username == payload["sub"]).first()
+    finally:
+        db.close()
+    if not row:
         raise HTTPException(status_code=401, detail="用户不存在")
-    return user
\ No newline at end of file
+    user = AuthUser(id=row.id, username=row.username, role=row.role)
+    token_cache.put(token, user, verified=True, exp=payload.get("exp"))
+    return user
+
+
+def get_token_user(creds: HTTPAuthorizationCredentials = Depends(security)) -> AuthUser:
+    """
+    FastAPI 依赖（只读路由）：凭已校验的令牌声明解析用户，通常不访问数据库。
+    令牌签发后用户角色/密码变更或被删除（Redis 中有更新的吊销时间戳）时，改为查询数据库确认。
+
+    局限：Redis 不可用期间无法读取吊销时间戳，令牌中的角色在过期（JWT_EXPIRE_MINUTES）前仍被信任；
+    需要按当前角色授权的路由应使用 get_current_user。
+
+    参数:
+        creds: 授权头部凭证。
+    返回值:
+        AuthUser（经数据库确认时带 id）。
+    """
+    token = creds.credentials
+    hit = token_cache.get(token)
+    if hit is not None:
+        return hit[0]
+    _ensure_listener()
+    payload = _decode(token)
+    if _claims_revoked(payload):
+        return _load_user(token, payload)
+    user = AuthUser(id=None, username=payload["sub"], role=payload.get("role") or "viewer")
+    token_cache.put(token, user, verified=False, exp=payload.get("exp"))
+    return user
+
+
+def get_current_user(creds: HTTPAuthorizationCredentials = Depends(security)) -> AuthUser:
+    """
+    FastAPI 依赖：解析与校验JWT，返回当前用户。
+    首次校验时查询数据库确认用户存在，结果按令牌缓存（AUTH_CACHE_TTL 秒）；之后同一令牌只做内存查找。
+
+    参数:
+        creds: 授权头部凭证。
+    返回值:
+        AuthUser 用户快照。
+    """
+    token = creds.credentials
+    hit = token_cache.get(token)
+    if hit is not None and hit[1]:
+        return hit[0]
+    _ensure_listener()
+    return _load_user(token, _decode(token))
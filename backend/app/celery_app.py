@@ -1,13 +1,25 @@
 """
-Celery 应用初始化：配置 Redis 作为 broker 与结果后端，并按环境动态路由队列。
+Celery 应用初始化：配置 Redis 作为 broker 与结果后端，并按流水线阶段路由队列。
 
 函数:
     get_celery(): 返回配置好的 Celery 实例。
-    - 当 `WHISPER_SKIP_FASTER` 为真（默认真）时，ASR 任务路由到 `cpu` 队列；否则路由到 `gpu`。
-    - 其它任务维持在 `cpu` 队列。
+    - 下载类任务（fetch_video_meta/expand_bulk_intake）与回填调度（dispatch_backfill）走 `download` 队列。
+    - 当 `WHISPER_SKIP_FASTER` 为真（默认真）时，ASR 任务路由到 `cpu` 队列；否则路由到 `gpu`（可用 `ASR_QUEUE` 覆盖）。
+    - 清洗+分块走 `cpu`，嵌入走 `embed`，索引写入走 `index`（索引文件单写者，应以单并发消费）。
+    - 问答抽取与问题向量重算（extract_qa_task/refresh_qa_task）走嵌入队列，问答索引重建走 `index`。
+    - 缺失向量对账由 celery beat 每 `RECONCILE_INTERVAL_SECONDS` 秒触发一次（走嵌入队列，索引写入走 `index`）。
+    - 任务结果不写入结果后端（task_ignore_result）；大文本经 blobstore 带外传递，消息只携带引用。
+    - `RUN_INLINE_TASKS` 为真时启用 eager 模式，整条链路在调用进程内同步执行。
+    - 发布任务时在消息头写入 `published_at`，worker 开始执行时记录 `cognito_queue_wait_seconds{queue, priority, ...}`。
+    - 优先级：每个队列按 PRIORITY_STEPS 划分子队列（见 services/scheduling.py），子任务与 chain 的后续阶段继承父任务的优先级；
+      每个 worker 进程只预取一条消息、执行完成后才确认（长时间的 ASR 不会囤积后面的消息，worker 退出时消息重新投递）。
+    - 数据库引擎按 worker 角色配置连接池；prefork 子进程启动时丢弃从父进程继承的连接池（见 database.py）。
 """
 from celery import Celery
+from celery.signals import before_task_publish, task_prerun, worker_init, worker_process_init
 import os
+import time
+from .services.scheduling import PRIORITY_BACKFILL, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_SEP, PRIORITY_STEPS, priority_name
 
 
 def get_celery() -> Celery:
@@ -24,13 +36,117 @@ def get_celery() -> Celery:
     asr_queue = os.getenv("ASR_QUEUE", "cpu" if skip_faster else "gpu")
 
     app.conf.task_routes = {
+        "backend.app.tasks.fetch_video_meta": {"queue": "download"},
+        "backend.app.tasks.expand_bulk_intake": {"queue": "download"},
         "backend.app.tasks.transcribe_audio": {"queue": asr_queue},
-        "backend.app.tasks.fetch_video_meta": {"queue": "cpu"},
+        "backend.app.tasks.chunk_transcript_stage": {"queue": "cpu"},
+        "backend.app.tasks.embed_chunks_stage": {"queue": os.getenv("EMBED_QUEUE", "embed")},
+        "backend.app.tasks.index_chunks_stage": {"queue": "index"},
+        # 重嵌入与嵌入阶段共用模型 worker；切换与索引写入同在单写者的 index 队列
+        "backend.app.tasks.migrate_embeddings": {"queue": os.getenv("REEMBED_QUEUE", os.getenv("EMBED_QUEUE", "embed"))},
+        "backend.app.tasks.reembed_index_task": {"queue": os.getenv("REEMBED_QUEUE", os.getenv("EMBED_QUEUE", "embed"))},
+        "backend.app.tasks.rebuild_index": {"queue": os.getenv("REEMBED_QUEUE", os.getenv("EMBED_QUEUE", "embed"))},
+        "backend.app.tasks.cutover_index_task": {"queue": "index"},
+        "backend.app.tasks.summarize_episode_task": {"queue": "cpu"},
+        # 问答抽取需要嵌入问题，与嵌入阶段共用模型 worker；问答索引写入走 index 队列
+        "backend.app.tasks.extract_qa_task": {"queue": os.getenv("EMBED_QUEUE", "embed")},
+        "backend.app.tasks.refresh_qa_task": {"queue": os.getenv("EMBED_QUEUE", "embed")},
+        "backend.app.tasks.build_qa_index_task": {"queue": "index"},
         "backend.app.tasks.process_transcript_task": {"queue": "cpu"},
+        "backend.app.tasks.rebuild_media_catalog": {"queue": "cpu"},
+        "backend.app.tasks.reconcile_missing_vectors": {"queue": os.getenv("EMBED_QUEUE", "embed")},
+        "backend.app.tasks.index_reconciled_chunks": {"queue": "index"},
+        "backend.app.tasks.purge_blobs": {"queue": "cpu"},
+        "backend.app.tasks.evict_media_cache": {"queue": "cpu"},
+        "backend.app.tasks.purge_upload_sessions": {"queue": "cpu"},
+        "backend.app.tasks.dispatch_backfill": {"queue": "download"},
+    }
+    # 周期对账：需要运行 celery beat
+    app.conf.beat_schedule = {
+        "reconcile-missing-vectors": {
+            "task": "backend.app.tasks.reconcile_missing_vectors",
+            "schedule": float(os.getenv("RECONCILE_INTERVAL_SECONDS", "600")),
+            "options": {"priority": PRIORITY_BACKFILL},
+        },
+        "purge-blobs": {
+            "task": "backend.app.tasks.purge_blobs",
+            "schedule": 3600.0,
+        },
+        # 上传临时目录须与 cpu worker 共享（与媒体目录相同）
+        "purge-upload-sessions": {
+            "task": "backend.app.tasks.purge_upload_sessions",
+            "schedule": 3600.0,
+        },
+        "evict-media-cache": {
+            "task": "backend.app.tasks.evict_media_cache",
+            "schedule": float(os.getenv("MEDIA_CACHE_EVICT_INTERVAL_SECONDS", "300")),
+            "options": {"priority": PRIORITY_BACKFILL},
+        },
+        # 回收超时的回填名额并继续放行（正常情况下子任务结束时即触发调度）
+        "dispatch-backfill": {
+            "task": "backend.app.tasks.dispatch_backfill",
+            "schedule": float(os.getenv("BACKFILL_DISPATCH_INTERVAL_SECONDS", "60")),
+            "options": {"priority": PRIORITY_INTERACTIVE},
+        },
     }
     app.conf.update(task_serializer="json", result_serializer="json", accept_content=["json"]) 
+    # 没有调用方读取任务结果（链路内的返回值直接随消息传给下一阶段），不写入结果后端，避免在 Redis 中堆积
+    app.conf.task_ignore_result = True
+    # 优先级子队列：worker 按优先级顺序取消息；visibility_timeout 须长于最长的任务（acks_late 下超时未确认的消息会被重新投递）
+    app.conf.broker_transport_options = {
+        "priority_steps": PRIORITY_STEPS,
+        "sep": PRIORITY_SEP,
+        "queue_order_strategy": "priority",
+        "visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(6 * 3600))),
+    }
+    app.conf.task_default_priority = PRIORITY_NORMAL
+    app.conf.task_inherit_parent_priority = True
+    # 长任务不囤积消息：每个进程只预取一条，执行完成后才确认
+    app.conf.worker_prefetch_multiplier = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1"))
+    app.conf.task_acks_late = True
+    app.conf.task_reject_on_worker_lost = True
+    if os.getenv("RUN_INLINE_TASKS", "0").lower() in {"1", "true", "yes"}:
+        app.conf.task_always_eager = True
     return app
 
 
+@worker_init.connect
+def _init_worker_engine(**kwargs):
+    """worker 主进程（solo/threads 池时即执行任务的进程）按 worker 角色创建数据库引擎。"""
+    from .database import init_engine
+    init_engine("worker")
+
+
+@worker_process_init.connect
+def _init_child_engine(**kwargs):
+    """prefork 子进程：丢弃继承的连接池（不关闭父进程的连接），重新按 worker 角色创建引擎。"""
+    from .database import init_engine
+    init_engine("worker")
+
+
+@before_task_publish.connect
+def _stamp_published_at(headers=None, **kwargs):
+    """在消息头写入发布时间，用于统计排队等待时长。"""
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def _observe_queue_wait(task=None, **kwargs):
+    """
+    任务开始执行时记录排队时长（按实际投递的队列打标签）；eager 模式不经过 broker，不记录。
+    """
+    published_at = getattr(task.request, "published_at", None) if task is not None else None
+    if not published_at:
+        return
+    from .services import metrics
+    delivery_info = task.request.delivery_info or {}
+    queue = delivery_info.get("routing_key") or "unknown"
+    metrics.observe(
+        "cognito_queue_wait_seconds", max(0.0, time.time() - float(published_at)),
+        queue=queue, priority=priority_name(delivery_info.get("priority")), task=task.name.rsplit(".", 1)[-1],
+    )
+
+
 # 让Celery命令行可发现
 celery_app = get_celery()
\ No newline at end of file
@@ -29,4 +29,5 @@ DB_NAME = get_env("DB_NAME", "cognito")
 
 BACKEND_HOST = get_env("BACKEND_HOST", "0.0.0.0")
 BACKEND_PORT = int(get_env("BACKEND_PORT", "8000"))
-ALLOW_ORIGINS = [s.strip() for s in get_env("ALLOW_ORIGINS", "http://localhost:5173").split(",")]
\ No newline at end of file
+ALLOW_ORIGINS = [s.strip() for s in get_env("ALLOW_ORIGINS", "http://localhost:5173").split(",")]
+REDIS_URL = get_env("REDIS_URL", "redis://localhost:6379/0")
@@ -1,13 +1,45 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
-from .config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+"""
+数据库引擎与会话：每个进程一个引擎，连接池大小按进程角色配置。
+
+- 进程角色（DB_ROLE，默认 api）：api 为 FastAPI 线程池并发，worker 为 Celery prefork 子进程（一次执行一个任务），
+  script 为迁移、快照等一次性命令。各角色的池大小可用 DB_POOL_SIZE_<角色> / DB_MAX_OVERFLOW_<角色> 覆盖。
+- fork 安全：子进程中丢弃继承来的连接池（不关闭父进程的连接），首次使用时重新建立连接；
+  Celery worker 子进程启动时（worker_process_init）按 worker 角色重建引擎。
+- 连接存活：不在每次取连接时发 ping，而是超过 DB_POOL_RECYCLE 秒的连接在取出时重建
+  （须小于 MySQL wait_timeout 与中间代理的空闲超时）。
+- 指标：取连接等待时长、超时次数，以及建立/关闭、取出/归还连接的计数（差值即当前连接数与占用数，跨进程累加）。
+  连接池钩子内只更新进程内的计数（加锁，无网络 I/O），由指标模块的后台线程在写入时采集增量。
+"""
+import bisect
 import os
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
+from sqlalchemy.pool import QueuePool
+from .config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+from .services import metrics
 
 
 class Base(DeclarativeBase):
     pass
 
 
+DB_ROLE = os.getenv("DB_ROLE", "api")
+# 角色 -> (pool_size, max_overflow)：API 默认线程池 40 线程，多数请求只短暂占用连接
+_POOL_DEFAULTS = {"api": (10, 20), "worker": (2, 2), "script": (2, 0)}
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+engine: Engine | None = None
+_role = DB_ROLE
+_pid = os.getpid()
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
 def get_database_url() -> str:
     # 允许通过环境变量 DB_URL 指定开发回退（例如 sqlite:///./data/cognito.db）
     db_url = os.getenv("DB_URL")
@@ -16,9 +48,164 @@ def get_database_url() -> str:
     return f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
 
 
-url = get_database_url()
-# 为 SQLite 创建目录
-if url.startswith("sqlite"):
-    os.makedirs("data", exist_ok=True)
-engine = create_engine(url, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+def pool_settings(role: str) -> tuple[int, int]:
+    """角色的 (pool_size, max_overflow)，环境变量优先。"""
+    size, overflow = _POOL_DEFAULTS.get(role, _POOL_DEFAULTS["script"])
+    key = role.upper()
+    return int(os.getenv(f"DB_POOL_SIZE_{key}", str(size))), int(os.getenv(f"DB_MAX_OVERFLOW_{key}", str(overflow)))
+
+
+# 取连接等待的分桶（秒）：池有空闲连接时为微秒级，排队或新建连接时为毫秒到秒级
+_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_COUNTERS = {
+    "connect": "cognito_db_connections_opened_total",
+    "close": "cognito_db_connections_closed_total",
+    "checkout": "cognito_db_checkouts_total",
+    "checkin": "cognito_db_checkins_total",
+    "timeout": "cognito_db_pool_timeouts_total",
+}
+
+
+class _PoolStats:
+    """进程内的连接池统计（自上次采集以来的增量），线程安全。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = dict.fromkeys(_COUNTERS, 0)
+        self.wait_buckets = [0] * (len(_WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+
+    def add(self, event_name: str) -> None:
+        with self.lock:
+            self.counts[event_name] += 1
+
+    def add_wait(self, seconds: float) -> None:
+        with self.lock:
+            self.wait_buckets[bisect.bisect_left(_WAIT_BUCKETS, seconds)] += 1
+            self.wait_sum += seconds
+
+    def take(self) -> tuple:
+        with self.lock:
+            snapshot = (self.counts, self.wait_buckets, self.wait_sum)
+            self.reset()
+        return snapshot
+
+
+_stats = _PoolStats()
+
+
+def _collect_pool_stats() -> None:
+    """把连接池统计的增量并入指标缓冲（由指标模块的后台线程调用）。"""
+    counts, wait_buckets, wait_sum = _stats.take()
+    for event_name, n in counts.items():
+        if n:
+            metrics.inc(_COUNTERS[event_name], n, role=_role)
+    metrics.observe_counts("cognito_db_checkout_wait_seconds", wait_buckets, wait_sum, buckets=_WAIT_BUCKETS, role=_role)
+
+
+class _TimedQueuePool(QueuePool):
+    """记录取连接等待时长（含池满排队与新建连接）的连接池。"""
+
+    def _do_get(self):
+        # 只检查本进程的指标写入线程已启动（比较 pid），不做网络 I/O
+        metrics.ensure_flusher()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            _stats.add("timeout")
+            raise
+        finally:
+            _stats.add_wait(time.perf_counter() - start)
+
+
+def _count(event_name: str):
+    def listener(*args):
+        _stats.add(event_name)
+    return listener
+
+
+def create_db_engine(role: str) -> Engine:
+    """
+    按角色创建引擎（不立即建立连接）。
+
+    参数:
+        role: 进程角色（api/worker/script）。
+    返回值:
+        Engine 实例。
+    """
+    url = get_database_url()
+    if url.startswith("sqlite"):
+        # 为 SQLite 创建目录；SQLite 使用默认连接池，不设池大小
+        os.makedirs("data", exist_ok=True)
+        return create_engine(url)
+    size, overflow = pool_settings(role)
+    eng = create_engine(
+        url,
+        poolclass=_TimedQueuePool,
+        pool_size=size,
+        max_overflow=overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    for name in ("connect", "close", "checkout", "checkin"):
+        event.listen(eng, name, _count(name))
+    return eng
+
+
+def init_engine(role: str | None = None) -> Engine:
+    """
+    (重新)创建本进程的引擎并绑定到 SessionLocal；已有引擎时先释放其连接池。
+
+    参数:
+        role: 进程角色；为空时沿用当前角色。
+    返回值:
+        新的 Engine。
+    """
+    global engine, _role, _pid, _stats
+    if engine is not None:
+        # fork 出的子进程不能关闭父进程仍在使用的连接，只丢弃引用
+        engine.dispose(close=os.getpid() == _pid)
+    if os.getpid() != _pid:
+        # 继承的统计属于父进程，锁也可能在 fork 时被持有
+        _stats = _PoolStats()
+    _role = role or _role
+    _pid = os.getpid()
+    engine = create_db_engine(_role)
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+def get_engine() -> Engine:
+    """本进程的引擎（fork 后首次调用时重建）。"""
+    if engine is None or os.getpid() != _pid:
+        init_engine()
+    return engine
+
+
+def _after_fork_in_child() -> None:
+    if engine is not None:
+        init_engine()
+
+
+def get_db():
+    """
+    FastAPI 依赖项：获取数据库会话，请求结束后关闭（连接归还连接池）。
+
+    返回:
+        SQLAlchemy Session 对象。
+    """
+    db: Session = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+init_engine()
+metrics.register_collector(_collect_pool_stats)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
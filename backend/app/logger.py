@@ -1,3 +1,5 @@
+import os
+import sys
 from loguru import logger
 
 
@@ -5,13 +7,20 @@ def setup_logger():
     """
     初始化结构化日志配置。
 
+    设置 `LOG_JSON=1` 时以 JSON 行输出（loguru serialize），便于日志系统按字段（如 stage、duration）检索；
+    `LOG_LEVEL` 控制日志级别（默认 INFO）。
+
     无参数。
     返回值：无。
     """
     logger.remove()
-    logger.add(
-        sink=lambda msg: print(msg, end=""),
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
-        level="INFO",
-    )
+    level = os.getenv("LOG_LEVEL", "INFO")
+    if os.getenv("LOG_JSON", "0").lower() in {"1", "true", "yes"}:
+        logger.add(sink=sys.stdout, serialize=True, level=level)
+    else:
+        logger.add(
+            sink=lambda msg: print(msg, end=""),
+            format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
+            level=level,
+        )
     return logger
\ No newline at end of file
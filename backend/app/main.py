@@ -1,13 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import ALLOW_ORIGINS
-from .database import Base, engine
+import os
 from .routers.upload import router as upload_router
 from .routers.query import router as query_router
 from .routers.auth import router as auth_router
 from .routers.episodes import router as episodes_router
 from .routers.intake import router as intake_router
 from .routers.tasks import router as tasks_router
+from .routers.metrics import router as metrics_router
 from .logger import setup_logger
 
 
@@ -18,7 +19,8 @@ def create_app() -> FastAPI:
     配置项:
         - 跨域：允许前端开发地址访问。
         - 路由：注册上传与查询路由。
-        - 数据库：创建所有模型表（仅在首次启动时生效）。
+        - 数据库：建表由独立的迁移步骤完成（python -m backend.app.migrate）；
+          仅当 DB_AUTO_MIGRATE 为真时在启动时执行，便于本地开发。
 
     返回:
         FastAPI 应用实例。
@@ -33,8 +35,10 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    # 创建数据库表
-    Base.metadata.create_all(bind=engine)
+    # 开发便利：显式开启时才在启动时建表，生产环境由迁移步骤负责
+    if os.getenv("DB_AUTO_MIGRATE", "0").lower() in {"1", "true", "yes"}:
+        from .migrate import run_migrations
+        run_migrations()
 
     # 注册路由
     app.include_router(auth_router)
@@ -43,6 +47,7 @@ def create_app() -> FastAPI:
     app.include_router(intake_router)
     app.include_router(tasks_router)
     app.include_router(query_router)
+    app.include_router(metrics_router)
 
     return app
 
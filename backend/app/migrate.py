@@ -0,0 +1,113 @@
+"""
+数据库迁移步骤：创建缺失的表，并为已有表补充新增的列与索引。部署时在启动 API/worker 之前显式执行一次：
+
+    python -m backend.app.migrate
+
+API 启动时不再自动建表，避免每个副本冷启动都访问数据库元数据。
+
+升级规则（可重复执行，已存在的列与索引跳过）：
+- 缺失的列按模型定义 ALTER TABLE ADD COLUMN；NOT NULL 列须有标量默认值（如 collection 默认 'default'），
+  以该值回填已有行。已有表上新增列的外键约束仅在 MySQL 上补建（SQLite 不支持为已有表添加约束）。
+- 缺失的索引按模型中声明的 Index 创建（含唯一索引）。
+- 不删除、不修改已有的列与索引。
+"""
+from loguru import logger
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import Column, CreateIndex
+from .database import Base, get_engine, init_engine
+from . import models  # noqa: F401  注册全部模型到 Base.metadata
+from .logger import setup_logger
+
+
+def _literal(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _column_ddl(conn: Connection, column: Column) -> str:
+    """已有表新增列的 DDL 片段（列名、类型、空值与默认值）。"""
+    ddl = f"{column.name} {column.type.compile(dialect=conn.dialect)}"
+    if column.nullable:
+        return ddl
+    default = column.default
+    if default is None or not default.is_scalar:
+        raise RuntimeError(f"无法为已有表添加没有默认值的 NOT NULL 列: {column.table.name}.{column.name}")
+    return f"{ddl} NOT NULL DEFAULT {_literal(default.arg)}"
+
+
+def add_missing_columns(conn: Connection) -> list[str]:
+    """
+    为已存在的表补充模型中新增的列。
+
+    参数:
+        conn: 数据库连接（调用方负责事务）。
+    返回值:
+        新增的列（表名.列名）。
+    """
+    insp = inspect(conn)
+    tables = set(insp.get_table_names())
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(conn, column)}"))
+            if conn.dialect.name != "sqlite":
+                for fk in column.foreign_keys:
+                    target = fk.column
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD FOREIGN KEY ({column.name}) REFERENCES {target.table.name} ({target.name})"
+                    ))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes(conn: Connection) -> list[str]:
+    """
+    为已存在的表创建模型中声明但数据库中缺失的索引（create_all 不为已有表补建索引）。
+
+    参数:
+        conn: 数据库连接（调用方负责事务）。
+    返回值:
+        新建的索引名。
+    """
+    insp = inspect(conn)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing:
+                continue
+            conn.execute(CreateIndex(index))
+            created.append(index.name)
+    return created
+
+
+def run_migrations() -> None:
+    """
+    创建缺失的数据表，为已有表补充新增的列与索引。
+
+    无参数。
+    返回值：无。
+    """
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in add_missing_columns(conn):
+            logger.info(f"新增列 {name}")
+        for name in create_missing_indexes(conn):
+            logger.info(f"新建索引 {name}")
+
+
+if __name__ == "__main__":
+    log = setup_logger()
+    init_engine("script")
+    run_migrations()
+    log.info("数据库迁移完成")
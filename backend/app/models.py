@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, LargeBinary, Float, Index
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, LargeBinary, Float, Index, BigInteger, Boolean
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
 from .database import Base
@@ -12,6 +12,9 @@ class Episode(Base):
         id: 主键。
         title: 标题或文件名。
         file_path: 音频文件的相对路径。
+        source_url: 来源链接（URL摄入时）。
+        source_key: 规整后的来源键（如 youtube:<id>），用于缓存复用与去重。
+        collection: 所属知识库（如创作者），各知识库的块写入独立的向量索引。
         created_at: 创建时间。
         status: 处理状态（uploaded, processed, failed）。
     """
@@ -21,12 +24,22 @@ class Episode(Base):
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     file_path: Mapped[str] = mapped_column(String(512), nullable=False)
     source_url: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    source_key: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    collection: Mapped[str] = mapped_column(String(64), default="default", nullable=False)
     summary: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     status: Mapped[str] = mapped_column(String(32), default="uploaded")
 
     chunks: Mapped[list["Chunk"]] = relationship("Chunk", back_populates="episode", cascade="all, delete-orphan")
     qas: Mapped[list["QA"]] = relationship("QA", back_populates="episode", cascade="all, delete-orphan")
+    summary_nodes: Mapped[list["SummaryNode"]] = relationship("SummaryNode", cascade="all, delete-orphan")
+    checkpoints: Mapped[list["PipelineCheckpoint"]] = relationship("PipelineCheckpoint", cascade="all, delete-orphan")
+
+Index("idx_episodes_source_key", Episode.source_key)
+Index("idx_episodes_collection", Episode.collection)
+# 列表键集分页：(created_at, id) 及按状态过滤的组合索引
+Index("idx_episodes_created", Episode.created_at, Episode.id)
+Index("idx_episodes_status_created", Episode.status, Episode.created_at, Episode.id)
 
 
 class Chunk(Base):
@@ -40,6 +53,10 @@ class Chunk(Base):
         start_time: 起始时间（秒）。
         end_time: 结束时间（秒）。
         embedding: 文本嵌入向量（可选，后续可用于向量检索）。
+        embed_model: 生成 embedding 的模型名（为空表示迁移前的旧向量）。
+        simhash: 文本 SimHash 指纹（64位，按有符号整数存储），用于近重复检测。
+        canonical_chunk_id: 近重复块指向的规范块；非空时本块不再嵌入与入索引。
+        collection: 所属知识库（冗余自节目，索引写入与构建按知识库分组时无需关联节目表）。
     """
     __tablename__ = "chunks"
 
@@ -49,10 +66,37 @@ class Chunk(Base):
     start_time: Mapped[float | None] = mapped_column(Float, nullable=True)
     end_time: Mapped[float | None] = mapped_column(Float, nullable=True)
     embedding: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    embed_model: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    simhash: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    canonical_chunk_id: Mapped[int | None] = mapped_column(ForeignKey("chunks.id"), nullable=True)
+    collection: Mapped[str] = mapped_column(String(64), default="default", nullable=False)
 
     episode: Mapped[Episode] = relationship("Episode", back_populates="chunks")
 
 Index("idx_chunks_episode", Chunk.episode_id)
+Index("idx_chunks_canonical", Chunk.canonical_chunk_id)
+Index("idx_chunks_collection", Chunk.collection, Chunk.id)
+
+
+class ChunkSignature(Base):
+    """
+    近重复检测的 LSH 签名索引：规范块的 SimHash 按位分段（band），每段一行。
+    汉明距离不超过阈值的两个指纹至少有一段完全相同，按 (band, value) 等值查询即可召回候选。
+
+    字段:
+        id: 主键。
+        band: 分段序号。
+        value: 该段的位值。
+        chunk_id: 规范块ID。
+    """
+    __tablename__ = "chunk_signatures"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    band: Mapped[int] = mapped_column(Integer, nullable=False)
+    value: Mapped[int] = mapped_column(Integer, nullable=False)
+    chunk_id: Mapped[int] = mapped_column(ForeignKey("chunks.id"), nullable=False)
+
+Index("idx_chunk_sig_band_value", ChunkSignature.band, ChunkSignature.value)
 
 
 class QA(Base):
@@ -64,6 +108,12 @@ class QA(Base):
         episode_id: 关联的节目 ID。
         question: 问题文本。
         answer: 答案文本。
+        source: 来源（chunk：讲者自问自答；danmaku：弹幕高频问题；为空表示手工录入）。
+        chunk_id: 答案所在的块。
+        weight: 问题热度（弹幕中出现的次数，块内问答为 1）。
+        collection: 所属知识库（冗余自节目，按知识库构建问答索引）。
+        embedding: 问题向量（float32 bytes），写入问答索引。
+        embed_model: 问题向量的模型名。
     """
     __tablename__ = "qas"
 
@@ -71,10 +121,17 @@ class QA(Base):
     episode_id: Mapped[int] = mapped_column(ForeignKey("episodes.id"), nullable=False)
     question: Mapped[str] = mapped_column(Text, nullable=False)
     answer: Mapped[str] = mapped_column(Text, nullable=False)
+    source: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    chunk_id: Mapped[int | None] = mapped_column(ForeignKey("chunks.id"), nullable=True)
+    weight: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    collection: Mapped[str] = mapped_column(String(64), default="default", nullable=False)
+    embedding: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    embed_model: Mapped[str | None] = mapped_column(String(128), nullable=True)
 
     episode: Mapped[Episode] = relationship("Episode", back_populates="qas")
 
 Index("idx_qas_episode", QA.episode_id)
+Index("idx_qas_collection", QA.collection, QA.id)
 
 
 class User(Base):
@@ -104,7 +161,8 @@ class Task(Base):
     字段:
         id: 主键。
         episode_id: 关联节目。
-        type: 任务类型（transcript_process/index_build等）。
+        parent_id: 父任务（批量摄入时指向汇总任务）。
+        type: 任务类型（transcript_process/intake_url/intake_bulk等）。
         status: 状态（pending/running/succeeded/failed）。
         message: 状态说明或错误信息。
         created_at/updated_at: 时间戳。
@@ -113,10 +171,95 @@ class Task(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     episode_id: Mapped[int | None] = mapped_column(ForeignKey("episodes.id"), nullable=True)
+    parent_id: Mapped[int | None] = mapped_column(ForeignKey("tasks.id"), nullable=True)
     type: Mapped[str] = mapped_column(String(64), nullable=False)
     status: Mapped[str] = mapped_column(String(32), default="pending", nullable=False)
     message: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
-Index("idx_tasks_episode", Task.episode_id)
\ No newline at end of file
+Index("idx_tasks_episode", Task.episode_id)
+Index("idx_tasks_parent_status", Task.parent_id, Task.status)
+
+
+class MediaArtifact(Base):
+    """
+    媒体产物目录。按来源ID记录本地缓存的音频、字幕、弹幕与解码PCM文件，避免逐任务扫描媒体目录。
+
+    字段:
+        id: 主键。
+        source_id: 来源ID（如B站BV号、yt-dlp视频ID或上传文件名）。
+        kind: 产物类型（audio/caption/danmaku/pcm）。
+        path: 文件路径。
+        size: 文件字节数。
+        sha256: 文件内容哈希。
+        processed: 所属节目是否已处理完成（完成后音频可被LRU淘汰）。
+        created_at/updated_at: 时间戳。
+        last_accessed_at: 最近访问时间（LRU依据）。
+    """
+    __tablename__ = "media_artifacts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    source_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    path: Mapped[str] = mapped_column(String(512), nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    processed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_accessed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+Index("uq_media_source_kind", MediaArtifact.source_id, MediaArtifact.kind, unique=True)
+Index("idx_media_path", MediaArtifact.path)
+Index("idx_media_lru", MediaArtifact.kind, MediaArtifact.processed, MediaArtifact.last_accessed_at)
+
+class SummaryNode(Base):
+    """
+    分层摘要节点（map-reduce 摘要树的缓存）。
+
+    字段:
+        id: 主键。
+        episode_id: 关联节目。
+        level: 层级（0=块，1=章节，2=整期）。
+        position: 同层内的顺序位置。
+        chunk_id: 对应块（仅 level=0；不设外键，块被替换时随位置改写）。
+        source_hash: 输入指纹（块文本或子节点指纹的哈希）；复用缓存时按指纹查找，位置移动的未变化分支不重算。
+        text: 摘要文本。
+        updated_at: 更新时间。
+    """
+    __tablename__ = "summary_nodes"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    episode_id: Mapped[int] = mapped_column(ForeignKey("episodes.id"), nullable=False)
+    level: Mapped[int] = mapped_column(Integer, nullable=False)
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    chunk_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    source_hash: Mapped[str] = mapped_column(String(40), nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+Index("uq_summary_node", SummaryNode.episode_id, SummaryNode.level, SummaryNode.position, unique=True)
+
+
+class PipelineCheckpoint(Base):
+    """
+    流水线阶段检查点。每个节目每个阶段一行，重试或手动恢复时从最后完成的阶段继续。
+
+    字段:
+        id: 主键。
+        episode_id: 关联节目。
+        stage: 阶段（transcript/cleaned/chunks/embedded/indexed）。
+        payload: 阶段产出（原始转录、清洗后文本、块ID列表或向量统计的 JSON）。
+        updated_at: 更新时间。
+    """
+    __tablename__ = "pipeline_checkpoints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    episode_id: Mapped[int] = mapped_column(ForeignKey("episodes.id"), nullable=False)
+    stage: Mapped[str] = mapped_column(String(16), nullable=False)
+    # 长节目的转录文本可能超过 TEXT 上限（MySQL 下渲染为 LONGTEXT）
+    payload: Mapped[str] = mapped_column(Text(length=2**32 - 1), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+Index("uq_pipeline_checkpoint", PipelineCheckpoint.episode_id, PipelineCheckpoint.stage, unique=True)
@@ -0,0 +1,41 @@
+"""
+Redis 客户端：复用 Celery broker 所在的 Redis，用于跨进程共享的计数、状态与消息。
+
+函数:
+    get_redis(): 返回进程内单例的同步客户端（惰性创建）。
+"""
+import redis
+from .config import REDIS_URL
+
+
+_client: redis.Redis | None = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    获取 Redis 客户端。
+
+    返回值:
+        redis.Redis 实例（连接池在进程内复用）。
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+
+_async_client = None
+
+
+def get_async_redis():
+    """
+    获取异步 Redis 客户端（供 SSE 等异步端点订阅 pub/sub 使用）。
+
+    返回值:
+        redis.asyncio.Redis 实例。
+    """
+    global _async_client
+    if _async_client is None:
+        import redis.asyncio as aioredis
+        _async_client = aioredis.Redis.from_url(REDIS_URL)
+    return _async_client
@@ -1,22 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from ..database import SessionLocal
+from ..database import get_db
 from ..models import User
-from ..auth import hash_password, verify_password, create_access_token, get_current_user
+from ..auth import hash_password, verify_password, create_access_token, get_token_user, AuthUser
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class RegisterReq(BaseModel):
     """注册请求模型。"""
     username: str
@@ -56,5 +48,5 @@ def login(req: LoginReq, db: Session = Depends(get_db)):
 
 
 @router.get("/me")
-def me(user: User = Depends(get_current_user)):
+def me(user: AuthUser = Depends(get_token_user)):
     return {"username": user.username, "role": user.role}
\ No newline at end of file
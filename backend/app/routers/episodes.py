@@ -1,46 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, func, or_, and_
 from pydantic import BaseModel
-from ..database import SessionLocal
-from ..models import Episode, Task
+from ..database import get_db
+from ..models import Episode, Task, SummaryNode
 from ..auth import get_current_user
-from ..tasks import process_transcript_task
-import os
+from ..services.scheduling import PRIORITY_INTERACTIVE
+from ..services.progress import init_task, task_snapshot
+from ..services.dedup import episode_dedup_stats
 
 
 router = APIRouter(prefix="/episodes", tags=["episodes"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class TranscriptReq(BaseModel):
     """提交转录文本请求模型。"""
     episode_id: int
     transcript: str
 
 
-class PageParams(BaseModel):
-    """分页参数。"""
-    page: int = 1
-    size: int = 10
-    status: str | None = None
+EPISODE_COUNT_TTL = float(os.getenv("EPISODE_COUNT_TTL", "30"))
+# status 来自查询参数，取值不受限，缓存条目数须有上限
+EPISODE_COUNT_CACHE_SIZE = int(os.getenv("EPISODE_COUNT_CACHE_SIZE", "64"))
+
+
+class _CountCache:
+    """
+    状态 → 节目总数的有界 TTL 缓存（LRU 淘汰），线程安全（同步端点在线程池中并发执行）。
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str | None, tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, status: str | None) -> int | None:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(status)
+            if hit is None:
+                return None
+            expires, total = hit
+            if expires <= now:
+                del self._data[status]
+                return None
+            self._data.move_to_end(status)
+            return total
+
+    def put(self, status: str | None, total: int) -> None:
+        with self._lock:
+            self._data.pop(status, None)
+            self._data[status] = (time.monotonic() + self.ttl, total)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+_count_cache = _CountCache(EPISODE_COUNT_CACHE_SIZE, EPISODE_COUNT_TTL)
+
+
+def _encode_cursor(created_at: datetime, episode_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{episode_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, eid = raw.split("|", 1)
+        return datetime.fromisoformat(ts), int(eid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def _count_episodes(db: Session, status: str | None) -> int:
+    """
+    SQL COUNT(*)，按状态缓存 EPISODE_COUNT_TTL 秒（近似值，翻页时不必每次全量计数）。
+    """
+    hit = _count_cache.get(status)
+    if hit is not None:
+        return hit
+    q = select(func.count()).select_from(Episode)
+    if status:
+        q = q.where(Episode.status == status)
+    total = int(db.execute(q).scalar_one())
+    _count_cache.put(status, total)
+    return total
 
 
 @router.get("")
-def list_episodes(page: int = 1, size: int = 10, status: str | None = None, db: Session = Depends(get_db)):
-    q = select(Episode)
+def list_episodes(
+    page: int = 1,
+    size: int = Query(10, ge=1, le=100),
+    status: str | None = None,
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    节目列表，按创建时间倒序。
+
+    分页:
+        - 游标分页（推荐）：传入上一页的 next_cursor，基于 (created_at, id) 键集定位，深页与首页同样快。
+        - 偏移分页（兼容）：未传 cursor 时使用 page。
+    返回:
+        items、size、total（SQL计数，短时缓存）、next_cursor（无下一页时为空）。
+    """
+    q = select(Episode.id, Episode.title, Episode.status, Episode.created_at)
     if status:
         q = q.where(Episode.status == status)
-    total = db.execute(select(Episode).where(Episode.status == status) if status else select(Episode)).scalars().count()
-    rows = db.execute(q.offset((page - 1) * size).limit(size)).scalars().all()
-    return {"items": [{"id": e.id, "title": e.title, "status": e.status} for e in rows], "page": page, "size": size, "total": total}
+    if cursor:
+        c_at, c_id = _decode_cursor(cursor)
+        q = q.where(or_(Episode.created_at < c_at, and_(Episode.created_at == c_at, Episode.id < c_id)))
+    q = q.order_by(Episode.created_at.desc(), Episode.id.desc())
+    if not cursor and page > 1:
+        q = q.offset((page - 1) * size)
+    # 多取一行判断是否还有下一页
+    rows = db.execute(q.limit(size + 1)).all()
+    has_more = len(rows) > size
+    rows = rows[:size]
+    next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id) if has_more and rows else None
+    return {
+        "items": [{"id": r.id, "title": r.title, "status": r.status} for r in rows],
+        "page": page,
+        "size": size,
+        "total": _count_episodes(db, status),
+        "next_cursor": next_cursor,
+    }
 
 
 # 采用Celery异步处理，不在API进程内实例化Embedder/Index。
@@ -61,20 +152,43 @@ def submit_transcript(req: TranscriptReq, db: Session = Depends(get_db), user=De
     db.add(task)
     db.commit()
     db.refresh(task)
-    run_inline = os.getenv("RUN_INLINE_TASKS", "0").lower() in {"1", "true", "yes"}
-    if run_inline:
-        try:
-            process_transcript_task(task_id=task.id, episode_id=req.episode_id, transcript_text=req.transcript)
-        except Exception:
-            pass
-    else:
-        process_transcript_task.delay(task_id=task.id, episode_id=req.episode_id, transcript_text=req.transcript)
+    init_task(task)
+    # 任务模块依赖 Celery，按需导入以保持 API 冷启动轻量
+    from ..tasks import start_text_pipeline
+    # RUN_INLINE_TASKS 为真时 Celery 以 eager 模式在本进程内执行整条链路
+    start_text_pipeline(task.id, req.episode_id, req.transcript, priority=PRIORITY_INTERACTIVE)
     return {"task_id": task.id, "message": "任务已创建"}
 
 
+@router.get("/{episode_id}/summary")
+def episode_summary(episode_id: int, db: Session = Depends(get_db)):
+    """
+    返回节目的整期摘要与按顺序排列的章节摘要（分层摘要在索引完成后由 summarize_episode_task 计算）。
+    """
+    ep = db.query(Episode).get(episode_id)
+    if not ep:
+        raise HTTPException(status_code=404, detail="节目不存在")
+    rows = (
+        db.query(SummaryNode.text)
+        .filter(SummaryNode.episode_id == episode_id, SummaryNode.level == 1)
+        .order_by(SummaryNode.position).all()
+    )
+    return {"episode_id": ep.id, "summary": ep.summary, "sections": [t for (t,) in rows]}
+
+
+@router.get("/{episode_id}/dedup")
+def episode_dedup(episode_id: int, db: Session = Depends(get_db)):
+    """
+    返回节目的近重复统计：块数、重复块数、重复率与节省的向量字节数。
+    """
+    if not db.query(Episode.id).filter(Episode.id == episode_id).first():
+        raise HTTPException(status_code=404, detail="节目不存在")
+    return episode_dedup_stats(db, episode_id)
+
+
 @router.get("/tasks/{task_id}")
 def task_status(task_id: int, db: Session = Depends(get_db)):
-    t = db.query(Task).get(task_id)
+    t = task_snapshot(db, task_id)
     if not t:
         raise HTTPException(status_code=404, detail="任务不存在")
-    return {"id": t.id, "status": t.status, "message": t.message, "episode_id": t.episode_id}
\ No newline at end of file
+    return t
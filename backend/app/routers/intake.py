@@ -1,27 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException
-import os
-from pydantic import BaseModel, AnyUrl
+from pydantic import BaseModel, AnyUrl, Field
 from sqlalchemy.orm import Session
-from ..database import SessionLocal
+from ..database import get_db
 from ..models import Task
 from ..auth import get_current_user
-from ..tasks import fetch_video_meta
+from ..services.progress import init_task
+from ..services.scheduling import PRIORITY_INTERACTIVE
+from ..services.shards import COLLECTION_PATTERN, DEFAULT_COLLECTION
 
 
 router = APIRouter(prefix="/intake", tags=["intake"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class SubmitURLReq(BaseModel):
-    """提交视频URL进行摄入。"""
+    """提交视频URL进行摄入，collection 为写入的知识库（如创作者名）。"""
     url: AnyUrl
+    collection: str = Field(DEFAULT_COLLECTION, pattern=COLLECTION_PATTERN)
+
+
+class BulkSubmitReq(BaseModel):
+    """批量提交视频/播放列表/频道URL。"""
+    urls: list[AnyUrl] = Field(min_length=1, max_length=5000)
+    collection: str = Field(DEFAULT_COLLECTION, pattern=COLLECTION_PATTERN)
 
 
 @router.post("/submit_url")
@@ -34,18 +34,41 @@ def submit_url(req: SubmitURLReq, db: Session = Depends(get_db), user=Depends(ge
     db.add(task)
     db.commit()
     db.refresh(task)
+    init_task(task)
+
+    # 入队下载任务（RUN_INLINE_TASKS 为真时 Celery 以 eager 模式内联执行）；单条提交为交互式优先级，不排在批量回填之后
+    # 任务模块依赖 Celery，按需导入以保持 API 冷启动轻量
+    from ..tasks import fetch_video_meta
+    try:
+        fetch_video_meta.apply_async(
+            kwargs={"task_id": task.id, "source_url": str(req.url), "collection": req.collection}, priority=PRIORITY_INTERACTIVE,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"任务入队失败: {e}")
+
+    return {"task_id": task.id}
+
+
+@router.post("/bulk")
+def submit_bulk(req: BulkSubmitReq, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """
+    批量摄入：接收链接列表（支持播放列表/频道），创建一个汇总任务。
+    链接展开、去重与子任务创建在worker中完成；通过 /tasks/{task_id} 查询汇总进度。
+    子任务以回填优先级执行，并按提交者的公平份额放行，不阻塞其他用户与交互式提交。
+    """
+    task = Task(type="intake_bulk", status="pending", message=f"已接收 {len(req.urls)} 个链接，等待展开")
+    db.add(task)
+    db.commit()
+    db.refresh(task)
+    init_task(task)
+
+    from ..tasks import expand_bulk_intake
+    try:
+        expand_bulk_intake.apply_async(
+            kwargs={"parent_task_id": task.id, "urls": [str(u) for u in req.urls], "collection": req.collection, "user": user.username},
+            priority=PRIORITY_INTERACTIVE,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"任务入队失败: {e}")
 
-    # 入队下载任务
-    run_inline = os.getenv("RUN_INLINE_TASKS", "0").lower() in {"1", "true", "yes"}
-    if run_inline:
-        try:
-            fetch_video_meta(task_id=task.id, source_url=str(req.url))
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"任务执行失败: {e}")
-    else:
-        try:
-            fetch_video_meta.delay(task_id=task.id, source_url=str(req.url))
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"任务入队失败: {e}")
-
-    return {"task_id": task.id}
\ No newline at end of file
+    return {"task_id": task.id}
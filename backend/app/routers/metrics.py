@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..services.metrics import render_prometheus
+from ..services.scheduling import record_queue_depths
+
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus 抓取端点：导出 API 与 worker 写入 Redis 的全部指标。
+    抓取时采样各队列、各优先级的积压数量。
+    """
+    record_queue_depths()
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -1,70 +1,131 @@
+import threading
+import numpy as np
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from ..database import SessionLocal
-from ..models import Chunk
-from ..schemas import QueryRequest, QueryResponse, RetrievedChunk
-from ..services.embedder import Embedder, FaissIndexManager
+from ..database import get_db
+from ..models import QA, Chunk
+from ..schemas import QAMatch, QueryRequest, QueryResponse, RetrievedChunk
+from ..services.embedder import Embedder
+from ..services.shards import ShardedIndex
+from ..services import metrics, qa
+from ..services.rerank import QUERY_OVERFETCH, best_snippet, mmr
 
 
 router = APIRouter(prefix="/query", tags=["query"])
 
 
-def get_db():
-    """
-    FastAPI 依赖项：获取数据库会话。
+QUERY_METRIC = "cognito_query_duration_seconds"
 
-    返回:
-        SQLAlchemy Session 对象。
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 按模型名缓存嵌入器：模型只在首次查询时加载，索引切换到新模型后按需加载新模型
+_embedders: dict[str, Embedder] = {}
+_embedders_lock = threading.Lock()
+_loading: dict[str, threading.Lock] = {}
+
+
+def _embedder(model: str | None) -> Embedder:
+    key = model or ""
+    with _embedders_lock:
+        if key in _embedders:
+            return _embedders[key]
+        loading = _loading.setdefault(key, threading.Lock())
+    # 同一模型只由一个线程加载（并发的首批查询等待同一次加载），其他模型不受影响
+    with loading:
+        with _embedders_lock:
+            if key in _embedders:
+                return _embedders[key]
+        embedder = Embedder(model=model)
+        with _embedders_lock:
+            _embedders[key] = embedder
+        return embedder
 
 
 @router.post("", response_model=QueryResponse)
 def query(req: QueryRequest, db: Session = Depends(get_db)):
     """
     RAG 查询接口：使用嵌入与FAISS索引召回相关块。
+    先在知识库的问答索引中匹配问题（见 services/qa.py），相似度不低于 QA_MATCH_THRESHOLD 时直接返回已存储的答案。
+    未命中时召回 top_k × QUERY_OVERFETCH 个候选，再用候选块已存储的向量做 MMR 多样性重排，
+    并为每个块抽取与问题最匹配的句子窗口作为摘录。
+    只检索请求所指知识库的索引（首次查询时加载并常驻内存，见 services/index_cache.py）。
+    索引分片时并发检索各分片（本地或分片服务）并按分数合并，超时的分片被跳过。
+    各阶段耗时（model_load / embed / qa_match / search / hydrate / rerank / total）写入 cognito_query_duration_seconds。
 
     参数:
-        req: 查询请求，包含问题与返回数量。
+        req: 查询请求，包含问题、返回数量与知识库。
         db: 数据库会话。
 
     返回:
         QueryResponse，包含简要答案与相关块。
     """
-    embedder = Embedder()
-    index = FaissIndexManager()
-    # 先生成查询向量，再按其维度加载索引，避免硬编码维度不匹配
-    vec = embedder.embed_texts([req.question])
-    try:
-        index.load(dim=vec.shape[1])
-    except Exception:
-        # 索引尚未构建时，load会新建空索引；此处容错即可
-        pass
-    results = []
-    if index.index is not None:
-        results = index.search(vec, top_k=req.top_k)
+    with metrics.timed(QUERY_METRIC, phase="total"):
+        index = ShardedIndex(collection=req.collection)
+        # 按索引清单加载与索引一致的模型：重嵌入迁移期间旧索引及其模型继续服务，切换后自动改用新模型
+        with metrics.timed(QUERY_METRIC, phase="model_load"):
+            embedder = _embedder(index.model)
+        # 先生成查询向量，各分片按其维度加载索引，避免硬编码维度不匹配
+        with metrics.timed(QUERY_METRIC, phase="embed", model=embedder.model_name):
+            vec = embedder.embed_texts([req.question])
+        with metrics.timed(QUERY_METRIC, phase="qa_match"):
+            hit = qa.match(req.collection, vec, embedder.model_name)
+            stored = db.get(QA, hit[0]) if hit else None
+        if stored is not None:
+            metrics.inc("cognito_qa_hits_total", source=stored.source or "manual")
+            cited = []
+            if stored.chunk_id:
+                c = db.get(Chunk, stored.chunk_id)
+                if c is not None:
+                    cited.append(RetrievedChunk(
+                        id=c.id, episode_id=c.episode_id, text=c.text, start_time=c.start_time, end_time=c.end_time,
+                        score=hit[1], snippet=stored.answer,
+                    ))
+            return QueryResponse(
+                answer=stored.answer, chunks=cited,
+                qa=QAMatch(id=stored.id, episode_id=stored.episode_id, question=stored.question, score=hit[1]),
+            )
+        metrics.inc("cognito_qa_misses_total")
+        # 索引尚未构建、模型或维度不一致的分片不返回结果；全部为空时回退到LIKE
+        with metrics.timed(QUERY_METRIC, phase="search", shards=index.shards):
+            results, _ = index.search(vec, top_k=req.top_k * QUERY_OVERFETCH, model=embedder.model_name)
 
-    chunks: list[RetrievedChunk] = []
-    if results:
-        ids = [cid for cid, _ in results]
-        stmt = select(Chunk).where(Chunk.id.in_(ids))
-        rows = db.execute(stmt).scalars().all()
-        id_to_chunk = {c.id: c for c in rows}
-        for cid, score in results:
-            c = id_to_chunk.get(cid)
-            if c:
-                chunks.append(RetrievedChunk(id=c.id, episode_id=c.episode_id, text=c.text, start_time=c.start_time, end_time=c.end_time))
+        chunks: list[RetrievedChunk] = []
+        if results:
+            with metrics.timed(QUERY_METRIC, phase="hydrate"):
+                ids = [cid for cid, _ in results]
+                stmt = select(Chunk).where(Chunk.id.in_(ids))
+                rows = db.execute(stmt).scalars().all()
+            id_to_chunk = {c.id: c for c in rows}
+            candidates = [(id_to_chunk[cid], score) for cid, score in results if cid in id_to_chunk]
+            with metrics.timed(QUERY_METRIC, phase="rerank"):
+                # 候选向量随块一起回表读取，无需额外查询或重新嵌入
+                # 迁移期间块向量可能已是新模型，与查询向量不在同一空间时不做 MMR
+                same_space = all(c.embedding is not None and c.embed_model in (None, embedder.model_name) for c, _ in candidates)
+                if candidates and same_space:
+                    matrix = np.vstack([np.frombuffer(c.embedding, dtype="float32") for c, _ in candidates])
+                    candidates = [candidates[i] for i in mmr(vec[0], matrix, req.top_k)]
+                else:
+                    candidates = candidates[:req.top_k]
+                for c, score in candidates:
+                    chunks.append(RetrievedChunk(
+                        id=c.id, episode_id=c.episode_id, text=c.text, start_time=c.start_time, end_time=c.end_time,
+                        score=score, snippet=best_snippet(c.text, req.question),
+                    ))
 
-    if not chunks:
-        # 回退到LIKE检索
-        stmt = select(Chunk).where(Chunk.text.like(f"%{req.question}%")).limit(req.top_k)
-        rows = db.execute(stmt).scalars().all()
-        chunks = [RetrievedChunk(id=c.id, episode_id=c.episode_id, text=c.text, start_time=c.start_time, end_time=c.end_time) for c in rows]
+        if not chunks:
+            # 回退到LIKE检索
+            metrics.inc("cognito_query_fallback_total")
+            with metrics.timed(QUERY_METRIC, phase="like_fallback"):
+                stmt = (
+                    select(Chunk)
+                    .where(Chunk.collection == req.collection, Chunk.text.like(f"%{req.question}%"))
+                    .limit(req.top_k)
+                )
+                rows = db.execute(stmt).scalars().all()
+            chunks = [
+                RetrievedChunk(id=c.id, episode_id=c.episode_id, text=c.text, start_time=c.start_time, end_time=c.end_time,
+                               snippet=best_snippet(c.text, req.question))
+                for c in rows
+            ]
 
-    answer = "以下为相关知识点摘录：\n" + ("\n---\n".join(c.text[:300] for c in chunks) if chunks else "暂无相关内容")
+    answer = "以下为相关知识点摘录：\n" + ("\n---\n".join(c.snippet or c.text[:300] for c in chunks) if chunks else "暂无相关内容")
     return QueryResponse(answer=answer, chunks=chunks)
\ No newline at end of file
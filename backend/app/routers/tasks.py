@@ -1,23 +1,124 @@
+import asyncio
+import json
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from ..database import SessionLocal
+from ..database import SessionLocal, get_db
 from ..models import Task
+from ..auth import get_current_user
+from ..services.scheduling import PRIORITY_INTERACTIVE
+from ..redis_client import get_async_redis
+from ..services.progress import TERMINAL_STATUSES, channel, init_task, task_snapshot
 
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
+SSE_HEARTBEAT_SECONDS = 15
 
-def get_db():
+
+@router.get("/{task_id}")
+def task_status(task_id: int, db: Session = Depends(get_db)):
+    t = task_snapshot(db, task_id)
+    if not t:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return t
+
+
+@router.post("/{task_id}/resume")
+def resume_task(task_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """
+    从检查点恢复失败的处理任务：跳过已完成的阶段（下载、ASR、分块等），只重跑之后的阶段。
+    需要鉴权。任务尚未创建节目（下载阶段失败）时需重新提交链接。
+    """
+    t = db.query(Task).get(task_id)
+    if not t:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if t.episode_id is None:
+        raise HTTPException(status_code=409, detail="任务尚未创建节目，无检查点可恢复，请重新提交")
+    snapshot = task_snapshot(db, task_id) or {}
+    if snapshot.get("status") not in {"failed", "completed", "succeeded"}:
+        raise HTTPException(status_code=409, detail="任务仍在进行中")
+    t.status, t.message = "pending", "从检查点恢复"
+    db.add(t)
+    db.commit()
+    init_task(t)
+    # 任务模块依赖 Celery，按需导入以保持 API 冷启动轻量
+    from ..tasks import resume_pipeline
+    try:
+        stage = resume_pipeline(db, t.id, t.episode_id, priority=PRIORITY_INTERACTIVE)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if stage is None:
+        t.status, t.message = "completed", "节目已处理完成，无需恢复"
+        db.add(t)
+        db.commit()
+        init_task(t)
+    return {"task_id": t.id, "resume_from": stage}
+
+
+def _sse(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _load_snapshot(task_id: int):
     db = SessionLocal()
     try:
-        yield db
+        return task_snapshot(db, task_id)
     finally:
         db.close()
 
 
-@router.get("/{task_id}")
-def task_status(task_id: int, db: Session = Depends(get_db)):
-    t = db.query(Task).get(task_id)
-    if not t:
+async def _close(pubsub) -> None:
+    await pubsub.unsubscribe()
+    await pubsub.reset()
+
+
+@router.get("/{task_id}/events")
+async def task_events(task_id: int):
+    """
+    以 SSE 推送任务进度：先发送当前状态，随后转发 Redis pub/sub 事件，任务结束后关闭连接。
+    批量任务额外推送子任务结束事件（字段 child_id），全部子任务结束后关闭。
+    先订阅再读取当前状态，两者之间发布的终态事件不会丢失。
+    """
+    pubsub = get_async_redis().pubsub()
+    await pubsub.subscribe(channel(task_id))
+    try:
+        # 读取订阅确认：服务端确认后发布的事件都会进入本连接的缓冲
+        await pubsub.get_message(timeout=SSE_HEARTBEAT_SECONDS)
+        snapshot = await run_in_threadpool(_load_snapshot, task_id)
+    except BaseException:
+        await _close(pubsub)
+        raise
+    if not snapshot:
+        await _close(pubsub)
         raise HTTPException(status_code=404, detail="任务不存在")
-    return {"id": t.id, "status": t.status, "message": t.message, "episode_id": t.episode_id}
\ No newline at end of file
+
+    async def stream():
+        try:
+            yield _sse(snapshot)
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+            while True:
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_HEARTBEAT_SECONDS)
+                if msg is None:
+                    # 心跳注释，防止代理断开空闲连接
+                    yield ": ping\n\n"
+                    continue
+                event = json.loads(msg["data"])
+                yield _sse(event)
+                if "child_id" not in event:
+                    if event.get("status") in TERMINAL_STATUSES:
+                        return
+                    continue
+                # 子任务结束：快照按聚合进度判断批量任务是否已全部完成（done == total 时为 completed）
+                current = await run_in_threadpool(_load_snapshot, task_id)
+                if current and current["status"] in TERMINAL_STATUSES:
+                    yield _sse(current)
+                    return
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await _close(pubsub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
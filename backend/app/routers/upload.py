@@ -1,61 +1,199 @@
+import hashlib
 import os
-import aiofiles
-from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from ..database import SessionLocal, engine
-from ..models import Episode
-from ..schemas import UploadResponse, EpisodeOut
+from ..database import get_db
+from ..models import Episode, Task
+from ..schemas import UploadResponse, EpisodeOut, UploadSessionReq, UploadSessionOut
+from ..services.media_cache import store_file
+from ..services.uploads import (
+    ALLOWED_EXTS, UPLOAD_CHUNK_BYTES, UPLOAD_MAX_BYTES, UploadTooLarge, UploadBusy, UploadFormError,
+    stream_to_file, stream_multipart_to_file, new_tmp_path, hash_file,
+    create_session, load_session, save_session, session_part_path, session_offset, drop_session, session_lock,
+)
+from ..services.progress import init_task
+from ..services.scheduling import PRIORITY_INTERACTIVE
+from ..services.shards import COLLECTION_PATTERN, DEFAULT_COLLECTION
 
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
 
-def get_db():
+def _check_ext(filename: str | None) -> None:
+    _, ext = os.path.splitext(filename or "")
+    if ext.lower() not in ALLOWED_EXTS:
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+
+
+def _discard(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _finalize_upload(db: Session, tmp_path: str, filename: str, sha256: str, collection: str = DEFAULT_COLLECTION) -> UploadResponse:
     """
-    FastAPI 依赖项：获取数据库会话。
+    将已落盘的上传文件移入内容寻址存储，创建节目并自动入队转写。
+    相同内容的文件已上传到同一知识库时直接返回已有节目，不重复转写。
+    包含数据库与文件系统的阻塞操作，异步端点须通过 run_in_threadpool 调用。
+    """
+    source_key = f"upload:{sha256}"
+    existing = db.query(Episode).filter(Episode.source_key == source_key, Episode.collection == collection).first()
+    if existing is not None:
+        os.remove(tmp_path)
+        return UploadResponse(episode=EpisodeOut.model_validate(existing), message="相同内容的文件已上传，复用已有节目。", sha256=sha256)
+
+    art = store_file(db, tmp_path, source_key, "audio", sha256=sha256)
+    episode = Episode(title=filename, file_path=art.path, status="uploaded", source_key=source_key, collection=collection)
+    db.add(episode)
+    db.commit()
+    db.refresh(episode)
+
+    task = Task(episode_id=episode.id, type="upload_transcribe", status="pending", message="已上传，等待转写")
+    db.add(task)
+    db.commit()
+    db.refresh(task)
+    init_task(task)
+    # 任务模块依赖 Celery，按需导入以保持 API 冷启动轻量
+    from ..tasks import start_transcription_pipeline
+    start_transcription_pipeline(task.id, episode.id, art.path, priority=PRIORITY_INTERACTIVE)
+
+    message = "文件已上传，转写与知识提取任务已入队。"
+    return UploadResponse(episode=EpisodeOut.model_validate(episode), message=message, task_id=task.id, sha256=sha256)
+
+
+# 请求体不再由 FastAPI 解析（见 upload_audio），在 OpenAPI 中手动声明 multipart 文件字段
+_AUDIO_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object", "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+# multipart 边界与字段头的余量：Content-Length 超过上限加余量时不读请求体直接拒绝
+_FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+@router.post("/audio", response_model=UploadResponse, openapi_extra=_AUDIO_FORM)
+async def upload_audio(
+    request: Request,
+    collection: str = Query(DEFAULT_COLLECTION, pattern=COLLECTION_PATTERN),
+    db: Session = Depends(get_db),
+):
+    """
+    接收并保存音频文件，创建节目记录并自动入队转写。
+    直接解析请求体的 multipart 流，文件字段按块写盘并同步计算哈希（不经临时文件二次复制）；
+    超过 UPLOAD_MAX_BYTES 时立即中止并返回 413（声明的 Content-Length 已超限时不读取请求体）。
+    入库与入队在线程池中执行，不阻塞事件循环。
+
+    参数:
+        request: 请求（multipart/form-data，字段 file，支持 mp3/mp4/wav/m4a）。
+        collection: 节目所属知识库。
+        db: 数据库会话。
 
     返回:
-        SQLAlchemy Session 对象。
+        上传响应，其中包含新建的节目元数据、转写任务ID与提示信息。
     """
-    db = SessionLocal()
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES + _FORM_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件超过大小上限 {UPLOAD_MAX_BYTES} 字节")
+    tmp_path = new_tmp_path(".upload")
+    hasher = hashlib.sha256()
     try:
-        yield db
+        filename, _ = await stream_multipart_to_file(
+            request.stream(), request.headers.get("content-type", ""), tmp_path, hasher=hasher, on_filename=_check_ext,
+        )
+        # 对象存储按扩展名区分格式，临时文件补上扩展名
+        _, ext = os.path.splitext(filename)
+        named = tmp_path + ext.lower()
+        os.replace(tmp_path, named)
+        tmp_path = named
+        return await run_in_threadpool(_finalize_upload, db, tmp_path, filename, hasher.hexdigest(), collection)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"文件超过大小上限 {UPLOAD_MAX_BYTES} 字节")
+    except UploadFormError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     finally:
-        db.close()
+        # 成功时临时文件已移入对象目录或被删除；超限、客户端断开、入库失败等情况在此清理
+        _discard(tmp_path)
 
 
-@router.post("/audio", response_model=UploadResponse)
-async def upload_audio(file: UploadFile = File(...), db: Session = Depends(get_db)):
+@router.post("/sessions", response_model=UploadSessionOut)
+def create_upload_session(req: UploadSessionReq):
+    """
+    创建断点续传会话。客户端随后按偏移量分段 PUT 数据，最后调用 complete。
     """
-    接收并保存音频文件，创建节目记录。
+    _check_ext(req.filename)
+    if req.size is not None and req.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件超过大小上限 {UPLOAD_MAX_BYTES} 字节")
+    session = create_session(req.filename, req.size, req.collection)
+    return UploadSessionOut(upload_id=session["upload_id"], offset=0, chunk_size=UPLOAD_CHUNK_BYTES, max_size=UPLOAD_MAX_BYTES)
 
-    参数:
-        file: 上传的音频文件（mp3/mp4/wav/m4a均可）。
-        db: 数据库会话。
 
-    返回:
-        上传响应，其中包含新建的节目元数据与提示信息。
+@router.get("/sessions/{upload_id}", response_model=UploadSessionOut)
+def get_upload_session(upload_id: str):
     """
-    allowed_ext = {".mp3", ".mp4", ".wav", ".m4a"}
-    _, ext = os.path.splitext(file.filename)
-    if ext.lower() not in allowed_ext:
-        raise HTTPException(status_code=400, detail="不支持的文件类型")
+    查询会话已接收的字节数，断线后从该偏移量继续上传。
+    """
+    if load_session(upload_id) is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return UploadSessionOut(upload_id=upload_id, offset=session_offset(upload_id), chunk_size=UPLOAD_CHUNK_BYTES, max_size=UPLOAD_MAX_BYTES)
 
-    os.makedirs("data/audio", exist_ok=True)
-    ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
-    safe_name = file.filename.replace(" ", "_")
-    save_path = os.path.join("data/audio", f"{ts}-{safe_name}")
 
-    async with aiofiles.open(save_path, "wb") as out:
-        content = await file.read()
-        await out.write(content)
+@router.put("/sessions/{upload_id}", response_model=UploadSessionOut)
+async def put_upload_part(upload_id: str, offset: int, request: Request):
+    """
+    追加一段数据（请求体为原始字节，流式写盘）。offset 必须等于当前已接收字节数，否则返回 409 与当前偏移量。
+    偏移量校验与写入在会话锁内完成；同一会话已有分段在写入时返回 409，客户端查询偏移量后重试。
+    """
+    if load_session(upload_id) is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    try:
+        with session_lock(upload_id):
+            # 加锁后重新读取：等待期间会话可能已完成或被删除，偏移量也可能已被其它请求推进
+            session = load_session(upload_id)
+            if session is None:
+                raise HTTPException(status_code=404, detail="上传会话不存在")
+            current = session_offset(upload_id)
+            if offset != current:
+                raise HTTPException(status_code=409, detail={"message": "偏移量不匹配", "offset": current})
+            try:
+                total = await stream_to_file(request.stream(), session_part_path(upload_id), start=current)
+            except UploadTooLarge:
+                drop_session(upload_id)
+                raise HTTPException(status_code=413, detail=f"文件超过大小上限 {UPLOAD_MAX_BYTES} 字节")
+            save_session(session)
+    except UploadBusy:
+        raise HTTPException(status_code=409, detail={"message": "该会话正在写入其它分段", "offset": session_offset(upload_id)})
+    return UploadSessionOut(upload_id=upload_id, offset=total, chunk_size=UPLOAD_CHUNK_BYTES, max_size=UPLOAD_MAX_BYTES)
 
-    episode = Episode(title=file.filename, file_path=save_path, status="uploaded")
-    db.add(episode)
-    db.commit()
-    db.refresh(episode)
 
-    # 这里后续接入 ASR + 总结流水线（异步任务队列更佳）
-    message = "文件已上传。稍后将进行转写与知识提取。"
-    return UploadResponse(episode=EpisodeOut.model_validate(episode), message=message)
\ No newline at end of file
+@router.post("/sessions/{upload_id}/complete", response_model=UploadResponse)
+def complete_upload_session(upload_id: str, db: Session = Depends(get_db)):
+    """
+    完成断点续传：校验大小、计算哈希去重，创建节目并自动入队转写。
+    同步端点（由 FastAPI 在线程池中执行），整文件哈希与入库不占用事件循环；
+    仅取出数据文件时持有会话锁，哈希计算在锁外进行。
+    """
+    try:
+        with session_lock(upload_id):
+            session = load_session(upload_id)
+            if session is None:
+                raise HTTPException(status_code=404, detail="上传会话不存在")
+            size = session_offset(upload_id)
+            if session.get("total_size") is not None and size != session["total_size"]:
+                raise HTTPException(status_code=409, detail={"message": "文件尚未上传完整", "offset": size})
+            if size == 0:
+                raise HTTPException(status_code=400, detail="上传内容为空")
+            _, ext = os.path.splitext(session["filename"])
+            final_tmp = new_tmp_path(ext.lower())
+            os.replace(session_part_path(upload_id), final_tmp)
+            drop_session(upload_id)
+    except UploadBusy:
+        raise HTTPException(status_code=409, detail={"message": "该会话正在写入其它分段", "offset": session_offset(upload_id)})
+    try:
+        return _finalize_upload(db, final_tmp, session["filename"], hash_file(final_tmp), session.get("collection", DEFAULT_COLLECTION))
+    finally:
+        _discard(final_tmp)
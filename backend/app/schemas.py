@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
+from .services.shards import COLLECTION_PATTERN, DEFAULT_COLLECTION
 
 
 class EpisodeOut(BaseModel):
@@ -11,11 +12,13 @@ class EpisodeOut(BaseModel):
         title: 标题。
         file_path: 文件路径。
         status: 处理状态。
+        collection: 所属知识库。
     """
     id: int
     title: str
     file_path: str
     status: str
+    collection: str = DEFAULT_COLLECTION
 
     class Config:
         from_attributes = True
@@ -28,9 +31,43 @@ class UploadResponse(BaseModel):
     字段:
         episode: 节目基本信息。
         message: 结果说明。
+        task_id: 自动入队的转写任务ID（内容重复时为空）。
+        sha256: 文件内容哈希。
     """
     episode: EpisodeOut
     message: str
+    task_id: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+class UploadSessionReq(BaseModel):
+    """
+    创建断点续传会话的请求模型。
+
+    字段:
+        filename: 原始文件名。
+        size: 文件总字节数（可选，完成时校验）。
+        collection: 节目所属知识库，默认 default。
+    """
+    filename: str
+    size: Optional[int] = None
+    collection: str = Field(DEFAULT_COLLECTION, pattern=COLLECTION_PATTERN)
+
+
+class UploadSessionOut(BaseModel):
+    """
+    断点续传会话状态。
+
+    字段:
+        upload_id: 会话ID。
+        offset: 已接收字节数，下一段从此偏移量开始。
+        chunk_size: 建议的分段大小。
+        max_size: 允许的最大文件大小。
+    """
+    upload_id: str
+    offset: int
+    chunk_size: int
+    max_size: int
 
 
 class QueryRequest(BaseModel):
@@ -40,9 +77,11 @@ class QueryRequest(BaseModel):
     字段:
         question: 用户查询问题。
         top_k: 返回的相关块数量，默认3。
+        collection: 检索的知识库，默认 default；只加载与检索该知识库的索引。
     """
     question: str
     top_k: int = 3
+    collection: str = Field(DEFAULT_COLLECTION, pattern=COLLECTION_PATTERN)
 
 
 class RetrievedChunk(BaseModel):
@@ -55,12 +94,32 @@ class RetrievedChunk(BaseModel):
         text: 文本内容。
         start_time: 起始时间。
         end_time: 结束时间。
+        score: 向量检索相似度（LIKE 回退时为空）。
+        snippet: 块内与问题最匹配的句子窗口。
     """
     id: int
     episode_id: int
     text: str
     start_time: Optional[float] = None
     end_time: Optional[float] = None
+    score: Optional[float] = None
+    snippet: Optional[str] = None
+
+
+class QAMatch(BaseModel):
+    """
+    命中的常见问答。
+
+    字段:
+        id: 问答ID。
+        episode_id: 所属节目ID。
+        question: 已存储的问题。
+        score: 查询与该问题的相似度。
+    """
+    id: int
+    episode_id: int
+    question: str
+    score: float
 
 
 class QueryResponse(BaseModel):
@@ -68,8 +127,10 @@ class QueryResponse(BaseModel):
     查询响应模型。
 
     字段:
-        answer: 生成的答案（当前为占位规则生成）。
+        answer: 生成的答案（当前为占位规则生成；命中常见问答时为已存储的答案）。
         chunks: 参与生成的相关知识块列表。
+        qa: 命中的常见问答（未命中时为空）。
     """
     answer: str
-    chunks: List[RetrievedChunk]
\ No newline at end of file
+    chunks: List[RetrievedChunk]
+    qa: Optional[QAMatch] = None
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+大负载的带外存储：转录文本等大字符串不经 Celery broker 传递，只传引用。
+
+- put: 超过 BLOB_INLINE_MAX_BYTES 的文本压缩后写入本地目录（BLOB_DIR，多机部署需与 MEDIA_DIR 一样共享）
+  或 Redis（BLOB_BACKEND=redis，键带 TTL），返回 {"blob": <键>} 引用；小文本原样返回，不额外读写。
+- get: 解析引用（普通字符串原样返回），兼容升级前已在队列中的旧消息。
+- purge_expired: 本地目录按修改时间清理超过 BLOB_TTL_SECONDS 的文件（由 celery beat 周期触发）。
+
+压缩优先使用 zstd（需安装 zstandard），未安装时回退到标准库 zlib；数据首字节记录编码，读取时自动识别。
+键为内容 SHA-256，相同文本只存一份；因此消费后不立即删除（可能被其他消息引用），统一按 TTL 过期。
+阶段重试与消息重投都在 TTL 内完成，过期后的恢复走检查点（见 checkpoint.py），不依赖负载。
+"""
+import hashlib
+import os
+import tempfile
+import time
+import zlib
+from typing import Union
+from . import metrics
+
+
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "file")
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join("data", "blobs"))
+BLOB_TTL_SECONDS = int(os.getenv("BLOB_TTL_SECONDS", str(24 * 3600)))
+BLOB_INLINE_MAX_BYTES = int(os.getenv("BLOB_INLINE_MAX_BYTES", "8192"))
+
+try:
+    import zstandard as _zstd
+except ImportError:  # 可选依赖
+    _zstd = None
+
+_ZSTD, _ZLIB = b"Z", b"z"
+
+BlobRef = Union[str, dict]
+
+
+def _compress(raw: bytes) -> bytes:
+    if _zstd is not None:
+        return _ZSTD + _zstd.ZstdCompressor(level=3).compress(raw)
+    return _ZLIB + zlib.compress(raw, 6)
+
+
+def _decompress(data: bytes) -> bytes:
+    codec, body = data[:1], data[1:]
+    if codec == _ZSTD:
+        if _zstd is None:
+            raise RuntimeError("负载为 zstd 压缩，但当前环境未安装 zstandard")
+        return _zstd.ZstdDecompressor().decompress(body)
+    if codec == _ZLIB:
+        return zlib.decompress(body)
+    raise ValueError("未知的负载编码")
+
+
+def _path(key: str) -> str:
+    return os.path.join(BLOB_DIR, key[:2], f"{key}.bin")
+
+
+def _redis_key(key: str) -> str:
+    return f"blob:{key}"
+
+
+def is_ref(value) -> bool:
+    return isinstance(value, dict) and "blob" in value
+
+
+def put(text: str) -> BlobRef:
+    """
+    存储文本并返回可经 broker 传递的引用。
+
+    参数:
+        text: 待存储文本。
+    返回值:
+        小文本原样返回；否则返回 {"blob": 键}。
+    """
+    raw = text.encode("utf-8")
+    if len(raw) <= BLOB_INLINE_MAX_BYTES:
+        return text
+    key = hashlib.sha256(raw).hexdigest()
+    data = _compress(raw)
+    if BLOB_BACKEND == "redis":
+        from ..redis_client import get_redis
+        get_redis().set(_redis_key(key), data, ex=BLOB_TTL_SECONDS)
+    else:
+        path = _path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，读取方不会看到半个文件
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    metrics.inc("cognito_blob_put_total", backend=BLOB_BACKEND)
+    metrics.inc("cognito_blob_bytes_total", len(raw), backend=BLOB_BACKEND, kind="raw")
+    metrics.inc("cognito_blob_bytes_total", len(data), backend=BLOB_BACKEND, kind="stored")
+    return {"blob": key}
+
+
+def get(ref: BlobRef) -> str:
+    """
+    解析引用得到文本。
+
+    参数:
+        ref: put 的返回值（或旧消息中的原始文本）。
+    返回值:
+        文本内容。
+    异常:
+        FileNotFoundError: 负载已过期或被删除。
+    """
+    if not is_ref(ref):
+        return ref
+    key = ref["blob"]
+    if BLOB_BACKEND == "redis":
+        from ..redis_client import get_redis
+        data = get_redis().get(_redis_key(key))
+        if data is None:
+            raise FileNotFoundError(f"负载已过期: {key}")
+    else:
+        with open(_path(key), "rb") as f:
+            data = f.read()
+    return _decompress(data).decode("utf-8")
+
+
+def purge_expired(ttl: int = BLOB_TTL_SECONDS) -> int:
+    """
+    清理本地目录中超过 TTL 的负载（Redis 键自带过期，无需清理）。
+
+    返回值:
+        删除的文件数量。
+    """
+    if BLOB_BACKEND == "redis" or not os.path.isdir(BLOB_DIR):
+        return 0
+    cutoff = time.time() - ttl
+    removed = 0
+    for root, _, files in os.walk(BLOB_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    if removed:
+        metrics.inc("cognito_blob_purged_total", removed)
+    return removed
@@ -0,0 +1,70 @@
+"""
+流水线检查点：按节目持久化各阶段产出，重试时从最后完成的阶段继续，而不是从下载与ASR重新开始。
+
+阶段顺序: transcript（原始转录）→ cleaned（清洗后文本）→ chunks（块ID列表）→ embedded（向量统计）→ indexed。
+向量本身写在 Chunk.embedding 上，embedded 检查点只记录数量与模型。
+检查点与阶段产出在同一事务中写入（调用方提交），因此不会出现“检查点已写而产出丢失”的情况。
+"""
+import json
+from datetime import datetime
+from typing import Any, Optional
+from sqlalchemy.orm import Session
+from ..models import PipelineCheckpoint
+
+
+STAGES = ("transcript", "cleaned", "chunks", "embedded", "indexed")
+
+
+def save(db: Session, episode_id: int, stage: str, payload: Any) -> None:
+    """
+    写入（或覆盖）阶段检查点，不提交。
+
+    参数:
+        db: 数据库会话。
+        episode_id: 节目ID。
+        stage: 阶段名（见 STAGES）。
+        payload: 字符串原样保存，其他值序列化为 JSON。
+    """
+    if stage not in STAGES:
+        raise ValueError(f"未知阶段: {stage}")
+    data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    row = db.query(PipelineCheckpoint).filter_by(episode_id=episode_id, stage=stage).one_or_none()
+    if row is None:
+        row = PipelineCheckpoint(episode_id=episode_id, stage=stage, payload=data)
+    else:
+        row.payload = data
+        row.updated_at = datetime.utcnow()
+    db.add(row)
+
+
+def load(db: Session, episode_id: int, stage: str) -> Optional[str]:
+    """读取阶段检查点的原始内容，不存在时返回 None。"""
+    row = db.query(PipelineCheckpoint.payload).filter_by(episode_id=episode_id, stage=stage).one_or_none()
+    return row[0] if row else None
+
+
+def load_json(db: Session, episode_id: int, stage: str) -> Any:
+    raw = load(db, episode_id, stage)
+    return json.loads(raw) if raw is not None else None
+
+
+def latest(db: Session, episode_id: int) -> Optional[str]:
+    """
+    最后完成的阶段。
+
+    返回值:
+        阶段名；节目尚无任何检查点时返回 None。
+    """
+    done = {s for (s,) in db.query(PipelineCheckpoint.stage).filter_by(episode_id=episode_id).all()}
+    for stage in reversed(STAGES):
+        if stage in done:
+            return stage
+    return None
+
+
+def clear(db: Session, episode_id: int, from_stage: str) -> None:
+    """删除 from_stage 及之后阶段的检查点（例如重新提交转录文本时），不提交。"""
+    stages = STAGES[STAGES.index(from_stage):]
+    db.query(PipelineCheckpoint).filter(
+        PipelineCheckpoint.episode_id == episode_id, PipelineCheckpoint.stage.in_(stages)
+    ).delete(synchronize_session=False)
@@ -0,0 +1,76 @@
+"""
+索引向量压缩：降维投影与标量量化。
+
+嵌入模型输出 float32 向量（768 维约 3 KB，e5-large 1024 维 4 KB），Flat 索引按原宽度常驻内存。
+通过 FAISS_INDEX_FACTORY 选择压缩后的索引类型（新建索引代时生效，修改后执行 rebuild_index）:
+
+    SQfp16          半精度，2x，召回几乎无损，无需训练
+    SQ8             每维 int8（按维度学习取值范围），4x
+    PCA256,SQfp16   PCA 投影到 256 维后半精度，768 维模型约 6x
+    PCA256,SQ8      PCA 投影到 256 维后 int8，768 维模型约 12x
+    PCA256,HNSW32   投影后建图索引（HNSW 的邻接表另占内存）
+
+投影矩阵与量化参数从数据库中该模型向量的抽样（FAISS_TRAIN_SAMPLE）学习，随 faiss.index 一起保存，
+查询向量在索引内部经同一投影后检索，调用方无需改动。数据库中的块向量保持原宽度，
+作为 MMR 重排、摘要与重建时重新训练的来源。召回损失用 scripts/bench.py 按 Flat 结果评估（recall@k）。
+"""
+import os
+from typing import Optional
+import numpy as np
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models import Chunk
+from .embedder import FaissIndexManager
+
+
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "65536"))
+# 训练样本少于该数量时投影与量化参数不可靠，记录告警，语料增长后应执行 rebuild_index 重新训练
+FAISS_TRAIN_MIN = int(os.getenv("FAISS_TRAIN_MIN", "2048"))
+
+
+def sample_vectors(db: Session, model: Optional[str], limit: int = FAISS_TRAIN_SAMPLE) -> np.ndarray:
+    """
+    按主键等间隔抽取该模型的已存储向量（覆盖全部时间段，而不只是最早或最近的节目）。
+
+    参数:
+        db: 数据库会话。
+        model: 嵌入模型名；为空时取未记录模型的旧向量。
+        limit: 最多抽取的数量。
+    返回值:
+        向量矩阵 (n, d)，没有向量时 n 为 0。
+    """
+    cond = [Chunk.embedding.isnot(None), Chunk.canonical_chunk_id.is_(None)]
+    cond.append(Chunk.embed_model == model if model else Chunk.embed_model.is_(None))
+    total = db.query(func.count(Chunk.id)).filter(*cond).scalar() or 0
+    step = max(1, total // max(1, limit))
+    query = db.query(Chunk.embedding).filter(*cond)
+    if step > 1:
+        query = query.filter(Chunk.id % step == 0)
+    rows = query.order_by(Chunk.id).limit(limit).all()
+    if not rows:
+        return np.zeros((0, 0), dtype="float32")
+    return np.vstack([np.frombuffer(emb, dtype="float32") for (emb,) in rows])
+
+
+def train_from_db(db: Session, manager: FaissIndexManager, batch: np.ndarray) -> int:
+    """
+    用数据库抽样训练尚未训练的索引（投影、量化或聚类参数），抽样不足时并入待写入的一批向量。
+
+    参数:
+        db: 数据库会话。
+        manager: 已 load 且 needs_training 的索引管理器。
+        batch: 本次待写入的向量（维度以其为准）。
+    返回值:
+        训练样本数量。
+    """
+    sample = sample_vectors(db, manager.model)
+    if len(sample) == 0 or sample.shape[1] != batch.shape[1]:
+        sample = batch
+    elif len(sample) < FAISS_TRAIN_SAMPLE:
+        sample = np.vstack([sample, batch])
+    if len(sample) < FAISS_TRAIN_MIN:
+        logger.warning(f"索引 {manager.factory} 仅有 {len(sample)} 条训练样本（建议至少 {FAISS_TRAIN_MIN}），语料增长后请执行 rebuild_index")
+    manager.train(sample)
+    logger.info(f"索引 {manager.factory} 已用 {len(sample)} 条向量训练: {manager.base_dir}")
+    return len(sample)
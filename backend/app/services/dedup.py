@@ -0,0 +1,181 @@
+"""
+入库时的近重复块检测（SimHash + LSH 分段签名）。
+
+重复的片头、口播广告与重新上传会产生大量近似相同的块。分块入库后为每个块计算 64 位 SimHash：
+若在同一知识库的签名索引中找到汉明距离不超过 SIMHASH_MAX_DISTANCE 的规范块，则将本块链接到该规范块（canonical_chunk_id），
+嵌入与索引阶段跳过它；否则本块成为规范块并写入签名索引。
+
+- 指纹：对文本 3-gram 词片（英文按单词、中文按字）取 64 位哈希，按出现次数加权投票得到各位。
+- 签名索引：指纹切为 SIMHASH_BANDS 段，每段一行 (band, value)。距离阈值小于段数时，
+  相近指纹必有一段完全相同（抽屉原理），因此等值查询不会漏召回。
+- 批量：dedupe_chunks 先算出整批指纹，每个知识库用一次 IN 查询取回所有段值命中的候选，
+  批内重复在内存中比对，最后统一 flush 一次。
+"""
+import hashlib
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from ..models import Chunk, ChunkSignature
+from . import metrics
+
+
+SIMHASH_BANDS = 4
+SIMHASH_MAX_DISTANCE = min(int(os.getenv("SIMHASH_MAX_DISTANCE", "3")), SIMHASH_BANDS - 1)
+# 过短的块词片太少，指纹不稳定，不参与去重
+SIMHASH_MIN_CHARS = int(os.getenv("SIMHASH_MIN_CHARS", "80"))
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1").lower() in {"1", "true", "yes"}
+
+_BAND_BITS = 64 // SIMHASH_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_WORD = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]")
+
+
+def _shingles(text: str, n: int = 3) -> Counter:
+    tokens = _WORD.findall(text.lower())
+    if len(tokens) < n:
+        return Counter([" ".join(tokens)]) if tokens else Counter()
+    return Counter(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+def simhash(text: str) -> int:
+    """
+    计算文本的 64 位 SimHash（无符号整数）。
+
+    参数:
+        text: 块文本。
+    返回值:
+        指纹。
+    """
+    shingles = _shingles(text)
+    if not shingles:
+        return 0
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), 8), axis=1)
+    weights = np.fromiter(shingles.values(), dtype=np.float32, count=len(shingles))
+    votes = (bits.astype(np.float32) * 2 - 1).T @ weights
+    fp = 0
+    for bit in votes > 0:
+        fp = (fp << 1) | int(bit)
+    return fp
+
+
+def to_signed(fp: int) -> int:
+    """无符号 64 位指纹转为有符号整数（数据库 BIGINT 存储）。"""
+    return fp - (1 << 64) if fp >= (1 << 63) else fp
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count("1")
+
+
+def bands(fp: int) -> List[int]:
+    """指纹按位切段后的各段值。"""
+    return [(fp >> (i * _BAND_BITS)) & _BAND_MASK for i in range(SIMHASH_BANDS)]
+
+
+def _closest(fp: int, candidates: Iterable[Tuple[int, int]]) -> Optional[int]:
+    """候选 (块ID, 指纹) 中距离不超过阈值且最近的块ID（距离相同取ID小者）。"""
+    best: Optional[tuple] = None
+    for cid, value in candidates:
+        d = hamming(fp, value)
+        if d <= SIMHASH_MAX_DISTANCE and (best is None or (d, cid) < best):
+            best = (d, cid)
+    return best[1] if best else None
+
+
+def _load_band_index(db: Session, collection: str, fps: List[int]) -> Dict[Tuple[int, int], Set[Tuple[int, int]]]:
+    """
+    一次查询取回知识库中与任一指纹有相同段值的规范块，返回 (band, value) -> {(块ID, 指纹)}。
+    按段值 IN 查询后在内存中核对段号（避免为每个指纹拼接 OR 条件）。
+    """
+    wanted = {(i, v) for fp in fps for i, v in enumerate(bands(fp))}
+    index: Dict[Tuple[int, int], Set[Tuple[int, int]]] = defaultdict(set)
+    if not wanted:
+        return index
+    rows = (
+        db.query(ChunkSignature.band, ChunkSignature.value, Chunk.id, Chunk.simhash)
+        .join(Chunk, ChunkSignature.chunk_id == Chunk.id)
+        .filter(ChunkSignature.value.in_({v for _, v in wanted}), Chunk.collection == collection)
+        .all()
+    )
+    for band, value, cid, fp in rows:
+        if (band, value) in wanted:
+            index[(band, value)].add((cid, fp))
+    return index
+
+
+def dedupe_chunks(db: Session, chunks: Iterable[Chunk]) -> int:
+    """
+    为新入库的块计算指纹并链接近重复块（调用方需已 flush 以获得块ID，提交由调用方负责）。
+    同一批内的重复也会被识别：规范块按文本顺序加入内存中的段索引，供后续块比对。
+
+    参数:
+        db: 数据库会话。
+        chunks: 按文本顺序排列的新块。
+    返回值:
+        被标记为近重复的块数量。
+    """
+    chunks = list(chunks)
+    fps = [simhash(c.text) for c in chunks]
+    indexes: Dict[str, Dict[Tuple[int, int], Set[Tuple[int, int]]]] = {}
+    if DEDUP_ENABLED:
+        by_collection: Dict[str, List[int]] = defaultdict(list)
+        for c, fp in zip(chunks, fps):
+            if len(c.text) >= SIMHASH_MIN_CHARS:
+                by_collection[c.collection].append(fp)
+        indexes = {coll: _load_band_index(db, coll, coll_fps) for coll, coll_fps in by_collection.items()}
+
+    duplicates = 0
+    signatures: List[ChunkSignature] = []
+    for c, fp in zip(chunks, fps):
+        c.simhash = to_signed(fp)
+        if len(c.text) < SIMHASH_MIN_CHARS:
+            continue
+        keys = list(enumerate(bands(fp)))
+        canonical = None
+        if DEDUP_ENABLED:
+            index = indexes[c.collection]
+            canonical = _closest(fp, set().union(*(index.get(k, ()) for k in keys)))
+        if canonical is not None:
+            c.canonical_chunk_id = canonical
+            duplicates += 1
+            continue
+        signatures.extend(ChunkSignature(band=i, value=v, chunk_id=c.id) for i, v in keys)
+        if DEDUP_ENABLED:
+            for k in keys:
+                index[k].add((c.id, c.simhash))
+    db.add_all(chunks)
+    db.add_all(signatures)
+    db.flush()
+    if duplicates:
+        metrics.inc("cognito_chunks_deduplicated_total", duplicates)
+    return duplicates
+
+
+def episode_dedup_stats(db: Session, episode_id: int) -> dict:
+    """
+    节目的近重复统计：块数、重复块数、重复率与节省的向量字节数（按已嵌入块的向量长度估算）。
+    """
+    total, dup, dup_chars = db.query(
+        func.count(Chunk.id),
+        func.count(Chunk.canonical_chunk_id),
+        func.coalesce(func.sum(case((Chunk.canonical_chunk_id.isnot(None), func.length(Chunk.text)), else_=0)), 0),
+    ).filter(Chunk.episode_id == episode_id).one()
+    # 整期重复（重新上传）时本节目没有已嵌入的块，取任意已嵌入块的向量长度
+    vec_len = db.query(func.length(Chunk.embedding)).filter(Chunk.embedding.isnot(None)).limit(1).scalar()
+    return {
+        "episode_id": episode_id,
+        "chunks": total,
+        "duplicates": dup,
+        "duplicate_rate": round(dup / total, 4) if total else 0.0,
+        "duplicate_chars": int(dup_chars or 0),
+        "saved_vector_bytes": dup * int(vec_len or 0),
+    }
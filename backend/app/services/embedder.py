@@ -1,9 +1,108 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import os
 import json
+import re
+import shutil
+import time
 import numpy as np
-import faiss
-from fastembed import TextEmbedding
+
+# faiss / fastembed（含 onnxruntime）体积较大，仅在实际构建索引或嵌入时导入，
+# 避免 API 进程启动时加载（API 只负责入队，重计算交给 Celery worker）。
+
+# 索引按“代”存放：INDEX_DIR/<generation>/{faiss.index, meta.json, manifest.json}，
+# INDEX_DIR/CURRENT 记录当前对外服务的代；未写 CURRENT 时沿用旧布局（索引文件直接位于 INDEX_DIR）。
+INDEX_DIR = os.getenv("INDEX_DIR", "data/index")
+_CURRENT_FILE = "CURRENT"
+
+
+class IndexModelMismatch(Exception):
+    """索引的模型或维度与查询/写入向量不一致。"""
+
+
+def current_generation(root: str = INDEX_DIR) -> Optional[str]:
+    """当前服务中的索引代名称；旧布局返回 None。"""
+    try:
+        with open(os.path.join(root, _CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_index_dir(root: str = INDEX_DIR) -> str:
+    """当前服务中的索引目录。"""
+    gen = current_generation(root)
+    return os.path.join(root, gen) if gen else root
+
+
+def new_generation(model: str, factory: str, root: str = INDEX_DIR, shards: int = 1) -> str:
+    """
+    创建新的索引代目录并写入 building 状态的清单。
+
+    参数:
+        model: 该代索引使用的嵌入模型名。
+        factory: 索引类型描述。
+        shards: 分片数（见 services/shards.py）。
+    返回值:
+        代名称。
+    """
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", model).strip("-")[-48:]
+    name = f"{time.strftime('%Y%m%d%H%M%S')}-{slug}"
+    os.makedirs(os.path.join(root, name), exist_ok=True)
+    write_manifest(os.path.join(root, name), {
+        "model": model, "factory": factory, "shards": shards, "status": "building", "created_at": time.time(),
+    })
+    return name
+
+
+def read_manifest(base_dir: str) -> dict:
+    """读取索引清单（模型、维度、类型、状态等），不存在时返回空字典。"""
+    try:
+        with open(os.path.join(base_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _commit_file(tmp: str, path: str) -> None:
+    """把已写完的临时文件落盘（fsync）后 rename 为目标文件，并同步所在目录，掉电后不会留下截断的文件。"""
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _write_json(path: str, obj) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    _commit_file(tmp, path)
+
+
+def write_manifest(base_dir: str, manifest: dict) -> None:
+    """原子写入索引清单。"""
+    _write_json(os.path.join(base_dir, "manifest.json"), manifest)
+
+
+def set_current(generation: str, root: str = INDEX_DIR, keep: int = 2) -> None:
+    """
+    原子切换当前服务的索引代（写临时文件后 rename），并清理更早的已停用代（保留最近 keep 代以便回滚）。
+    """
+    path = os.path.join(root, _CURRENT_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(generation)
+    _commit_file(tmp, path)
+    retired = sorted(
+        d for d in os.listdir(root)
+        if d != generation and os.path.isdir(os.path.join(root, d)) and read_manifest(os.path.join(root, d)).get("status") == "retired"
+    )
+    for d in retired[: max(0, len(retired) - (keep - 1))]:
+        shutil.rmtree(os.path.join(root, d), ignore_errors=True)
 
 
 class FaissIndexManager:
@@ -11,50 +110,129 @@ class FaissIndexManager:
     FAISS 索引管理器，负责加载、保存与查询。
 
     属性:
+        base_dir: 索引目录（默认当前服务中的索引代）。
         index_path: 索引文件路径。
         meta_path: 元数据映射文件路径（faiss向量id -> chunk_id）。
+        manifest: 索引清单，记录嵌入模型名与维度；写入与查询前据此校验，模型变化时不会静默返回错误结果。
         index: FAISS 索引实例。
         id_map: 向量ID到chunk_id的映射列表。
+        factory: 新建索引时使用的 faiss index_factory 描述（默认 "Flat"，即精确内积检索；
+            可选 "HNSW32"、"IVF1024,Flat"，以及压缩类型 "SQfp16"、"SQ8"、"PCA256,SQ8" 等，
+            可由 `FAISS_INDEX_FACTORY` 指定，见 services/compression.py）。
+            需要训练的类型（IVF/PQ/SQ8/PCA）由调用方在首次写入前用数据库抽样训练（train），
+            未训练时退化为用首批写入的向量训练。
+        search_params: 检索参数（如 "nprobe=16" 或 "efSearch=64"，可由 `FAISS_SEARCH_PARAMS` 指定）。
     """
 
-    def __init__(self, base_dir: str = "data/index"):
+    def __init__(self, base_dir: str | None = None, factory: str | None = None, search_params: str | None = None):
+        base_dir = base_dir or current_index_dir()
         os.makedirs(base_dir, exist_ok=True)
+        self.base_dir = base_dir
         self.index_path = os.path.join(base_dir, "faiss.index")
         self.meta_path = os.path.join(base_dir, "meta.json")
+        self.manifest = read_manifest(base_dir)
+        self.factory = factory or self.manifest.get("factory") or os.getenv("FAISS_INDEX_FACTORY", "Flat")
+        self.search_params = search_params if search_params is not None else os.getenv("FAISS_SEARCH_PARAMS", "")
         self.index = None
         self.id_map: List[int] = []
 
-    def load(self, dim: int):
+    @property
+    def model(self) -> Optional[str]:
+        """索引对应的嵌入模型名（旧索引未记录时为 None）。"""
+        return self.manifest.get("model")
+
+    def load(self, dim: int, model: Optional[str] = None):
+        """
+        加载索引（不存在时按 factory 新建）。
+
+        参数:
+            dim: 向量维度。
+            model: 调用方向量所用的模型名；与清单不一致时抛出 IndexModelMismatch。
+        """
+        import faiss
+        if self.manifest.get("dim") and self.manifest["dim"] != dim:
+            raise IndexModelMismatch(f"索引维度 {self.manifest['dim']} 与向量维度 {dim} 不一致")
+        if model and self.model and model != self.model:
+            raise IndexModelMismatch(f"索引模型 {self.model} 与当前模型 {model} 不一致")
         if os.path.exists(self.index_path):
             self.index = faiss.read_index(self.index_path)
-        else:
+            if self.index.d != dim:
+                # 旧索引没有清单，只能按维度识别
+                found, self.index = self.index.d, None
+                raise IndexModelMismatch(f"索引维度 {found} 与向量维度 {dim} 不一致")
+        elif self.factory == "Flat":
             # 采用内积（需向量归一化以等价余弦相似度）
             self.index = faiss.IndexFlatIP(dim)
+        else:
+            self.index = faiss.index_factory(dim, self.factory, faiss.METRIC_INNER_PRODUCT)
+        if self.search_params:
+            faiss.ParameterSpace().set_index_parameters(self.index, self.search_params)
         if os.path.exists(self.meta_path):
             with open(self.meta_path, "r", encoding="utf-8") as f:
                 self.id_map = json.load(f)
         else:
             self.id_map = []
 
+    @property
+    def needs_training(self) -> bool:
+        """索引已加载但尚未训练（投影矩阵、量化范围或聚类中心未学习）。"""
+        return self.index is not None and not self.index.is_trained
+
+    def train(self, vectors: np.ndarray):
+        """
+        用样本训练索引（不写入向量），训练参数随索引文件保存。
+
+        参数:
+            vectors: 训练样本 (n, d)，按与写入相同的方式归一化（不修改传入数组）。
+        """
+        import faiss
+        sample = np.ascontiguousarray(vectors, dtype="float32").copy()
+        faiss.normalize_L2(sample)
+        self.index.train(sample)
+        self.manifest["trained_on"] = len(sample)
+
+    @property
+    def index_type(self) -> str:
+        """当前索引的 FAISS 类型名（用于指标标签），未加载时为 "none"。"""
+        return type(self.index).__name__ if self.index is not None else "none"
+
     def save(self):
+        """
+        保存索引、id 映射与清单。每个文件先写 <文件>.tmp 并 fsync，再 os.replace 替换，
+        写入中途崩溃或并发读取时只会看到旧文件或完整的新文件。
+        """
+        import faiss
         if self.index:
-            faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump(self.id_map, f)
+            tmp = self.index_path + ".tmp"
+            faiss.write_index(self.index, tmp)
+            _commit_file(tmp, self.index_path)
+            self.manifest.update(dim=self.index.d, factory=self.factory, count=int(self.index.ntotal))
+        _write_json(self.meta_path, self.id_map)
+        if self.manifest:
+            write_manifest(self.base_dir, self.manifest)
 
-    def add_vectors(self, vectors: np.ndarray, chunk_ids: List[int]):
+    def add_vectors(self, vectors: np.ndarray, chunk_ids: List[int], persist: bool = True):
+        import faiss
         # 归一化以用内积近似余弦
         faiss.normalize_L2(vectors)
+        if not self.index.is_trained:
+            self.index.train(vectors)
+            self.manifest["trained_on"] = len(vectors)
         self.index.add(vectors)
         self.id_map.extend(chunk_ids)
-        self.save()
+        if persist:
+            self.save()
 
     def search(self, vectors: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        import faiss
+        if self.index is None or self.index.ntotal == 0:
+            return []
         faiss.normalize_L2(vectors)
         D, I = self.index.search(vectors, top_k)
         results: List[Tuple[int, float]] = []
         for idx, score in zip(I[0], D[0]):
-            if idx == -1:
+            # 映射文件在索引之后写入，并发读取时可能短于索引，越界的向量跳过
+            if idx == -1 or idx >= len(self.id_map):
                 continue
             chunk_id = self.id_map[idx]
             results.append((chunk_id, float(score)))
@@ -71,20 +249,35 @@ class Embedder:
         - 若指定模型加载失败，则兜底到 "intfloat/multilingual-e5-large"（1024维，多语种，需前缀）。
         - 维度由模型自带，不在此处硬编码；调用方以向量实际维度加载索引。
 
+    属性:
+        model_name: 实际加载的模型名（兜底后为 e5-large），随向量记录到 Chunk.embed_model 与索引清单。
+
     方法:
         embed_texts(texts): 返回numpy数组的嵌入矩阵。
     """
 
-    def __init__(self):
+    def __init__(self, model: Optional[str] = None):
+        """
+        参数:
+            model: 指定模型名（如按索引清单加载与索引一致的模型）；指定时加载失败直接抛出，不做兜底。
+        """
+        from fastembed import TextEmbedding
+        if model:
+            self.model = TextEmbedding(model_name=model)
+            self.model_name = model
+            self._need_prefix = model.startswith("intfloat/multilingual-e5")
+            return
         # 允许通过环境变量选择更小或更快的模型，提升首次下载速度
         preferred = os.getenv("EMBED_MODEL", "sentence-transformers/paraphrase-multilingual-mpnet-base-v2")
         try:
             self.model = TextEmbedding(model_name=preferred)
+            self.model_name = preferred
             # e5 系列模型需要前缀，其余模型不需要
             self._need_prefix = preferred.startswith("intfloat/multilingual-e5")
         except Exception:
-            # 兜底到 e5-large（需要Query/Passage前缀）
+            # 兜底到 e5-large（需要Query/Passage前缀）；模型名会随向量记录，索引据此触发重嵌入迁移
             self.model = TextEmbedding(model_name="intfloat/multilingual-e5-large")
+            self.model_name = "intfloat/multilingual-e5-large"
             self._need_prefix = True
 
     def embed_texts(self, texts: List[str]) -> np.ndarray:
@@ -0,0 +1,119 @@
+"""
+常驻内存的索引缓存：按目录缓存已加载的 FAISS 索引，供 API（本地检索）与分片服务复用。
+
+- 惰性加载：首次检索某知识库/分片时才读取索引文件。
+- 版本检查：每个条目最多每 INDEX_CACHE_CHECK_SECONDS 秒比对一次索引与映射文件的修改时间，
+  index 队列写入或索引代切换后自动重新加载；检索中的请求继续使用旧对象。
+- LRU 预算：按索引文件大小计入 INDEX_CACHE_MAX_BYTES，超出时淘汰最久未使用的条目（冷知识库），
+  至少保留最近使用的一个。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from .embedder import FaissIndexManager
+from . import metrics
+
+
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+INDEX_CACHE_CHECK_SECONDS = float(os.getenv("INDEX_CACHE_CHECK_SECONDS", "5"))
+
+
+class _Entry(NamedTuple):
+    manager: FaissIndexManager
+    version: tuple
+    size: int
+    checked_at: float
+
+
+def index_version(path: str) -> Optional[tuple]:
+    """索引与映射文件的修改时间；索引尚未写入时返回 None。写入方先写索引再写映射，两者都纳入版本。"""
+    try:
+        return (
+            os.path.getmtime(os.path.join(path, "faiss.index")),
+            os.path.getmtime(os.path.join(path, "meta.json")),
+        )
+    except FileNotFoundError:
+        return None
+
+
+def load_existing(path: str) -> FaissIndexManager:
+    """加载目录中已有的索引（维度取自清单，旧索引没有清单时读取索引文件）。"""
+    manager = FaissIndexManager(base_dir=path)
+    dim = manager.manifest.get("dim")
+    if not dim:
+        import faiss
+        dim = faiss.read_index(manager.index_path).d
+    manager.load(dim=dim)
+    return manager
+
+
+class IndexCache:
+    """
+    索引目录 -> 已加载索引的 LRU 缓存（线程安全）。
+
+    参数:
+        max_bytes: 内存预算（按索引文件大小估算）。
+        check_seconds: 版本检查间隔。
+        name: 指标标签，区分 API 与分片服务。
+    """
+
+    def __init__(self, max_bytes: int = INDEX_CACHE_MAX_BYTES, check_seconds: float = INDEX_CACHE_CHECK_SECONDS, name: str = "api"):
+        self.max_bytes = max_bytes
+        self.check_seconds = check_seconds
+        self.name = name
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: dict[str, threading.Lock] = {}
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(e.size for e in self._entries.values())
+
+    def get(self, path: str) -> Optional[FaissIndexManager]:
+        """
+        返回目录对应的已加载索引；索引尚未写入时返回 None。
+
+        参数:
+            path: 索引目录（知识库或分片目录）。
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and now - entry.checked_at < self.check_seconds:
+                self._entries.move_to_end(path)
+                return entry.manager
+            loading = self._loading.setdefault(path, threading.Lock())
+        # 同一目录只由一个线程加载，其他目录的检索不受影响
+        with loading:
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and now - entry.checked_at < self.check_seconds:
+                    return entry.manager
+            version = index_version(path)
+            if version is None:
+                with self._lock:
+                    self._entries.pop(path, None)
+                return None
+            if entry is not None and entry.version == version:
+                with self._lock:
+                    self._entries[path] = entry._replace(checked_at=now)
+                    self._entries.move_to_end(path)
+                return entry.manager
+            start = time.perf_counter()
+            manager = load_existing(path)
+            metrics.observe("cognito_index_cache_load_seconds", time.perf_counter() - start, cache=self.name)
+            metrics.inc("cognito_index_cache_loads_total", cache=self.name)
+            size = os.path.getsize(manager.index_path)
+            with self._lock:
+                self._entries[path] = _Entry(manager, version, size, now)
+                self._entries.move_to_end(path)
+                self._evict()
+                metrics.set_gauge("cognito_index_cache_bytes", self.total_bytes, cache=self.name)
+            return manager
+
+    def _evict(self) -> None:
+        while len(self._entries) > 1 and self.total_bytes > self.max_bytes:
+            self._entries.popitem(last=False)
+            metrics.inc("cognito_index_cache_evictions_total", cache=self.name)
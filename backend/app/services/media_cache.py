@@ -0,0 +1,235 @@
+"""
+内容寻址媒体缓存：
+
+- canonicalize_url: 将 YouTube / B站 / TikTok 等不同形式的链接规整为统一来源键，重复提交复用同一份下载。
+- source_key_for_id: 旧缓存文件名中的裸视频ID（BV 号、YouTube ID 等）换算为同一套来源键。
+- store_file: 将下载/上传的文件按 SHA-256 移入 objects 目录，相同内容只保留一份，并登记产物目录。
+- enforce_budget: 媒体目录超出磁盘预算时，按最近访问时间淘汰已处理完成的音频（LRU）。
+  由 celery beat 周期执行（evict_media_cache，间隔 MEDIA_CACHE_EVICT_INTERVAL_SECONDS），上传与索引路径上不做统计与淘汰；
+  每轮一次统计占用、一次查询候选，删除记录在同一事务中提交。
+
+下载字节数、缓存命中与淘汰通过 metrics 计数器暴露。
+"""
+import hashlib
+import os
+import re
+import shutil
+from typing import NamedTuple
+from urllib.parse import urlsplit, parse_qs, urlencode, urlunsplit
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models import MediaArtifact
+from .media_catalog import file_digest, register_artifact
+from . import metrics
+
+
+MEDIA_DIR = os.getenv("MEDIA_DIR", "data/media")
+MEDIA_STORE_DIR = os.getenv("MEDIA_STORE_DIR", os.path.join(MEDIA_DIR, "objects"))
+# 磁盘预算（字节），0 表示不限制
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+# 周期淘汰间隔（秒）：两轮之间缓存可能短暂超出预算
+MEDIA_CACHE_EVICT_INTERVAL_SECONDS = float(os.getenv("MEDIA_CACHE_EVICT_INTERVAL_SECONDS", "300"))
+# 允许被淘汰的产物类型：字幕/弹幕体积很小且可能被重复使用，仅淘汰音频
+EVICTABLE_KINDS = ("audio", "pcm")
+
+
+class CanonicalURL(NamedTuple):
+    """规整后的链接：platform 平台名，video_id 平台内ID，url 规范链接。"""
+    platform: str
+    video_id: str
+    url: str
+
+    @property
+    def key(self) -> str:
+        """缓存与去重使用的来源键，例如 youtube:dQw4w9WgXcQ。"""
+        return f"{self.platform}:{self.video_id}"
+
+
+_YT_ID = r"[A-Za-z0-9_-]{11}"
+_TRACKING_PARAMS = {"spm_id_from", "vd_source", "share_source", "share_medium", "from", "si", "feature", "is_from_webapp", "sender_device"}
+
+
+def canonicalize_url(url: str) -> CanonicalURL:
+    """
+    规整视频链接。
+
+    参数:
+        url: 用户提交的原始链接。
+    返回值:
+        CanonicalURL；无法识别平台时以去掉跟踪参数后的链接哈希作为ID。
+    """
+    raw = url.strip()
+    if "://" not in raw:
+        raw = "https://" + raw
+    parts = urlsplit(raw)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www.") or host.startswith("m."):
+        host = host.split(".", 1)[1]
+    query = parse_qs(parts.query)
+    path = parts.path
+
+    if host in {"youtube.com", "music.youtube.com", "youtube-nocookie.com"}:
+        vid = (query.get("v") or [None])[0]
+        if not vid:
+            m = re.match(rf"^/(?:shorts|embed|live|v)/({_YT_ID})", path)
+            vid = m.group(1) if m else None
+        if vid and re.fullmatch(_YT_ID, vid):
+            return CanonicalURL("youtube", vid, f"https://www.youtube.com/watch?v={vid}")
+    if host == "youtu.be":
+        m = re.match(rf"^/({_YT_ID})", path)
+        if m:
+            vid = m.group(1)
+            return CanonicalURL("youtube", vid, f"https://www.youtube.com/watch?v={vid}")
+
+    if host == "bilibili.com":
+        m = re.search(r"/video/(BV[0-9A-Za-z]{10}|av\d+)", path, flags=re.I)
+        if m:
+            vid = m.group(1)
+            vid = "av" + vid[2:] if vid.lower().startswith("av") else vid
+            page = (query.get("p") or ["1"])[0]
+            canon = f"https://www.bilibili.com/video/{vid}"
+            if page.isdigit() and int(page) > 1:
+                return CanonicalURL("bilibili", f"{vid}_p{page}", f"{canon}?p={page}")
+            return CanonicalURL("bilibili", vid, canon)
+
+    if host.endswith("tiktok.com"):
+        m = re.search(r"/(?:@[^/]+/video|v|embed(?:/v2)?)/(\d+)", path)
+        if m:
+            vid = m.group(1)
+            return CanonicalURL("tiktok", vid, f"https://www.tiktok.com/video/{vid}")
+
+    # 其它站点：小写主机名、去掉片段与跟踪参数后取哈希
+    kept = {k: v for k, v in sorted(query.items()) if k not in _TRACKING_PARAMS and not k.startswith("utm_")}
+    norm = urlunsplit((parts.scheme.lower(), (parts.netloc or "").lower(), path.rstrip("/") or "/", urlencode(kept, doseq=True), ""))
+    digest = hashlib.sha1(norm.encode("utf-8")).hexdigest()[:16]
+    return CanonicalURL("web", digest, norm)
+
+
+_BARE_ID_URLS = (
+    (re.compile(r"^(?:BV[0-9A-Za-z]{10}|av\d+)(?:_p\d+)?$", re.I), "https://www.bilibili.com/video/{}"),
+    (re.compile(rf"^{_YT_ID}$"), "https://www.youtube.com/watch?v={}"),
+    (re.compile(r"^\d{15,20}$"), "https://www.tiktok.com/v/{}"),
+)
+
+
+def source_key_for_id(video_id: str) -> str | None:
+    """
+    将旧缓存文件名中的裸视频ID换算为来源键（与 canonicalize_url 的键一致）。
+
+    参数:
+        video_id: 文件名中的视频ID，如 BV1xx411c7mD、BV1xx411c7mD_p2、dQw4w9WgXcQ。
+    返回值:
+        来源键（如 bilibili:BV1xx411c7mD）；无法识别平台时返回 None。
+    """
+    for pattern, template in _BARE_ID_URLS:
+        if pattern.match(video_id):
+            base, _, page = video_id.partition("_p")
+            url = template.format(base)
+            if page:
+                url += f"?p={page}"
+            return canonicalize_url(url).key
+    return None
+
+
+def object_path(sha256: str, ext: str) -> str:
+    """返回内容哈希对应的对象路径（两级目录分桶）。"""
+    return os.path.join(MEDIA_STORE_DIR, sha256[:2], f"{sha256}{ext.lower()}")
+
+
+def store_file(db: Session, path: str, source_id: str, kind: str, sha256: str | None = None) -> MediaArtifact:
+    """
+    将文件移入内容寻址目录并登记产物。内容已存在时删除新文件，直接复用已有对象。
+
+    参数:
+        db: 数据库会话。
+        path: 刚写入的文件路径。
+        source_id: 来源键（见 CanonicalURL.key）。
+        kind: 产物类型。
+        sha256: 已知的内容哈希（流式写入时同步算出），提供时跳过重新读取。
+    返回值:
+        MediaArtifact 记录。
+    """
+    sha = sha256 or file_digest(path)[1]
+    ext = ".danmaku.xml" if path.lower().endswith(".danmaku.xml") else os.path.splitext(path)[1]
+    dest = object_path(sha, ext)
+    if os.path.abspath(path) != os.path.abspath(dest):
+        if os.path.exists(dest):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(path, dest)
+    return register_artifact(db, source_id, kind, dest, sha256=sha)
+
+
+def mark_processed(db: Session, source_id: str) -> None:
+    """
+    标记某来源的音频已完成处理，使其进入可淘汰集合（由周期淘汰处理）。
+    """
+    rows = db.query(MediaArtifact).filter(
+        MediaArtifact.source_id == source_id, MediaArtifact.kind.in_(EVICTABLE_KINDS)
+    ).all()
+    if not rows:
+        return
+    for a in rows:
+        a.processed = True
+        db.add(a)
+    db.commit()
+
+
+def cache_usage_bytes(db: Session) -> int:
+    """统计缓存占用：同一对象被多个来源引用时只计一次。"""
+    sub = db.query(MediaArtifact.path, func.max(MediaArtifact.size).label("size")).group_by(MediaArtifact.path).subquery()
+    return int(db.query(func.coalesce(func.sum(sub.c.size), 0)).scalar() or 0)
+
+
+def enforce_budget(db: Session, max_bytes: int | None = None) -> int:
+    """
+    超出磁盘预算时按 LRU 淘汰已处理的音频对象（周期任务调用）。
+
+    参数:
+        db: 数据库会话。
+        max_bytes: 预算字节数，默认取 MEDIA_CACHE_MAX_BYTES；0 表示不限制。
+    返回值:
+        释放的字节数。
+    """
+    budget = MEDIA_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if budget <= 0:
+        return 0
+    usage = cache_usage_bytes(db)
+    metrics.set_gauge("cognito_media_cache_bytes", usage)
+    if usage <= budget:
+        return 0
+    # 仍被未处理来源引用的对象不能删除：在同一查询中排除，按对象最近一次访问排序
+    pending = db.query(MediaArtifact.path).filter(MediaArtifact.processed.is_(False))
+    candidates = (
+        db.query(
+            MediaArtifact.path,
+            func.max(MediaArtifact.size).label("size"),
+            func.min(MediaArtifact.kind).label("kind"),
+        )
+        .filter(MediaArtifact.kind.in_(EVICTABLE_KINDS), ~MediaArtifact.path.in_(pending))
+        .group_by(MediaArtifact.path)
+        .order_by(func.max(MediaArtifact.last_accessed_at).asc())
+        .all()
+    )
+    victims = []
+    freed = 0
+    for path, size, kind in candidates:
+        if usage - freed <= budget:
+            break
+        victims.append((path, size or 0, kind))
+        freed += size or 0
+    if not victims:
+        return 0
+    # 记录一次删除、一次提交；之后若有记录仍指向已删除的文件，lookup_artifact 会清理并重新下载
+    db.query(MediaArtifact).filter(MediaArtifact.path.in_([v[0] for v in victims])).delete(synchronize_session=False)
+    db.commit()
+    for path, size, kind in victims:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        metrics.inc("cognito_media_cache_evictions_total", kind=kind)
+        metrics.inc("cognito_media_cache_evicted_bytes_total", size, kind=kind)
+    metrics.set_gauge("cognito_media_cache_bytes", usage - freed)
+    return freed
@@ -0,0 +1,216 @@
+"""
+媒体产物目录：以 (source_id, kind) 为键记录本地缓存文件，替代对 MEDIA_DIR 的目录扫描。
+
+产物类型:
+    audio: 下载或上传的音频/视频文件。
+    caption: VTT/SRT 字幕。
+    danmaku: B站弹幕 XML。
+    pcm: 解码后的 PCM 音频（供 ASR 复用）。
+
+写入文件后调用 register_artifact 登记；查找时走唯一索引，单次查询即可定位。
+来源ID使用与 media_cache.canonicalize_url 一致的来源键（如 bilibili:BV...、youtube:<id>、upload:<sha256>）。
+"""
+import hashlib
+import os
+from datetime import datetime
+from typing import Optional
+from loguru import logger
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..models import Episode, MediaArtifact
+
+
+ARTIFACT_KINDS = {"audio", "caption", "danmaku", "pcm"}
+_HASH_BLOCK = 1024 * 1024
+
+
+def file_digest(path: str) -> tuple[int, str]:
+    """
+    分块计算文件大小与 SHA-256，避免一次性读入大文件。
+
+    参数:
+        path: 文件路径。
+    返回值:
+        (字节数, 十六进制哈希)。
+    """
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(_HASH_BLOCK)
+            if not block:
+                break
+            size += len(block)
+            h.update(block)
+    return size, h.hexdigest()
+
+
+def classify_media_file(fname: str) -> tuple[str, str] | None:
+    """
+    根据文件名推断来源ID与产物类型。
+
+    参数:
+        fname: 文件名（不含目录）。
+    返回值:
+        (source_id, kind)；无法识别时返回 None。
+    """
+    lower = fname.lower()
+    if lower.endswith(".danmaku.xml"):
+        return fname[: -len(".danmaku.xml")], "danmaku"
+    base, ext = os.path.splitext(fname)
+    ext = ext.lower()
+    if ext == ".xml":
+        return base, "danmaku"
+    if ext in {".vtt", ".srt"}:
+        # yt-dlp 字幕命名为 <id>.<lang>.vtt
+        return base.split(".")[0], "caption"
+    if ext == ".pcm":
+        return base, "pcm"
+    if ext in {".m4a", ".mp3", ".mp4", ".wav", ".webm", ".opus", ".aac", ".flac"}:
+        return base, "audio"
+    return None
+
+
+def register_artifact(db: Session, source_id: str, kind: str, path: str, digest: bool = True, sha256: Optional[str] = None) -> MediaArtifact:
+    """
+    登记（或更新）一个媒体产物。
+
+    参数:
+        db: 数据库会话。
+        source_id: 来源ID。
+        kind: 产物类型，取值见 ARTIFACT_KINDS。
+        path: 文件路径，必须已存在。
+        digest: 是否计算内容哈希（目录回填时可关闭以加速）。
+        sha256: 调用方已算好的哈希（如流式写入时同步计算），提供时不再重读文件。
+    返回值:
+        MediaArtifact 记录。
+    """
+    if kind not in ARTIFACT_KINDS:
+        raise ValueError(f"未知产物类型: {kind}")
+    if sha256 is not None:
+        size, sha = os.path.getsize(path), sha256
+    elif digest:
+        size, sha = file_digest(path)
+    else:
+        size, sha = os.path.getsize(path), None
+    art = db.query(MediaArtifact).filter_by(source_id=source_id, kind=kind).first()
+    if art is None:
+        art = MediaArtifact(source_id=source_id, kind=kind, path=path)
+        try:
+            with db.begin_nested():
+                db.add(art)
+        except IntegrityError:
+            # 另一个 worker 同时登记了同一产物（唯一索引冲突）：改为更新其记录；加锁读取以看到已提交的新行
+            art = db.query(MediaArtifact).filter_by(source_id=source_id, kind=kind).with_for_update().one()
+    art.path = path
+    art.size = size
+    art.sha256 = sha
+    art.processed = False
+    art.updated_at = datetime.utcnow()
+    art.last_accessed_at = art.updated_at
+    db.add(art)
+    db.commit()
+    return art
+
+
+def lookup_artifact(db: Session, source_id: str, kind: str) -> Optional[MediaArtifact]:
+    """
+    按来源ID与类型查找产物；文件已被删除时清理过期记录并返回 None。
+    """
+    art = db.query(MediaArtifact).filter_by(source_id=source_id, kind=kind).first()
+    if art is None:
+        return None
+    if not os.path.exists(art.path):
+        db.delete(art)
+        db.commit()
+        return None
+    # 记录访问时间，作为媒体缓存 LRU 淘汰依据
+    art.last_accessed_at = datetime.utcnow()
+    db.add(art)
+    db.commit()
+    return art
+
+
+def resolve_artifact(db: Session, source_id: str, kind: str, candidates: list[str]) -> Optional[MediaArtifact]:
+    """
+    先查目录；未命中时逐个探测给定的候选路径（单次 stat，不做目录扫描），命中则补登记。
+
+    参数:
+        db: 数据库会话。
+        source_id: 来源ID。
+        kind: 产物类型。
+        candidates: 约定命名下的候选文件路径。
+    返回值:
+        MediaArtifact 或 None。
+    """
+    art = lookup_artifact(db, source_id, kind)
+    if art is not None:
+        return art
+    for p in candidates:
+        if os.path.exists(p):
+            return register_artifact(db, source_id, kind, p)
+    return None
+
+
+def _object_sources(db: Session, paths: list[str]) -> dict[str, str]:
+    """内容寻址对象的文件名是内容哈希，来源只能从引用它的节目反查（节目 file_path 即对象路径）。"""
+    sources: dict[str, str] = {}
+    for i in range(0, len(paths), 500):
+        rows = db.query(Episode.file_path, Episode.source_key).filter(
+            Episode.file_path.in_(paths[i:i + 500]), Episode.source_key.isnot(None)
+        ).all()
+        sources.update(rows)
+    return sources
+
+
+def rebuild_catalog(db: Session, media_dir: str, digest: bool = False) -> int:
+    """
+    一次性回填：递归扫描媒体目录并登记所有可识别的产物。仅用于迁移旧缓存，常规路径不应调用。
+
+    - 旧命名的文件（<视频ID>.<扩展名>）：视频ID换算为来源键（media_cache.source_key_for_id），无法识别平台的跳过。
+    - 内容寻址对象（objects/ 下的 <sha256>.<扩展名>）：按引用它的节目的来源键登记为音频，无节目引用的跳过。
+    - 下载临时目录（incoming/）跳过。
+
+    参数:
+        db: 数据库会话。
+        media_dir: 媒体目录。
+        digest: 是否同时计算哈希（对象文件名即哈希，不重新计算）。
+    返回值:
+        登记的产物数量。
+    """
+    # media_cache 依赖本模块，按需导入避免循环导入
+    from .media_cache import source_key_for_id
+    legacy: list[tuple[str, str, str]] = []
+    objects: list[tuple[str, str]] = []
+    for root, dirs, files in os.walk(media_dir):
+        dirs[:] = [d for d in dirs if d != "incoming"]
+        for name in files:
+            parsed = classify_media_file(name)
+            if not parsed:
+                continue
+            stem, kind = parsed
+            path = os.path.join(root, name)
+            if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+                # 只有音频对象能经节目反查来源；字幕/弹幕对象无法恢复来源，跳过
+                if kind == "audio":
+                    objects.append((path, stem))
+                continue
+            key = source_key_for_id(stem)
+            if key is None:
+                logger.info(f"跳过无法识别来源的媒体文件: {path}")
+                continue
+            legacy.append((path, key, kind))
+
+    count = 0
+    for path, key, kind in legacy:
+        register_artifact(db, key, kind, path, digest=digest)
+        count += 1
+    sources = _object_sources(db, [p for p, _ in objects])
+    for path, sha in objects:
+        key = sources.get(path)
+        if key is None:
+            logger.info(f"跳过没有节目引用的媒体对象: {path}")
+            continue
+        register_artifact(db, key, "audio", path, sha256=sha)
+        count += 1
+    return count
@@ -0,0 +1,322 @@
+"""
+跨进程指标：API 与 Celery worker 将计数器/仪表/直方图写入 Redis 哈希，由 API 的 /metrics 以 Prometheus 文本格式导出。
+
+- 写入只更新进程内缓冲（加锁的字典，不做网络 I/O），后台线程每 METRICS_FLUSH_SECONDS 秒把累计增量合并为一个 pipeline 写入 Redis；
+  同一序列在一个周期内的多次观测只产生一次写入。
+- 熔断：写入 Redis 失败后 METRICS_RETRY_SECONDS 秒内不再尝试，增量留在缓冲中，恢复后合并写入；
+  /metrics 读取时叠加本进程尚未写入的增量，Redis 不可用期间的指标不会丢失。
+- fork 出的子进程清空继承的缓冲（属于父进程）并重新启动后台线程；进程退出时尽力写入剩余增量。
+
+函数:
+    inc(name, value=1, **labels): 计数器累加。
+    set_gauge(name, value, **labels): 设置仪表值。
+    observe(name, value, **labels): 直方图观测（单位：秒）。
+    timed(name, **labels): 上下文管理器，记录代码块耗时到直方图。
+    stage(stage_name, **labels): 流水线阶段计时（cognito_stage_duration_seconds）。
+    observe_counts(name, counts, total, **labels): 合并一批已分桶的直方图观测。
+    register_collector(fn): 注册写入前调用的采集函数。
+    flush(): 立即写入本进程缓冲的增量。
+    render_prometheus(): 生成 Prometheus 文本格式。
+"""
+import atexit
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from loguru import logger
+from ..redis_client import get_redis
+
+
+COUNTER_KEY = "metrics:counter"
+GAUGE_KEY = "metrics:gauge"
+HIST_KEY = "metrics:hist"
+
+# 覆盖毫秒级检索到小时级 ASR 的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "1"))
+METRICS_RETRY_SECONDS = float(os.getenv("METRICS_RETRY_SECONDS", "30"))
+
+
+def _empty() -> Dict[str, Dict[str, float]]:
+    return {COUNTER_KEY: defaultdict(float), GAUGE_KEY: {}, HIST_KEY: defaultdict(float)}
+
+
+# 尚未写入 Redis 的增量（计数器与直方图为增量，仪表为最新值）
+_pending: Dict[str, Dict[str, float]] = _empty()
+_lock = threading.Lock()
+_flusher_pid: int | None = None
+_down_until = 0.0
+# 每次写入前调用的采集函数（把其他模块的进程内统计并入缓冲）
+_collectors: list = []
+
+
+def _label_value(value) -> str:
+    # Prometheus 文本格式中标签值须转义反斜杠、双引号与换行
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    body = ",".join(f'{k}="{_label_value(v)}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{body}}}"
+
+
+def ensure_flusher() -> None:
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            logger.debug(f"metrics flush error: {e}")
+
+
+def _after_fork_in_child() -> None:
+    # 继承的缓冲属于父进程（由父进程写入），锁可能在 fork 时被其他线程持有，全部重建
+    global _pending, _lock, _flusher_pid
+    _pending = _empty()
+    _lock = threading.Lock()
+    _flusher_pid = None
+
+
+def _merge(target: Dict[str, Dict[str, float]], batch: Dict[str, Dict[str, float]]) -> None:
+    for key in (COUNTER_KEY, HIST_KEY):
+        for series, value in batch[key].items():
+            target[key][series] += value
+    for series, value in batch[GAUGE_KEY].items():
+        # 写入失败期间更新过的仪表以新值为准
+        target[GAUGE_KEY].setdefault(series, value)
+
+
+def flush() -> bool:
+    """
+    把本进程缓冲的增量写入 Redis（一个 pipeline）。
+
+    返回值:
+        是否写入成功；熔断期间或写入失败时返回 False，增量保留到下次写入。
+    """
+    global _pending, _down_until
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            logger.debug(f"metrics collector error: {e}")
+    if time.monotonic() < _down_until:
+        return False
+    with _lock:
+        batch, _pending = _pending, _empty()
+    if not any(batch.values()):
+        return True
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for key in (COUNTER_KEY, HIST_KEY):
+            for series, value in batch[key].items():
+                pipe.hincrbyfloat(key, series, value)
+        if batch[GAUGE_KEY]:
+            pipe.hset(GAUGE_KEY, mapping=batch[GAUGE_KEY])
+        pipe.execute()
+        _down_until = 0.0
+        return True
+    except Exception as e:
+        if not _down_until:
+            logger.warning(f"指标写入 Redis 失败，{METRICS_RETRY_SECONDS:g}s 内暂停写入，增量保留在进程内: {e}")
+        _down_until = time.monotonic() + METRICS_RETRY_SECONDS
+        with _lock:
+            _merge(_pending, batch)
+        return False
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """
+    计数器累加（只更新进程内缓冲）。
+
+    参数:
+        name: 指标名（以 _total 结尾）。
+        value: 增量。
+        labels: 标签键值。
+    """
+    series = _series(name, labels)
+    ensure_flusher()
+    with _lock:
+        _pending[COUNTER_KEY][series] += float(value)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """
+    设置仪表值（最后写入者生效）。
+    """
+    series = _series(name, labels)
+    ensure_flusher()
+    with _lock:
+        _pending[GAUGE_KEY][series] = float(value)
+
+
+def observe(name: str, value: float, buckets: tuple = DEFAULT_BUCKETS, **labels) -> None:
+    """
+    直方图观测：累加 _bucket（累积分桶）、_sum 与 _count。
+
+    参数:
+        name: 指标名（如 cognito_stage_duration_seconds）。
+        value: 观测值（秒）。
+        buckets: 分桶上界。
+        labels: 标签键值。
+    """
+    # 所有分桶都写入（未命中的增量为 0），保证每个序列的分桶完整
+    fields = {f"{name}_bucket" + _series("", dict(labels, le=f"{b:g}")): int(value <= b) for b in buckets}
+    fields[f"{name}_bucket" + _series("", dict(labels, le="+Inf"))] = 1
+    fields[_series(f"{name}_sum", labels)] = value
+    fields[_series(f"{name}_count", labels)] = 1
+    ensure_flusher()
+    with _lock:
+        hist = _pending[HIST_KEY]
+        for field, inc_by in fields.items():
+            hist[field] += float(inc_by)
+
+
+def observe_counts(name: str, counts: list, total: float, buckets: tuple = DEFAULT_BUCKETS, **labels) -> None:
+    """
+    合并一批已在进程内分桶的观测（用于不宜逐次调用 observe 的热路径）。
+
+    参数:
+        name: 指标名。
+        counts: 各分桶（非累积）的观测数，长度为 len(buckets) + 1（最后一项为超出最大分桶的数量）。
+        total: 观测值之和。
+        buckets: 分桶上界。
+        labels: 标签键值。
+    """
+    n = sum(counts)
+    if not n:
+        return
+    ensure_flusher()
+    with _lock:
+        hist = _pending[HIST_KEY]
+        cumulative = 0
+        for b, c in zip(buckets, counts):
+            cumulative += c
+            hist[f"{name}_bucket" + _series("", dict(labels, le=f"{b:g}"))] += cumulative
+        hist[f"{name}_bucket" + _series("", dict(labels, le="+Inf"))] += n
+        hist[_series(f"{name}_sum", labels)] += float(total)
+        hist[_series(f"{name}_count", labels)] += n
+
+
+def register_collector(fn) -> None:
+    """注册采集函数：每次写入 Redis 前（后台线程与 /metrics 渲染时）调用，不在调用方线程上做网络 I/O。"""
+    _collectors.append(fn)
+
+
+@contextmanager
+def timed(name: str, **labels) -> Iterator[None]:
+    """
+    记录代码块耗时（秒）到直方图；异常时同样记录，并附加 status="error" 标签。
+
+    用法:
+        with metrics.timed("cognito_stage_duration_seconds", stage="embed", model=name):
+            ...
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(name, elapsed, status=status, **labels)
+        # JSON 日志（LOG_JSON=1）下以结构化字段输出，便于逐条追查慢请求
+        logger.bind(metric=name, duration=elapsed, status=status, **labels).debug(f"{name} {labels} {elapsed:.3f}s")
+
+
+def stage(stage_name: str, **labels):
+    """流水线阶段计时的简写：写入 cognito_stage_duration_seconds{stage=...}。"""
+    return timed("cognito_stage_duration_seconds", stage=stage_name, **labels)
+
+
+def _read(key: str) -> Dict[str, float]:
+    """Redis 中的汇总值叠加本进程尚未写入的增量（熔断期间只返回本进程的值）。"""
+    global _down_until
+    with _lock:
+        values: Dict[str, float] = dict(_pending[key])
+    if time.monotonic() < _down_until:
+        return values
+    try:
+        stored = get_redis().hgetall(key)
+    except Exception:
+        _down_until = time.monotonic() + METRICS_RETRY_SECONDS
+        return values
+    for k, v in stored.items():
+        k = k.decode()
+        if key == GAUGE_KEY:
+            values.setdefault(k, float(v))
+        else:
+            values[k] = values.get(k, 0.0) + float(v)
+    return values
+
+
+def _emit(lines: list[str], values: Dict[str, float], mtype: str) -> None:
+    typed: set[str] = set()
+    for series in sorted(values):
+        name = series.split("{", 1)[0]
+        if name not in typed:
+            lines.append(f"# TYPE {name} {mtype}")
+            typed.add(name)
+        lines.append(f"{series} {values[series]:g}")
+
+
+def _hist_sort_key(series: str) -> tuple:
+    name, _, body = series.partition("{")
+    le = 0.0
+    parts = []
+    for item in body.rstrip("}").split(","):
+        if item.startswith("le="):
+            v = item[4:-1]
+            le = float("inf") if v == "+Inf" else float(v)
+        elif item:
+            parts.append(item)
+    base = name.rsplit("_", 1)[0]
+    order = {"bucket": 0, "sum": 1, "count": 2}.get(name.rsplit("_", 1)[1], 3)
+    return base, ",".join(parts), order, le
+
+
+def _emit_histograms(lines: list[str], values: Dict[str, float]) -> None:
+    typed: set[str] = set()
+    for series in sorted(values, key=_hist_sort_key):
+        base = _hist_sort_key(series)[0]
+        if base not in typed:
+            lines.append(f"# TYPE {base} histogram")
+            typed.add(base)
+        lines.append(f"{series} {values[series]:g}")
+
+
+def render_prometheus() -> str:
+    """
+    汇总所有进程写入的指标并生成 Prometheus 文本格式。
+
+    返回值:
+        文本格式的指标。
+    """
+    flush()
+    lines: list[str] = []
+    _emit(lines, _read(COUNTER_KEY), "counter")
+    _emit(lines, _read(GAUGE_KEY), "gauge")
+    _emit_histograms(lines, _read(HIST_KEY))
+    return "\n".join(lines) + "\n"
+
+
+atexit.register(flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
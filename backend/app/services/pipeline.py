@@ -1,8 +1,16 @@
-from typing import List
+from typing import Callable, List, Optional
 import re
+import numpy as np
 from sqlalchemy.orm import Session
 from ..models import Episode, Chunk, Task
-from ..services.embedder import Embedder, FaissIndexManager
+from ..services.embedder import Embedder, FaissIndexManager, IndexModelMismatch
+from ..services.shards import DEFAULT_COLLECTION, ShardedIndex, group_by_shard
+from ..services import metrics
+from ..services.summarizer import summarize_episode
+from ..services.dedup import dedupe_chunks
+from ..services.compression import train_from_db
+from ..services import checkpoint
+from loguru import logger
 from datetime import datetime
 
 
@@ -67,8 +75,8 @@ def semantic_chunk(text: str, max_chars: int = 800) -> List[str]:
 
 def _simple_summarize(text: str, max_len: int = 800) -> str:
     """
-    摘要占位：选取前若干句拼接作为简要摘要。
-    后续可替换为LLM的Map-Reduce总结。
+    摘要占位：选取前若干句拼接作为简要摘要，分块后立即可见；
+    嵌入与索引完成后由分层摘要（services/summarizer.py）覆盖。
     """
     sentences = [s.strip() for s in re.split(r"(?<=[。！？!?\.])\s+", text) if s.strip()]
     out = []
@@ -81,9 +89,206 @@ def _simple_summarize(text: str, max_len: int = 800) -> str:
     return " ".join(out)
 
 
+def chunk_transcript(db: Session, episode_id: int, transcript_text: str) -> List[int]:
+    """
+    流水线“清洗+分块”阶段：清洗文本、语义分块、写入 Chunk 并生成摘要占位。
+    入库时在同一知识库内做近重复检测，重复块链接到规范块（canonical_chunk_id），后续不再嵌入与入索引。
+    各步产出写入检查点：同一文本重试时直接返回已提交的块ID（不会重复插入），清洗结果也会复用；
+    提交新的文本时清除该节目旧的下游检查点。
+
+    参数:
+        db: 数据库会话。
+        episode_id: 节目ID。
+        transcript_text: 原始转录文本。
+    返回值:
+        新建块的ID列表（按文本顺序）。
+    """
+    episode = db.query(Episode).get(episode_id)
+    if not episode:
+        raise ValueError("节目不存在")
+
+    cleaned = None
+    if checkpoint.load(db, episode_id, "transcript") == transcript_text:
+        chunk_ids = checkpoint.load_json(db, episode_id, "chunks")
+        if chunk_ids is not None:
+            return chunk_ids
+        cleaned = checkpoint.load(db, episode_id, "cleaned")
+    else:
+        checkpoint.clear(db, episode_id, "transcript")
+        checkpoint.save(db, episode_id, "transcript", transcript_text)
+
+    if cleaned is None:
+        with metrics.stage("clean"):
+            cleaned = simple_clean(transcript_text)
+        checkpoint.save(db, episode_id, "cleaned", cleaned)
+        db.commit()
+    with metrics.stage("chunk"):
+        blocks = semantic_chunk(cleaned)
+
+    created_chunks: List[Chunk] = []
+    with metrics.stage("db_insert"):
+        for b in blocks:
+            c = Chunk(episode_id=episode_id, collection=episode.collection, text=b)
+            db.add(c)
+            created_chunks.append(c)
+        db.flush()
+    with metrics.stage("dedup"):
+        duplicates = dedupe_chunks(db, created_chunks)
+    with metrics.stage("db_insert"):
+        # 生成摘要占位；块与检查点同一事务提交
+        episode.summary = _simple_summarize(cleaned)
+        db.add(episode)
+        checkpoint.save(db, episode_id, "chunks", [c.id for c in created_chunks])
+        db.commit()
+    metrics.inc("cognito_chunks_created_total", len(created_chunks))
+    if duplicates:
+        logger.info(f"节目 {episode_id}: {duplicates}/{len(created_chunks)} 个块为近重复，跳过嵌入")
+    return [c.id for c in created_chunks]
+
+
+def embed_chunks(
+    db: Session, chunk_ids: List[int], embedder: Embedder, batch_size: int = 64, episode_id: Optional[int] = None
+) -> int:
+    """
+    流水线“嵌入”阶段：为尚无向量的块计算嵌入并写回 Chunk.embedding（float32字节）。近重复块（canonical_chunk_id 非空）跳过。
+    每批单独提交，重试时已有向量的块直接跳过；全部完成后写入 embedded 检查点。
+
+    参数:
+        db: 数据库会话。
+        chunk_ids: 待嵌入的块ID。
+        embedder: 嵌入器。
+        batch_size: 每批嵌入与提交的块数。
+        episode_id: 所属节目（提供时记录检查点；对账等跨节目调用不提供）。
+    返回值:
+        本次写入向量的块数量。
+    """
+    done = 0
+    for i in range(0, len(chunk_ids), batch_size):
+        batch = (
+            db.query(Chunk)
+            .filter(Chunk.id.in_(chunk_ids[i:i + batch_size]), Chunk.embedding.is_(None), Chunk.canonical_chunk_id.is_(None))
+            .all()
+        )
+        if not batch:
+            continue
+        with metrics.stage("embed", model=embedder.model_name):
+            vectors = embedder.embed_texts([c.text for c in batch])
+        with metrics.stage("db_insert"):
+            for c, v in zip(batch, vectors):
+                c.embedding = v.astype("float32").tobytes()
+                c.embed_model = embedder.model_name
+                db.add(c)
+            db.commit()
+        done += len(batch)
+    metrics.inc("cognito_chunks_embedded_total", done, model=embedder.model_name)
+    if episode_id is not None:
+        checkpoint.save(db, episode_id, "embedded", {"chunks": len(chunk_ids), "embedded": done, "model": embedder.model_name})
+        db.commit()
+    return done
+
+
+def index_chunks(
+    db: Session,
+    chunk_ids: List[int],
+    index_manager: FaissIndexManager,
+    on_model_change: Optional[Callable[[str], None]] = None,
+) -> int:
+    """
+    流水线“索引”阶段：读取已存储的向量并追加到 FAISS 索引。
+    只写入与索引清单模型一致的向量；旧索引没有清单时以本批向量的模型登记。
+    向量模型与索引不一致（EMBED_MODEL 变更或模型兜底）时不写入，交给 on_model_change 启动重嵌入迁移，
+    这些块在影子索引切换后即可检索。已在索引中的块跳过，重试是幂等的。
+
+    参数:
+        db: 数据库会话。
+        chunk_ids: 待入索引的块ID。
+        index_manager: FAISS 索引管理器。
+        on_model_change: 发现新模型向量时的回调（参数为模型名）。
+    返回值:
+        写入索引的向量数量。
+    """
+    rows = (
+        db.query(Chunk.id, Chunk.embedding, Chunk.embed_model)
+        .filter(Chunk.id.in_(chunk_ids), Chunk.embedding.isnot(None))
+        .order_by(Chunk.id).all()
+    )
+    if not rows:
+        return 0
+    if index_manager.model is None:
+        index_manager.manifest["model"] = next((m for _, _, m in rows if m), None)
+    serving = index_manager.model
+    matched = [(cid, emb) for cid, emb, m in rows if m is None or serving is None or m == serving]
+    foreign = {m for _, _, m in rows if m and serving and m != serving}
+    if foreign and on_model_change is not None:
+        for m in foreign:
+            on_model_change(m)
+    if not matched:
+        return 0
+    vectors = np.vstack([np.frombuffer(emb, dtype="float32") for _, emb in matched])
+    try:
+        index_manager.load(dim=vectors.shape[1])
+    except IndexModelMismatch:
+        # 旧索引没有清单且维度不同：整体迁移到本批向量的模型
+        model = next((m for _, _, m in rows if m), None)
+        if model and on_model_change is not None:
+            on_model_change(model)
+        return 0
+    # 重试或对账时跳过已在索引中的块，避免重复向量
+    present = set(index_manager.id_map)
+    keep = [i for i, (cid, _) in enumerate(matched) if cid not in present]
+    if len(keep) < len(matched):
+        matched = [matched[i] for i in keep]
+        vectors = vectors[keep]
+    if not matched:
+        return 0
+    if index_manager.needs_training:
+        # 压缩或聚类索引首次写入：投影与量化参数从数据库抽样学习，而不只是本节目的几十个块
+        with metrics.stage("index_train", index_type=index_manager.index_type):
+            train_from_db(db, index_manager, vectors)
+    with metrics.stage("index_write", index_type=index_manager.index_type):
+        index_manager.add_vectors(vectors, [cid for cid, _ in matched])
+    metrics.inc("cognito_vectors_indexed_total", len(matched), index_type=index_manager.index_type)
+    return len(matched)
+
+
+def index_chunks_sharded(
+    db: Session,
+    chunk_ids: List[int],
+    on_model_change: Optional[Callable[[str], None]] = None,
+    root: Optional[str] = None,
+) -> int:
+    """
+    按块所属知识库与节目所属分片分组后逐个分片执行索引阶段（默认知识库且单分片时等同 index_chunks）。
+
+    参数:
+        db: 数据库会话。
+        chunk_ids: 待入索引的块ID。
+        on_model_change: 见 index_chunks。
+        root: 索引代目录，默认当前服务中的代。
+    返回值:
+        写入索引的向量数量。
+    """
+    if not chunk_ids:
+        return 0
+    by_collection: dict = {}
+    for cid, episode_id, collection in (
+        db.query(Chunk.id, Chunk.episode_id, Chunk.collection).filter(Chunk.id.in_(chunk_ids)).order_by(Chunk.id).all()
+    ):
+        by_collection.setdefault(collection or DEFAULT_COLLECTION, []).append((cid, episode_id))
+    added = 0
+    for collection, rows in by_collection.items():
+        index = ShardedIndex(root=root, collection=collection)
+        index.ensure_layout()
+        for shard, ids in group_by_shard(rows, index.shards).items():
+            added += index_chunks(db, ids, index.manager(shard), on_model_change)
+    return added
+
+
 def process_transcript(db: Session, episode_id: int, transcript_text: str, index_manager: FaissIndexManager, embedder: Embedder) -> Task:
     """
-    处理转录文本：清洗→分块→入库→嵌入→更新FAISS索引。
+    同步执行完整处理：清洗→分块→入库→嵌入→更新FAISS索引。
+    Celery 流水线按阶段拆分执行（见 tasks.py），此函数用于脚本与内联场景。
+    失败后以同一文本再次调用时从检查点继续（已提交的块不会重复插入，已有向量不会重算）。
 
     参数:
         db: 数据库会话。
@@ -101,37 +306,20 @@ def process_transcript(db: Session, episode_id: int, transcript_text: str, index
     db.refresh(task)
 
     try:
-        cleaned = simple_clean(transcript_text)
-        blocks = semantic_chunk(cleaned)
+        chunk_ids = chunk_transcript(db, episode_id, transcript_text)
+        if checkpoint.latest(db, episode_id) != "indexed":
+            embed_chunks(db, chunk_ids, embedder, episode_id=episode_id)
+            index_chunks(db, chunk_ids, index_manager)
+            checkpoint.save(db, episode_id, "indexed", {"chunks": len(chunk_ids)})
+        summarize_episode(db, episode_id)
 
         episode = db.query(Episode).get(episode_id)
-        if not episode:
-            raise ValueError("节目不存在")
-
-        created_chunks: List[Chunk] = []
-        for b in blocks:
-            c = Chunk(episode_id=episode_id, text=b)
-            db.add(c)
-            created_chunks.append(c)
-        db.commit()
-        for c in created_chunks:
-            db.refresh(c)
-
-        try:
-            vectors = embedder.embed_texts([c.text for c in created_chunks])
-            index_manager.load(dim=vectors.shape[1])
-            index_manager.add_vectors(vectors, [c.id for c in created_chunks])
-        except Exception:
-            pass
-
-        # 生成摘要占位
-        ep_summary = _simple_summarize(cleaned)
-        episode.summary = ep_summary
         episode.status = "processed"
         db.add(episode)
         task.status = "succeeded"
-        task.message = f"已处理 {len(created_chunks)} 个块"
+        task.message = f"已处理 {len(chunk_ids)} 个块"
     except Exception as e:
+        db.rollback()
         task.status = "failed"
         task.message = str(e)
     finally:
@@ -139,4 +327,4 @@ def process_transcript(db: Session, episode_id: int, transcript_text: str, index
         db.add(task)
         db.commit()
         db.refresh(task)
-    return task
\ No newline at end of file
+    return task
@@ -0,0 +1,131 @@
+"""
+任务进度推送：中间状态只写 Redis（哈希保存最新状态 + pub/sub 广播），终态才落库。
+
+- publish: 更新任务最新状态并广播事件；Redis 不可用时返回 False，由调用方回退写库。
+- get_state: 读取 Redis 中的最新状态。
+- task_snapshot: 查询接口使用，优先 Redis，缺失时读数据库。
+- channel: 任务事件频道名（SSE 端点订阅）。
+"""
+import json
+import os
+import time
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models import Task
+from ..redis_client import get_redis
+
+
+TERMINAL_STATUSES = {"completed", "succeeded", "failed"}
+TASK_STATE_TTL = int(os.getenv("TASK_STATE_TTL", str(24 * 3600)))
+
+
+def _state_key(task_id: int) -> str:
+    return f"task:state:{task_id}"
+
+
+def channel(task_id: int) -> str:
+    """任务事件频道名。"""
+    return f"task:events:{task_id}"
+
+
+def publish(task_id: int, status: str, message: str, episode_id: Optional[int] = None, **extra) -> bool:
+    """
+    写入任务最新状态并广播。
+
+    参数:
+        task_id: 任务ID。
+        status: 状态。
+        message: 状态说明。
+        episode_id: 关联节目（可选）。
+        extra: 其它需要保存在状态中的字段（如 type、parent_id）。
+    返回值:
+        是否写入成功。
+    """
+    state = {"id": task_id, "status": status, "message": message, "updated_at": time.time()}
+    if episode_id is not None:
+        state["episode_id"] = episode_id
+    state.update({k: v for k, v in extra.items() if v is not None})
+    try:
+        r = get_redis()
+        pipe = r.pipeline()
+        pipe.hset(_state_key(task_id), mapping={k: json.dumps(v, ensure_ascii=False) for k, v in state.items()})
+        pipe.expire(_state_key(task_id), TASK_STATE_TTL)
+        pipe.publish(channel(task_id), json.dumps(state, ensure_ascii=False))
+        pipe.execute()
+        return True
+    except Exception:
+        return False
+
+
+def notify(task_id: int, event: dict) -> None:
+    """
+    仅广播事件、不改变状态（如批量任务的子任务完成通知）。
+    """
+    try:
+        get_redis().publish(channel(task_id), json.dumps(event, ensure_ascii=False))
+    except Exception:
+        pass
+
+
+def init_task(task: Task) -> None:
+    """
+    新建任务后写入初始状态（含类型），使后续查询无需读库即可区分任务类型。
+    """
+    publish(task.id, task.status, task.message or "", task.episode_id, type=task.type, parent_id=task.parent_id)
+
+
+def get_state(task_id: int) -> Optional[dict]:
+    """
+    读取 Redis 中任务的最新状态；不存在或 Redis 不可用时返回 None。
+    """
+    try:
+        raw = get_redis().hgetall(_state_key(task_id))
+    except Exception:
+        return None
+    if not raw:
+        return None
+    return {k.decode(): json.loads(v) for k, v in raw.items()}
+
+
+def children_progress(db: Session, parent_id: int) -> dict:
+    """
+    聚合子任务状态（走 parent_id+status 索引的 GROUP BY，不加载子任务行）。
+    中间状态只保存在 Redis，数据库中未结束的子任务统一视为进行中。
+    """
+    rows = db.query(Task.status, func.count(Task.id)).filter(Task.parent_id == parent_id).group_by(Task.status).all()
+    by_status = {status: count for status, count in rows}
+    total = sum(by_status.values())
+    done = sum(c for s, c in by_status.items() if s in TERMINAL_STATUSES)
+    return {
+        "total": total,
+        "done": done,
+        "failed": by_status.get("failed", 0),
+        "by_status": by_status,
+    }
+
+
+def task_snapshot(db: Session, task_id: int) -> Optional[dict]:
+    """
+    返回任务当前状态：优先读取 Redis 最新状态，缺失时读数据库；批量任务附带子任务聚合进度。
+
+    参数:
+        db: 数据库会话（仅在需要时使用）。
+        task_id: 任务ID。
+    返回值:
+        状态字典；任务不存在时返回 None。
+    """
+    state = get_state(task_id)
+    if state is None:
+        t = db.query(Task).get(task_id)
+        if not t:
+            return None
+        state = {"id": t.id, "status": t.status, "message": t.message, "episode_id": t.episode_id, "type": t.type}
+    out = {"id": state["id"], "status": state["status"], "message": state.get("message"), "episode_id": state.get("episode_id")}
+    if state.get("type") == "intake_bulk":
+        progress = children_progress(db, task_id)
+        out["progress"] = progress
+        # 最后一个子任务结束时父任务落库为 completed；写入之前的短暂窗口内按子任务进度推断
+        if out["status"] == "running" and progress["done"] == progress["total"]:
+            out["status"] = "completed"
+    return out
@@ -0,0 +1,230 @@
+"""
+常见问答（FAQ）：从节目内容抽取问答对写入 QA 表，问题向量构成每个知识库一个的小型问答索引；
+/query 先在问答索引中匹配，相似度不低于 QA_MATCH_THRESHOLD 时直接返回已存储的答案，不再走块检索。
+
+- 块内问答：讲者自问自答（“为什么……？”后接解释）。问句之后的句子拼接为答案
+  （QA_ANSWER_MIN_CHARS ~ QA_ANSWER_MAX_CHARS 字符）。
+- 弹幕问题：同一节目中规整后出现至少 QA_DANMAKU_MIN_COUNT 次的观众问题，以问题向量在本节目的块向量中找最相近的块，
+  相似度不低于 QA_DANMAKU_MIN_SCORE 时摘录块内与问题最匹配的句子窗口作答。
+  转录本身来自弹幕的节目不抽取（此时块是观众评论，而不是讲者的回答）。
+- 问答索引：INDEX_DIR/qa/<知识库>/，Flat 内积索引（问题数量小，检索为亚毫秒级），由 index 队列整体重建；
+  清单记录问题向量的模型，与查询模型不一致时跳过匹配（模型迁移期间直接走块检索）。
+"""
+import os
+import re
+import shutil
+from collections import Counter
+from typing import List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from sqlalchemy.orm import Session
+from ..models import QA, Chunk, Episode
+from .embedder import INDEX_DIR, FaissIndexManager
+from .index_cache import IndexCache
+from .rerank import best_snippet
+from .summarizer import split_sentences
+from . import metrics
+
+
+QA_MATCH_THRESHOLD = float(os.getenv("QA_MATCH_THRESHOLD", "0.9"))
+QA_ANSWER_MIN_CHARS = int(os.getenv("QA_ANSWER_MIN_CHARS", "40"))
+QA_ANSWER_MAX_CHARS = int(os.getenv("QA_ANSWER_MAX_CHARS", "300"))
+QA_DANMAKU_MIN_COUNT = int(os.getenv("QA_DANMAKU_MIN_COUNT", "3"))
+QA_DANMAKU_MIN_SCORE = float(os.getenv("QA_DANMAKU_MIN_SCORE", "0.5"))
+QA_EMBED_BATCH = 64
+
+_QUESTION_MIN_CHARS, _QUESTION_MAX_CHARS = 4, 120
+_QUESTION_END = re.compile(r"[?？]\s*$")
+_QUESTION_WORDS = re.compile(
+    r"^(?:为什么|为啥|怎么|怎样|如何|什么|哪|是否|能不能|可不可以|有没有|要不要|是不是)|(?:吗|呢|么)[。.!！]?\s*$"
+    r"|^(?:how|what|why|when|where|which|who|can|could|should|does|do|is|are)\b",
+    re.I,
+)
+_DANMAKU_NOISE = re.compile(r"[\s　]+|[?？!！。.~～]+$")
+
+_cache = IndexCache(name="qa")
+
+
+def is_question(sentence: str) -> bool:
+    """问号结尾，或以疑问词开头、以语气词“吗/呢/么”结尾的句子。"""
+    s = sentence.strip()
+    if not _QUESTION_MIN_CHARS <= len(s) <= _QUESTION_MAX_CHARS:
+        return False
+    return bool(_QUESTION_END.search(s) or _QUESTION_WORDS.search(s))
+
+
+def extract_from_text(text: str) -> List[Tuple[str, str]]:
+    """
+    抽取块内的自问自答。
+
+    参数:
+        text: 块文本。
+    返回值:
+        [(问题, 答案)]；问句后紧跟的非问句拼接为答案，过短的丢弃。
+    """
+    sentences = split_sentences(text)
+    pairs = []
+    i = 0
+    while i < len(sentences):
+        if not is_question(sentences[i]):
+            i += 1
+            continue
+        answer, j = [], i + 1
+        while j < len(sentences) and not is_question(sentences[j]):
+            if answer and sum(len(a) for a in answer) + len(sentences[j]) > QA_ANSWER_MAX_CHARS:
+                break
+            answer.append(sentences[j])
+            j += 1
+        text_answer = " ".join(answer)[:QA_ANSWER_MAX_CHARS]
+        if len(text_answer) >= QA_ANSWER_MIN_CHARS:
+            pairs.append((sentences[i].strip(), text_answer))
+        i = j
+    return pairs
+
+
+def popular_questions(lines: List[str], min_count: int = QA_DANMAKU_MIN_COUNT) -> List[Tuple[str, int]]:
+    """
+    弹幕中的高频问题（去空白与结尾标点后计数）。
+
+    返回值:
+        [(问题, 出现次数)]，按次数降序。
+    """
+    counts: Counter = Counter()
+    display: dict = {}
+    for line in lines:
+        if not is_question(line):
+            continue
+        key = _DANMAKU_NOISE.sub("", line.lower())
+        if len(key) < _QUESTION_MIN_CHARS:
+            continue
+        counts[key] += 1
+        display.setdefault(key, line.strip())
+    return [(display[k], n) for k, n in counts.most_common() if n >= min_count]
+
+
+def _embed(embedder, texts: List[str]) -> np.ndarray:
+    parts = [embedder.embed_texts(texts[i:i + QA_EMBED_BATCH]) for i in range(0, len(texts), QA_EMBED_BATCH)]
+    return np.vstack(parts).astype("float32")
+
+
+def extract_episode_qa(db: Session, episode_id: int, embedder, danmaku_lines: Optional[List[str]] = None) -> int:
+    """
+    抽取节目的问答对并写入 QA 表（替换该节目之前自动抽取的问答，手工录入的保留），问题向量一并存储。
+
+    参数:
+        db: 数据库会话。
+        episode_id: 节目ID。
+        embedder: 与问答索引一致的嵌入器（当前服务索引的模型）。
+        danmaku_lines: 节目的弹幕文本行；为空时只抽取块内问答。
+    返回值:
+        写入的问答数量。
+    """
+    episode = db.query(Episode).get(episode_id)
+    if episode is None:
+        return 0
+    chunks = (
+        db.query(Chunk)
+        .filter(Chunk.episode_id == episode_id, Chunk.canonical_chunk_id.is_(None))
+        .order_by(Chunk.id).all()
+    )
+    items: List[dict] = []
+    for c in chunks:
+        for q, a in extract_from_text(c.text):
+            items.append({"question": q, "answer": a, "source": "chunk", "chunk_id": c.id, "weight": 1})
+
+    popular = popular_questions(danmaku_lines or [])
+    embedded = [c for c in chunks if c.embedding is not None and c.embed_model in (None, embedder.model_name)]
+    if popular and embedded:
+        q_vecs = _embed(embedder, [q for q, _ in popular])
+        c_vecs = np.vstack([np.frombuffer(c.embedding, dtype="float32") for c in embedded])
+        q_vecs /= np.linalg.norm(q_vecs, axis=1, keepdims=True) + 1e-12
+        c_vecs = c_vecs / (np.linalg.norm(c_vecs, axis=1, keepdims=True) + 1e-12)
+        sims = q_vecs @ c_vecs.T
+        for (q, n), row in zip(popular, sims):
+            best = int(np.argmax(row))
+            if row[best] >= QA_DANMAKU_MIN_SCORE:
+                c = embedded[best]
+                items.append({"question": q, "answer": best_snippet(c.text, q, QA_ANSWER_MAX_CHARS),
+                              "source": "danmaku", "chunk_id": c.id, "weight": n})
+
+    db.query(QA).filter(QA.episode_id == episode_id, QA.source.isnot(None)).delete(synchronize_session=False)
+    if items:
+        vectors = _embed(embedder, [it["question"] for it in items])
+        db.add_all(
+            QA(episode_id=episode_id, collection=episode.collection, embedding=v.tobytes(), embed_model=embedder.model_name, **it)
+            for it, v in zip(items, vectors)
+        )
+    db.commit()
+    metrics.inc("cognito_qa_extracted_total", len(items))
+    logger.info(f"节目 {episode_id}: 抽取问答 {len(items)} 条（弹幕高频问题 {len(popular)} 个）")
+    return len(items)
+
+
+def reembed_questions(db: Session, embedder, batch: int = 256) -> int:
+    """把非当前模型的问题向量（含手工录入、尚无向量的问答）重算为 embedder 的模型，返回处理数量。"""
+    total, last = 0, 0
+    while True:
+        rows = (
+            db.query(QA)
+            .filter(QA.id > last, (QA.embed_model.is_(None)) | (QA.embed_model != embedder.model_name))
+            .order_by(QA.id).limit(batch).all()
+        )
+        if not rows:
+            return total
+        for qa, v in zip(rows, _embed(embedder, [qa.question for qa in rows])):
+            qa.embedding = v.tobytes()
+            qa.embed_model = embedder.model_name
+        db.commit()
+        total += len(rows)
+        last = rows[-1].id
+
+
+def qa_index_dir(collection: str) -> str:
+    return os.path.join(INDEX_DIR, "qa", collection)
+
+
+def build_qa_index(db: Session, collection: str, model: str) -> int:
+    """
+    整体重建知识库的问答索引（只含该模型的问题向量），须在 index 队列中执行。
+
+    返回值:
+        索引中的问题数量；没有问答时删除索引目录。
+    """
+    import faiss
+    rows = (
+        db.query(QA.id, QA.embedding)
+        .filter(QA.collection == collection, QA.embed_model == model, QA.embedding.isnot(None))
+        .order_by(QA.id).all()
+    )
+    path = qa_index_dir(collection)
+    if not rows:
+        shutil.rmtree(path, ignore_errors=True)
+        return 0
+    vectors = np.vstack([np.frombuffer(emb, dtype="float32") for _, emb in rows])
+    manager = FaissIndexManager(base_dir=path, factory="Flat", search_params="")
+    manager.manifest = {"model": model, "kind": "qa"}
+    manager.index = faiss.IndexFlatIP(vectors.shape[1])
+    manager.id_map = []
+    manager.add_vectors(vectors, [qid for qid, _ in rows])
+    metrics.set_gauge("cognito_qa_index_size", len(rows), collection=collection)
+    return len(rows)
+
+
+def match(collection: str, vec: np.ndarray, model: Optional[str]) -> Optional[Tuple[int, float]]:
+    """
+    在知识库的问答索引中匹配查询向量。
+
+    参数:
+        collection: 知识库名称。
+        vec: 查询向量 (1, d)（不修改）。
+        model: 查询向量的模型名。
+    返回值:
+        (QA ID, 相似度)；没有问答索引、模型不一致或相似度低于 QA_MATCH_THRESHOLD 时返回 None。
+    """
+    manager = _cache.get(qa_index_dir(collection))
+    if manager is None or manager.model != model or manager.index.d != vec.shape[1]:
+        return None
+    results = manager.search(vec.copy(), 1)
+    if results and results[0][1] >= QA_MATCH_THRESHOLD:
+        return results[0]
+    return None
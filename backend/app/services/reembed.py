@@ -0,0 +1,215 @@
+"""
+嵌入模型变更后的后台重嵌入迁移。
+
+流程（旧索引在迁移期间持续对外服务）:
+    1. start_generation: 为新模型创建索引代（清单状态 building）。同一模型只会有一个进行中的迁移。
+    2. reembed_step: 按主键顺序分批重算非新模型的向量并写回 Chunk（每次执行有限批数，由任务间隔节流），
+       进度（last_chunk_id）记录在清单中，worker 重启后从断点继续。
+    3. build_shadow: 全部向量就绪后，从数据库流式读取新模型向量构建影子索引（状态 built）。
+    4. cutover: 在 index 队列（单写者）中补齐构建期间新增的块，然后原子替换 CURRENT 指针（状态 active），
+       旧代标记为 retired 并保留一代以便回滚。
+
+每个知识库在代目录下有独立的索引（见 services/shards.py），构建与补齐逐个知识库进行，切换对全部知识库同时生效。
+模型不变时 start_generation(rebuild=True) 复用同一流程重建索引（例如修改分片数）：第 2 步没有需要重算的块，直接进入构建与切换。
+"""
+import os
+import time
+from typing import Optional
+import numpy as np
+from loguru import logger
+from sqlalchemy.orm import Session
+from ..models import Chunk
+from .embedder import (
+    INDEX_DIR, FaissIndexManager, current_generation, current_index_dir, new_generation,
+    read_manifest, set_current, write_manifest,
+)
+from .compression import train_from_db
+from .shards import DEFAULT_COLLECTION, INDEX_SHARDS, ShardedIndex
+from . import metrics
+
+
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "256"))
+REEMBED_BATCHES_PER_RUN = int(os.getenv("REEMBED_BATCHES_PER_RUN", "8"))
+REEMBED_INTERVAL_SECONDS = float(os.getenv("REEMBED_INTERVAL_SECONDS", "2"))
+# 构建影子索引时每批读取的向量数（需训练的索引在首批写入前用数据库抽样训练）
+SHADOW_BUILD_BATCH = int(os.getenv("SHADOW_BUILD_BATCH", "50000"))
+
+
+def generation_dir(generation: str) -> str:
+    return os.path.join(INDEX_DIR, generation)
+
+
+def pending_generation(model: str) -> Optional[str]:
+    """该模型进行中（building/embedded/built）的索引代，没有时返回 None。"""
+    if not os.path.isdir(INDEX_DIR):
+        return None
+    for name in sorted(os.listdir(INDEX_DIR), reverse=True):
+        path = generation_dir(name)
+        if not os.path.isdir(path):
+            continue
+        manifest = read_manifest(path)
+        if manifest.get("model") == model and manifest.get("status") in {"building", "embedded", "built"}:
+            return name
+    return None
+
+
+def start_generation(model: str, rebuild: bool = False) -> Optional[str]:
+    """
+    为新模型开始迁移。当前服务的索引已是该模型或已有进行中的迁移时返回 None。
+
+    参数:
+        model: 目标嵌入模型名。
+        rebuild: 模型不变时也新建一代（按当前 INDEX_SHARDS / FAISS_INDEX_FACTORY 重建，无需重算向量）。
+    返回值:
+        新建的索引代名称。
+    """
+    current = read_manifest(current_index_dir())
+    if (current.get("model") == model and not rebuild) or pending_generation(model):
+        return None
+    factory = os.getenv("FAISS_INDEX_FACTORY") or current.get("factory") or "Flat"
+    generation = new_generation(model, factory, shards=INDEX_SHARDS)
+    if rebuild:
+        logger.info(f"重建索引（{model}，{INDEX_SHARDS} 个分片），影子索引代 {generation}")
+    else:
+        logger.info(f"嵌入模型由 {current.get('model')} 变更为 {model}，开始后台重嵌入，影子索引代 {generation}")
+    metrics.inc("cognito_reembed_started_total", model=model)
+    return generation
+
+
+def reembed_step(db: Session, generation: str, embedder, batches: int = REEMBED_BATCHES_PER_RUN) -> bool:
+    """
+    执行有限批数的重嵌入。
+
+    参数:
+        db: 数据库会话。
+        generation: 索引代名称。
+        embedder: 目标模型的嵌入器。
+        batches: 本次最多处理的批数。
+    返回值:
+        是否已处理完全部块。
+    """
+    path = generation_dir(generation)
+    manifest = read_manifest(path)
+    model = manifest["model"]
+    last = manifest.get("last_chunk_id", 0)
+    for _ in range(batches):
+        rows = (
+            db.query(Chunk)
+            .filter(Chunk.id > last, Chunk.canonical_chunk_id.is_(None))
+            .order_by(Chunk.id).limit(REEMBED_BATCH_SIZE).all()
+        )
+        if not rows:
+            manifest["status"] = "embedded"
+            write_manifest(path, manifest)
+            return True
+        stale = [c for c in rows if c.embedding is None or c.embed_model != model]
+        if stale:
+            with metrics.stage("reembed", model=model):
+                vectors = embedder.embed_texts([c.text for c in stale])
+            for c, v in zip(stale, vectors):
+                c.embedding = v.astype("float32").tobytes()
+                c.embed_model = model
+                db.add(c)
+            db.commit()
+        last = rows[-1].id
+        manifest.update(last_chunk_id=last, reembedded=manifest.get("reembedded", 0) + len(stale))
+        write_manifest(path, manifest)
+        metrics.set_gauge("cognito_reembed_last_chunk_id", last, model=model)
+    return False
+
+
+def _collections(db: Session) -> list[str]:
+    """有块的知识库（默认知识库总在其中，保证新代的代目录清单与布局完整）。"""
+    names = {c for (c,) in db.query(Chunk.collection).distinct().all()}
+    return [DEFAULT_COLLECTION] + sorted(names - {DEFAULT_COLLECTION})
+
+
+def _shard_managers(db: Session, generation: str) -> list[tuple[str, int, int, FaissIndexManager]]:
+    """影子索引代各知识库、各分片的 (知识库, 分片, 分片数, 管理器)；分片清单未记录模型时继承代清单的模型。"""
+    managers = []
+    for collection in _collections(db):
+        index = ShardedIndex(root=generation_dir(generation), collection=collection)
+        index.ensure_layout()
+        managers.extend((collection, i, index.shards, index.manager(i)) for i in range(index.shards))
+    return managers
+
+
+def _add_from_db(
+    db: Session, manager: FaissIndexManager, after_id: int, shard: int = 0, shards: int = 1,
+    collection: str = DEFAULT_COLLECTION,
+) -> int:
+    """将 id > after_id、属于索引模型、该知识库且属于该分片的向量追加到索引（不落盘），返回扫描到的最大块ID。"""
+    last = after_id
+    while True:
+        query = db.query(Chunk.id, Chunk.embedding).filter(
+            Chunk.id > last, Chunk.embedding.isnot(None), Chunk.embed_model == manager.model,
+            Chunk.collection == collection,
+        )
+        if shards > 1:
+            query = query.filter(Chunk.episode_id % shards == shard)
+        rows = query.order_by(Chunk.id).limit(SHADOW_BUILD_BATCH).all()
+        if not rows:
+            return last
+        vectors = np.vstack([np.frombuffer(emb, dtype="float32") for _, emb in rows])
+        if manager.index is None:
+            manager.load(dim=vectors.shape[1], model=manager.model)
+        if manager.needs_training:
+            train_from_db(db, manager, vectors)
+        manager.add_vectors(vectors, [cid for cid, _ in rows], persist=False)
+        last = rows[-1][0]
+
+
+def build_shadow(db: Session, generation: str) -> int:
+    """
+    从数据库构建影子索引并落盘（状态 built）。逐个知识库、逐个分片构建，各分片记录自己的 built_through。
+
+    返回值:
+        影子索引中的向量数量。
+    """
+    start = time.perf_counter()
+    total = 0
+    for collection, i, shards, manager in _shard_managers(db, generation):
+        manager.manifest["built_through"] = _add_from_db(db, manager, 0, i, shards, collection)
+        manager.save()
+        total += len(manager.id_map)
+    path = generation_dir(generation)
+    manifest = read_manifest(path)
+    manifest.update(status="built", build_seconds=round(time.perf_counter() - start, 3))
+    write_manifest(path, manifest)
+    return total
+
+
+def cutover(db: Session, generation: str) -> int:
+    """
+    补齐影子索引构建后新增的块（包括构建后才出现的知识库）并原子切换 CURRENT。必须在 index 队列（单写者）中执行，
+    以保证切换前后没有并发的索引写入。
+
+    返回值:
+        切换后索引中的向量数量。
+    """
+    path = generation_dir(generation)
+    manifest = read_manifest(path)
+    if manifest.get("status") != "built":
+        raise RuntimeError(f"索引代 {generation} 尚未构建完成")
+    managers = _shard_managers(db, generation)
+    total = 0
+    for collection, i, shards, manager in managers:
+        if os.path.exists(manager.index_path):
+            manager.load(dim=manager.manifest["dim"], model=manager.model)
+        manager.manifest["built_through"] = _add_from_db(db, manager, manager.manifest.get("built_through", 0), i, shards, collection)
+        manager.save()
+        total += len(manager.id_map)
+    manifest = read_manifest(path)
+    manifest.update(status="active", activated_at=time.time())
+    write_manifest(path, manifest)
+
+    old_dir = current_index_dir()
+    old = read_manifest(old_dir)
+    if old_dir != path and (old or os.path.exists(os.path.join(old_dir, "faiss.index"))):
+        old["status"] = "retired"
+        write_manifest(old_dir, old)
+    previous = current_generation()
+    set_current(generation)
+    logger.info(f"索引已切换: {previous or '旧布局'} -> {generation}（{manifest['model']}，{len(managers)} 个分片索引，{total} 条向量）")
+    metrics.inc("cognito_index_cutover_total", model=manifest["model"])
+    return total
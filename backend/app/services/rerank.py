@@ -0,0 +1,87 @@
+"""
+检索结果重排与片段抽取。
+
+- mmr: 最大边际相关性（MMR）重排。在召回候选的向量矩阵上一次性计算相关度与两两相似度，
+  逐步选取“与问题相关且与已选结果不重复”的块，避免重复直播片段占满结果。
+- best_snippet: 在块内按句子滑动窗口匹配问题词，返回最相关的一段作为答案摘录。
+"""
+import os
+from typing import List
+import numpy as np
+from .summarizer import split_sentences, tokenize
+
+
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+QUERY_OVERFETCH = int(os.getenv("QUERY_OVERFETCH", "4"))
+SNIPPET_MAX_CHARS = int(os.getenv("SNIPPET_MAX_CHARS", "240"))
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=-1, keepdims=True), 1e-12)
+
+
+def mmr(query_vec: np.ndarray, candidates: np.ndarray, k: int, lambda_: float = MMR_LAMBDA) -> List[int]:
+    """
+    MMR 重排：score = λ·sim(q, d) − (1−λ)·max_{s∈已选} sim(d, s)。
+
+    参数:
+        query_vec: 问题向量，形状 (d,) 或 (1, d)。
+        candidates: 候选向量矩阵，形状 (n, d)。
+        k: 选取数量。
+        lambda_: 相关性与多样性的权衡（1 为纯相关性排序）。
+    返回值:
+        入选候选的下标，按选中顺序排列。
+    """
+    n = candidates.shape[0]
+    if n == 0:
+        return []
+    c = _normalize(candidates.astype("float32", copy=False))
+    q = _normalize(np.asarray(query_vec, dtype="float32").reshape(-1))
+    relevance = c @ q
+    pairwise = c @ c.T
+    selected: List[int] = []
+    # 每个候选与已选集合的最大相似度，随选取增量更新（每步只算一列）
+    max_sim = np.full(n, -np.inf, dtype="float32")
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        penalty = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        scores = lambda_ * relevance - (1 - lambda_) * penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, pairwise[:, best])
+    return selected
+
+
+def best_snippet(text: str, question: str, max_chars: int = SNIPPET_MAX_CHARS) -> str:
+    """
+    选取与问题词重叠最多的连续句子窗口（不超过 max_chars），无重叠时返回开头部分。
+
+    参数:
+        text: 块文本。
+        question: 用户问题。
+        max_chars: 摘录长度上限。
+    返回值:
+        摘录文本。
+    """
+    sentences = split_sentences(text)
+    q_tokens = tokenize(question)
+    if not sentences:
+        return text[:max_chars]
+    sent_tokens = [tokenize(s) & q_tokens for s in sentences]
+    best, best_score = None, 0.0
+    for i in range(len(sentences)):
+        covered: set = set()
+        length = 0
+        j = i
+        while j < len(sentences) and (j == i or length + len(sentences[j]) + 1 <= max_chars):
+            covered |= sent_tokens[j]
+            length += len(sentences[j]) + 1
+            j += 1
+        # 覆盖的不同问题词越多越好；同分时取更短的窗口
+        score = len(covered) - 1e-4 * length
+        if best is None or (covered and score > best_score):
+            best, best_score = (i, j), max(score, 0.0)
+    snippet = " ".join(sentences[best[0]:best[1]])
+    return snippet[:max_chars]
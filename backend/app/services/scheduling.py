@@ -0,0 +1,204 @@
+"""
+优先级与公平调度：交互式提交与批量回填（backfill）共用同一组队列时，交互式任务不应排在整批回填之后。
+
+- 优先级：Redis broker 按 PRIORITY_STEPS 为每个队列划分子队列，worker 总是先取高优先级（数值小）的消息。
+  单条提交、上传、手动转录与恢复为 interactive；批量摄入的子任务为 backfill；模型迁移、重建与对账也按 backfill 执行。
+  后续阶段（chain 的下一环、重试、摘要与问答抽取）继承所属任务的优先级。
+- 公平份额：批量摄入的子任务不直接入队，而是进入提交者的待调度列表（fairshare:pending:<用户>）；
+  dispatch 按“最久未被调度的用户优先”轮转放行，全局在途不超过 BACKFILL_MAX_INFLIGHT、
+  每个用户不超过 BACKFILL_USER_MAX_INFLIGHT。子任务到达终态时释放在途名额并再次调度；
+  worker 异常退出未释放的名额在 BACKFILL_LEASE_SECONDS 后回收（celery beat 周期调度兜底）。
+  回填在途数量有上限，各阶段 worker 始终留有余量处理交互式任务。
+- Redis 不可用时不做公平调度，子任务直接放行。
+
+函数:
+    enqueue_backfill(user, jobs): 把子任务加入用户的待调度列表。
+    take_backfill(): 按公平份额取出可以入队的子任务。
+    release(task_id): 子任务结束，释放在途名额。
+    record_queue_depths(): 采样各队列、各优先级的积压数量。
+"""
+import json
+import os
+import time
+from typing import List, Tuple
+from loguru import logger
+from ..redis_client import get_redis
+from . import metrics
+
+
+# 优先级（数值越小越先执行）；PRIORITY_STEPS 决定 Redis 中每个队列的子队列
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 3
+PRIORITY_BACKFILL = 6
+PRIORITY_STEPS = [PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKFILL, 9]
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_NORMAL: "normal", PRIORITY_BACKFILL: "backfill", 9: "low"}
+# broker 中优先级子队列的分隔符（队列名 + 分隔符 + 优先级；最高优先级即队列名本身）
+PRIORITY_SEP = ":"
+
+BACKFILL_MAX_INFLIGHT = int(os.getenv("BACKFILL_MAX_INFLIGHT", "16"))
+BACKFILL_USER_MAX_INFLIGHT = int(os.getenv("BACKFILL_USER_MAX_INFLIGHT", "4"))
+# 在途名额租约：覆盖一条回填子任务从下载到索引的最长耗时
+BACKFILL_LEASE_SECONDS = int(os.getenv("BACKFILL_LEASE_SECONDS", str(6 * 3600)))
+# 采样积压的队列（逗号分隔）
+QUEUE_DEPTH_QUEUES = [q.strip() for q in os.getenv("QUEUE_DEPTH_QUEUES", "download,cpu,gpu,embed,index").split(",") if q.strip()]
+
+_USERS_KEY = "fairshare:users"
+_OWNER_KEY = "fairshare:owner"
+_LOCK_KEY = "fairshare:lock"
+
+
+def priority_name(priority) -> str:
+    """优先级的指标标签；未设置优先级的消息按 normal 处理。"""
+    if priority is None:
+        return PRIORITY_NAMES[PRIORITY_NORMAL]
+    return PRIORITY_NAMES.get(int(priority), str(priority))
+
+
+def _pending_key(user: str) -> str:
+    return f"fairshare:pending:{user}"
+
+
+def _inflight_key(user: str) -> str:
+    return f"fairshare:inflight:{user}"
+
+
+def enqueue_backfill(user: str, jobs: List[dict]) -> bool:
+    """
+    把批量摄入的子任务加入用户的待调度列表（之后由 take_backfill 放行）。
+
+    参数:
+        user: 提交者（用户名）。
+        jobs: 子任务参数（须含 task_id）。
+    返回值:
+        是否写入成功；Redis 不可用时返回 False，由调用方直接入队。
+    """
+    if not jobs:
+        return True
+    try:
+        r = get_redis()
+        pipe = r.pipeline()
+        pipe.rpush(_pending_key(user), *(json.dumps(j, ensure_ascii=False) for j in jobs))
+        # 新用户从 0 分起排，优先于已经被调度过的用户
+        pipe.zadd(_USERS_KEY, {user: 0}, nx=True)
+        pipe.execute()
+        return True
+    except Exception as e:
+        logger.warning(f"公平调度不可用，子任务直接入队: {e}")
+        return False
+
+
+def take_backfill() -> List[dict]:
+    """
+    按公平份额取出可以入队的子任务：按用户最近一次被调度的时间轮转，每轮每个用户最多放行一条，
+    直到全局或各用户的在途名额用尽、或没有待调度的子任务。
+
+    返回值:
+        可以入队的子任务参数列表；另一进程正在调度或 Redis 不可用时返回空列表。
+    """
+    try:
+        r = get_redis()
+        # 调度过程不是原子操作，同一时间只允许一个调度者
+        if not r.set(_LOCK_KEY, "1", nx=True, ex=30):
+            return []
+    except Exception as e:
+        logger.warning(f"公平调度不可用: {e}")
+        return []
+    try:
+        now = time.time()
+        users = [u.decode() if isinstance(u, bytes) else u for u in r.zrange(_USERS_KEY, 0, -1)]
+        inflight = {}
+        for user in users:
+            key = _inflight_key(user)
+            expired = r.zrangebyscore(key, 0, now - BACKFILL_LEASE_SECONDS)
+            if expired:
+                r.zrem(key, *expired)
+                r.hdel(_OWNER_KEY, *expired)
+                logger.warning(f"回收用户 {user} 超时未释放的 {len(expired)} 个在途名额")
+            inflight[user] = r.zcard(key)
+        total = sum(inflight.values())
+
+        jobs: List[dict] = []
+        active = list(users)
+        while active and total < BACKFILL_MAX_INFLIGHT:
+            for user in list(active):
+                if total >= BACKFILL_MAX_INFLIGHT:
+                    break
+                if inflight[user] >= BACKFILL_USER_MAX_INFLIGHT:
+                    active.remove(user)
+                    continue
+                raw = r.lpop(_pending_key(user))
+                if raw is None:
+                    active.remove(user)
+                    if not inflight[user]:
+                        r.zrem(_USERS_KEY, user)
+                    continue
+                job = json.loads(raw)
+                token = str(job["task_id"])
+                r.zadd(_inflight_key(user), {token: now})
+                r.hset(_OWNER_KEY, token, user)
+                r.zadd(_USERS_KEY, {user: now + len(jobs) * 1e-6})
+                inflight[user] += 1
+                total += 1
+                jobs.append(job)
+        # 只导出汇总值：用户数不设上限，按用户打标签的仪表会在 metrics:gauge 中无限增长（用户离开后也不会清除）；
+        # 各用户的明细可直接查看 fairshare:* 键
+        pipe = r.pipeline()
+        for user in users:
+            pipe.llen(_pending_key(user))
+        pending = pipe.execute() if users else []
+        metrics.set_gauge("cognito_backfill_inflight", total)
+        metrics.set_gauge("cognito_backfill_pending", sum(pending))
+        metrics.set_gauge("cognito_backfill_users", sum(1 for u, n in zip(users, pending) if n or inflight[u]))
+        if jobs:
+            metrics.inc("cognito_backfill_dispatched_total", len(jobs))
+        return jobs
+    except Exception as e:
+        logger.warning(f"公平调度失败: {e}")
+        return []
+    finally:
+        try:
+            r.delete(_LOCK_KEY)
+        except Exception:
+            pass
+
+
+def release(task_id: int) -> bool:
+    """
+    子任务到达终态，释放其在途名额。
+
+    返回值:
+        是否释放了名额（非回填子任务返回 False）。
+    """
+    try:
+        r = get_redis()
+        token = str(task_id)
+        user = r.hget(_OWNER_KEY, token)
+        if user is None:
+            return False
+        user = user.decode() if isinstance(user, bytes) else user
+        pipe = r.pipeline()
+        pipe.zrem(_inflight_key(user), token)
+        pipe.hdel(_OWNER_KEY, token)
+        pipe.execute()
+        return True
+    except Exception:
+        return False
+
+
+def queue_key(queue: str, priority: int) -> str:
+    """队列某优先级在 broker 中的列表键。"""
+    return f"{queue}{PRIORITY_SEP}{priority}" if priority else queue
+
+
+def record_queue_depths() -> None:
+    """采样各队列、各优先级子队列中等待的消息数，写入 cognito_queue_depth{queue, priority}。"""
+    try:
+        r = get_redis()
+        pipe = r.pipeline()
+        keys = [(q, p) for q in QUEUE_DEPTH_QUEUES for p in PRIORITY_STEPS]
+        for q, p in keys:
+            pipe.llen(queue_key(q, p))
+        for (q, p), depth in zip(keys, pipe.execute()):
+            metrics.set_gauge("cognito_queue_depth", depth, queue=q, priority=priority_name(p))
+    except Exception as e:
+        logger.warning(f"队列积压采样失败: {e}")
@@ -0,0 +1,220 @@
+"""
+分片向量索引与 scatter-gather 检索。
+
+- 分片：按节目划分（episode_id % 分片数），同一节目的块总在同一分片，便于按节目重建与排查。
+  一代索引下每个分片一个子目录 shard-<i>/（各自的 faiss.index、meta.json、manifest.json）；
+  分片数为 1 时索引文件直接位于代目录，与未分片的布局完全一致。
+- 分片数记录在代目录清单的 shards 字段中，之后以清单为准；修改 INDEX_SHARDS 只对新建的索引代生效
+  （执行 rebuild_index 任务重建并原子切换）。
+- 知识库（collection）：每个知识库在代目录下有独立的索引（collections/<名称>/，其下再按分片划分），
+  默认知识库 default 直接使用代目录，与引入知识库之前的布局一致。检索只加载所查知识库的索引，
+  已加载的索引由 IndexCache 按 LRU 预算常驻内存。
+- 检索：配置 SHARD_ENDPOINTS 时并发请求各分片服务（shard_server.py，每个分片一个进程）；否则在本进程内
+  并发检索各分片。每个分片的 top_k 以堆合并为全局 top_k；超过 SHARD_TIMEOUT_MS 未返回或出错的分片被跳过，
+  返回其余分片的结果（降级而非失败）。
+"""
+import heapq
+import json
+import os
+import re
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from .embedder import FaissIndexManager, IndexModelMismatch, current_index_dir, read_manifest, write_manifest
+from .index_cache import IndexCache
+from . import metrics
+
+
+INDEX_SHARDS = max(1, int(os.getenv("INDEX_SHARDS", "1")))
+# 分片服务地址（按分片编号顺序，逗号分隔），为空时在本进程内检索
+SHARD_ENDPOINTS = [u.strip().rstrip("/") for u in os.getenv("SHARD_ENDPOINTS", "").split(",") if u.strip()]
+SHARD_TIMEOUT_MS = int(os.getenv("SHARD_TIMEOUT_MS", "500"))
+DEFAULT_COLLECTION = "default"
+# 知识库名称：用作目录名，限制为字母、数字、下划线与连字符
+COLLECTION_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
+_cache = IndexCache(name="api")
+
+_pool: ThreadPoolExecutor | None = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    # 超时的请求仍会占用线程直到返回，线程数留出余量
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=max(8, 4 * max(INDEX_SHARDS, len(SHARD_ENDPOINTS))), thread_name_prefix="shard")
+    return _pool
+
+
+def shard_of(episode_id: int, shards: int) -> int:
+    """节目所属的分片编号。"""
+    return episode_id % shards
+
+
+def shard_dir(base_dir: str, shard: int, shards: int) -> str:
+    """分片目录；单分片时即知识库目录本身。"""
+    return base_dir if shards == 1 else os.path.join(base_dir, f"shard-{shard}")
+
+
+def collection_dir(root: str, collection: str) -> str:
+    """知识库索引目录；默认知识库即代目录本身。"""
+    if not re.match(COLLECTION_PATTERN, collection):
+        raise ValueError(f"非法的知识库名称: {collection}")
+    return root if collection == DEFAULT_COLLECTION else os.path.join(root, "collections", collection)
+
+
+def layout_shards(base_dir: str, root: str | None = None) -> int:
+    """
+    目录的分片数：目录清单中已记录时以其为准，其次为代清单记录的分片数；已有未分片的索引文件时为 1；否则取 INDEX_SHARDS。
+    """
+    recorded = read_manifest(base_dir).get("shards") or (read_manifest(root).get("shards") if root and root != base_dir else None)
+    if recorded:
+        return int(recorded)
+    if os.path.exists(os.path.join(base_dir, "faiss.index")):
+        return 1
+    return INDEX_SHARDS
+
+
+def merge_topk(per_shard: List[List[Tuple[int, float]]], top_k: int) -> List[Tuple[int, float]]:
+    """合并各分片的 (chunk_id, score) 结果，按分数取全局前 top_k。"""
+    return heapq.nlargest(top_k, (r for results in per_shard for r in results), key=lambda r: r[1])
+
+
+class ShardedIndex:
+    """
+    一代索引中某个知识库的分片视图。
+
+    属性:
+        root: 代目录（默认当前服务中的代）。
+        collection: 知识库名称。
+        base_dir: 知识库索引目录。
+        shards: 分片数。
+        endpoints: 分片服务地址；为空时本地检索。
+    """
+
+    def __init__(self, root: str | None = None, collection: str = DEFAULT_COLLECTION, endpoints: Optional[List[str]] = None):
+        self.root = root or current_index_dir()
+        self.collection = collection
+        self.base_dir = collection_dir(self.root, collection)
+        self.manifest = read_manifest(self.base_dir)
+        self.shards = layout_shards(self.base_dir, self.root)
+        self.endpoints = SHARD_ENDPOINTS if endpoints is None else endpoints
+        if self.endpoints and len(self.endpoints) != self.shards:
+            logger.warning(f"SHARD_ENDPOINTS 数量 {len(self.endpoints)} 与分片数 {self.shards} 不一致，缺失的分片不会被检索")
+
+    def shard_dir(self, shard: int) -> str:
+        return shard_dir(self.base_dir, shard, self.shards)
+
+    def manager(self, shard: int) -> FaissIndexManager:
+        """分片的写入管理器；分片清单尚未记录模型时继承所属代的模型，避免新知识库以其他模型的向量建索引。"""
+        manager = FaissIndexManager(base_dir=self.shard_dir(shard))
+        model = self.model
+        if model and not manager.model:
+            manager.manifest["model"] = model
+        return manager
+
+    @property
+    def model(self) -> Optional[str]:
+        """索引对应的嵌入模型名：知识库清单、代清单，其次任一已写入分片的清单。"""
+        model = self.manifest.get("model")
+        if not model and self.root != self.base_dir:
+            model = read_manifest(self.root).get("model")
+        if model or self.shards == 1:
+            return model
+        for i in range(self.shards):
+            model = read_manifest(self.shard_dir(i)).get("model")
+            if model:
+                return model
+        return None
+
+    def ensure_layout(self) -> None:
+        """首次写入前在清单中记录分片数，之后修改 INDEX_SHARDS 不会改变已有索引的布局。"""
+        if "shards" not in self.manifest:
+            os.makedirs(self.base_dir, exist_ok=True)
+            self.manifest["shards"] = self.shards
+            write_manifest(self.base_dir, self.manifest)
+
+    def search(self, vec: np.ndarray, top_k: int, model: Optional[str] = None) -> Tuple[List[Tuple[int, float]], List[int]]:
+        """
+        并发检索全部分片并合并结果。
+
+        参数:
+            vec: 查询向量，形状 (1, d)。
+            top_k: 返回数量（每个分片各取 top_k）。
+            model: 查询向量的模型名；与分片索引不一致的分片视为失败。
+        返回值:
+            (合并后的 [(chunk_id, score)], 超时或失败的分片编号列表)。
+        """
+        if self.endpoints:
+            calls = {i: (_search_remote, (url, self.collection)) for i, url in enumerate(self.endpoints[: self.shards])}
+        else:
+            calls = {i: (_search_local, self.shard_dir(i)) for i in range(self.shards)}
+        if len(calls) == 1:
+            # 单分片不经线程池，与未分片时的开销一致
+            (i, (fn, target)), = calls.items()
+            try:
+                return fn(target, i, vec, top_k, model), []
+            except Exception as e:
+                logger.warning(f"分片 {i} 检索失败: {e}")
+                metrics.inc("cognito_shard_failures_total", shard=i, reason="error")
+                return [], [i]
+
+        futures = {_executor().submit(fn, target, i, vec.copy(), top_k, model): i for i, (fn, target) in calls.items()}
+        done, pending = wait(futures, timeout=SHARD_TIMEOUT_MS / 1000)
+        per_shard, failed = [], []
+        for fut, i in futures.items():
+            if fut in pending:
+                fut.cancel()
+                failed.append(i)
+                metrics.inc("cognito_shard_failures_total", shard=i, reason="timeout")
+                continue
+            try:
+                per_shard.append(fut.result())
+            except Exception as e:
+                logger.warning(f"分片 {i} 检索失败: {e}")
+                failed.append(i)
+                metrics.inc("cognito_shard_failures_total", shard=i, reason="error")
+        if failed:
+            logger.warning(f"分片 {sorted(failed)} 超时或失败，返回其余 {len(per_shard)} 个分片的结果")
+        return merge_topk(per_shard, top_k), sorted(failed)
+
+
+def search_loaded(manager: FaissIndexManager, vec: np.ndarray, top_k: int, model: Optional[str]) -> List[Tuple[int, float]]:
+    """在已加载的索引上检索，模型或维度与查询不一致时抛出 IndexModelMismatch。"""
+    if model and manager.model and model != manager.model:
+        raise IndexModelMismatch(f"索引模型 {manager.model} 与查询模型 {model} 不一致")
+    if vec.shape[1] != manager.index.d:
+        raise IndexModelMismatch(f"索引维度 {manager.index.d} 与查询维度 {vec.shape[1]} 不一致")
+    return manager.search(vec, top_k)
+
+
+def _search_local(path: str, shard: int, vec: np.ndarray, top_k: int, model: Optional[str]) -> List[Tuple[int, float]]:
+    start = time.perf_counter()
+    manager = _cache.get(path)
+    if manager is None:
+        return []
+    results = search_loaded(manager, vec, top_k, model)
+    metrics.observe("cognito_shard_search_seconds", time.perf_counter() - start, shard=shard, mode="local")
+    return results
+
+
+def _search_remote(target: tuple, shard: int, vec: np.ndarray, top_k: int, model: Optional[str]) -> List[Tuple[int, float]]:
+    url, collection = target
+    start = time.perf_counter()
+    body = json.dumps({"vector": vec[0].tolist(), "top_k": top_k, "model": model, "collection": collection}).encode("utf-8")
+    req = urllib.request.Request(f"{url}/search", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=SHARD_TIMEOUT_MS / 1000) as resp:
+        payload = json.load(resp)
+    metrics.observe("cognito_shard_search_seconds", time.perf_counter() - start, shard=shard, mode="remote")
+    return [(int(cid), float(score)) for cid, score in payload["results"]]
+
+
+def group_by_shard(rows: List[Tuple[int, int]], shards: int) -> Dict[int, List[int]]:
+    """按所属节目把 (chunk_id, episode_id) 分到各分片，返回 分片 -> 块ID列表（保持原顺序）。"""
+    groups: Dict[int, List[int]] = {}
+    for cid, episode_id in rows:
+        groups.setdefault(shard_of(episode_id, shards), []).append(cid)
+    return groups
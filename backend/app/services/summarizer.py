@@ -0,0 +1,315 @@
+"""
+分层抽取式摘要（map-reduce，完全本地运行，不依赖 LLM 服务）。
+
+- map：对每个块并行执行 TextRank，抽取块内关键句（level 0）。
+- reduce：按 SUMMARY_SECTION_CHUNKS 个连续块为一章节，对块摘要句再做 TextRank，并以块向量到章节质心的相似度加权（level 1）；
+  整期摘要从每个章节至少选一句，保证长节目的后半段内容同样被覆盖（level 2）。
+- 缓存：各层结果保存在 summary_nodes 表，节点指纹为输入内容（块文本 / 子节点指纹）的哈希。
+  复用时按指纹而不是位置查找：块被插入、删除或替换导致位置移动时，内容未变的块摘要不重算，
+  成员未变的章节同样复用；只重算受影响的块、所在章节与整期节点。
+
+函数:
+    split_sentences(text): 中英文分句。
+    tokenize(sentence): 句子词集合（检索片段抽取同样使用）。
+    textrank(sentences, k): 返回得分最高的 k 个句子下标（按原文顺序）。
+    summarize_episode(db, episode_id): 增量计算并写回 Episode.summary。
+"""
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Sequence
+import numpy as np
+from sqlalchemy.orm import Session
+from ..models import Chunk, Episode, SummaryNode
+from . import metrics
+
+
+# 算法版本号参与节点指纹，调整算法或参数后旧缓存自动失效
+SUMMARY_VERSION = "tr2"
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "800"))
+SUMMARY_SECTION_CHUNKS = int(os.getenv("SUMMARY_SECTION_CHUNKS", "8"))
+SUMMARY_CHUNK_SENTENCES = int(os.getenv("SUMMARY_CHUNK_SENTENCES", "2"))
+SUMMARY_SECTION_SENTENCES = int(os.getenv("SUMMARY_SECTION_SENTENCES", "3"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+
+LEVEL_CHUNK, LEVEL_SECTION, LEVEL_EPISODE = 0, 1, 2
+
+_SENT_SPLIT = re.compile(r"(?<=[。！？!?；;])\s*|(?<=\.)\s+")
+_TOKEN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+# ASR 文本常缺少标点，超长“句子”按固定窗口切开，避免整块被当作一句
+_MAX_SENTENCE_CHARS = 200
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    中英文分句；无标点的长段落按 _MAX_SENTENCE_CHARS 切分。
+
+    参数:
+        text: 输入文本。
+    返回值:
+        句子列表（去除空白）。
+    """
+    out: List[str] = []
+    for s in _SENT_SPLIT.split(text or ""):
+        s = s.strip()
+        while len(s) > _MAX_SENTENCE_CHARS:
+            out.append(s[:_MAX_SENTENCE_CHARS])
+            s = s[_MAX_SENTENCE_CHARS:].strip()
+        if s:
+            out.append(s)
+    return out
+
+
+def tokenize(sentence: str) -> set:
+    """词集合：英文按单词、中文按二元组（无需分词依赖）。"""
+    toks = set()
+    for tok in _TOKEN.findall(sentence.lower()):
+        if tok[0].isascii():
+            toks.add(tok)
+        else:
+            toks.update(tok[i:i + 2] for i in range(max(1, len(tok) - 1)))
+    return toks
+
+
+def textrank_scores(sentences: Sequence[str], damping: float = 0.85, iterations: int = 50) -> np.ndarray:
+    """
+    TextRank 句子得分：相似度为词重叠数 / (log|Si| + log|Sj|)，在句子图上做 PageRank。
+
+    参数:
+        sentences: 句子列表。
+    返回值:
+        与句子一一对应的得分数组。
+    """
+    n = len(sentences)
+    if n == 0:
+        return np.zeros(0)
+    if n == 1:
+        return np.ones(1)
+    token_sets = [tokenize(s) for s in sentences]
+    vocab = {t: i for i, t in enumerate(set().union(*token_sets))}
+    if not vocab:
+        return np.ones(n) / n
+    m = np.zeros((n, len(vocab)), dtype="float32")
+    for row, toks in enumerate(token_sets):
+        m[row, [vocab[t] for t in toks]] = 1.0
+    overlap = m @ m.T
+    log_len = np.log(np.maximum(m.sum(axis=1), 2.0))
+    w = overlap / (log_len[:, None] + log_len[None, :])
+    np.fill_diagonal(w, 0.0)
+    out_weight = w.sum(axis=1, keepdims=True)
+    # 孤立句子（与其它句子无重叠）均匀分配出边，避免整行为零
+    trans = np.where(out_weight > 0, w / np.where(out_weight > 0, out_weight, 1.0), 1.0 / n)
+    scores = np.ones(n) / n
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * (trans.T @ scores)
+        if np.abs(updated - scores).sum() < 1e-6:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+
+def textrank(sentences: Sequence[str], k: int, weights: Optional[np.ndarray] = None) -> List[int]:
+    """
+    选出得分最高的 k 个句子。
+
+    参数:
+        sentences: 句子列表。
+        k: 选取数量。
+        weights: 可选的逐句权重（与 TextRank 得分相乘）。
+    返回值:
+        入选句子的下标，按原文顺序排列。
+    """
+    if len(sentences) <= k:
+        return list(range(len(sentences)))
+    scores = textrank_scores(sentences)
+    if weights is not None:
+        scores = scores * weights
+    top = np.argsort(-scores, kind="stable")[:k]
+    return sorted(int(i) for i in top)
+
+
+def summarize_chunk(text: str, k: int = SUMMARY_CHUNK_SENTENCES) -> str:
+    """map 阶段：块内抽取 k 个关键句。"""
+    sentences = split_sentences(text)
+    return " ".join(sentences[i] for i in textrank(sentences, k))
+
+
+def _hash(*parts: str) -> str:
+    h = hashlib.sha1(SUMMARY_VERSION.encode())
+    for p in parts:
+        h.update(b"\x00")
+        h.update(p.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _centrality(embeddings: List[Optional[bytes]]) -> np.ndarray:
+    """
+    各块向量与章节质心的余弦相似度（映射到 [0.5, 1]，作为句子权重）。
+    只对有向量的块计算（重嵌入迁移期间维度不一致时取块数最多的维度），其余块取这些块的平均权重；
+    有向量的块不足两个时不加权（权重均为 1）。
+    """
+    weights = np.ones(len(embeddings))
+    sizes = [len(e) for e in embeddings if e is not None]
+    if len(sizes) < 2:
+        return weights
+    size = max(set(sizes), key=sizes.count)
+    scored = [i for i, e in enumerate(embeddings) if e is not None and len(e) == size]
+    if len(scored) < 2:
+        return weights
+    vecs = np.vstack([np.frombuffer(embeddings[i], dtype="float32") for i in scored])
+    vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    centroid = vecs.mean(axis=0)
+    centroid /= max(float(np.linalg.norm(centroid)), 1e-12)
+    scores = 0.75 + 0.25 * (vecs @ centroid)
+    weights[:] = scores.mean()
+    weights[scored] = scores
+    return weights
+
+
+def reduce_section(chunk_summaries: List[str], embeddings: List[Optional[bytes]], k: int = SUMMARY_SECTION_SENTENCES) -> str:
+    """
+    reduce 阶段（章节）：对章节内所有块摘要句做 TextRank，按所属块的中心度加权，选出 k 句。
+    """
+    sentences: List[str] = []
+    owner: List[int] = []
+    for i, summary in enumerate(chunk_summaries):
+        for s in split_sentences(summary):
+            sentences.append(s)
+            owner.append(i)
+    if not sentences:
+        return ""
+    weights = _centrality(embeddings)[owner]
+    return " ".join(sentences[i] for i in textrank(sentences, k, weights))
+
+
+def reduce_episode(section_summaries: List[str], max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """
+    reduce 阶段（整期）：先为每个章节选得分最高的一句（章节过多时按得分取舍），
+    预算仍有剩余再按全局得分补充，最后按原文顺序输出。
+    """
+    sentences: List[str] = []
+    owner: List[int] = []
+    for i, summary in enumerate(section_summaries):
+        for s in split_sentences(summary):
+            sentences.append(s)
+            owner.append(i)
+    if not sentences:
+        return ""
+    scores = textrank_scores(sentences)
+    order = [int(i) for i in np.argsort(-scores, kind="stable")]
+    best_per_section = {}
+    for i in order:
+        best_per_section.setdefault(owner[i], i)
+
+    chosen: set = set()
+    used = 0
+
+    def take(i: int) -> None:
+        nonlocal used
+        cost = len(sentences[i]) + 1
+        if i not in chosen and used + cost <= max_chars:
+            chosen.add(i)
+            used += cost
+
+    for i in sorted(best_per_section.values(), key=lambda i: -scores[i]):
+        take(i)
+    for i in order:
+        take(i)
+    if not chosen:
+        return sentences[order[0]][:max_chars]
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def _upsert(db: Session, nodes: dict, episode_id: int, level: int, position: int, source_hash: str, text: str, chunk_id: Optional[int] = None) -> None:
+    node = nodes.get((level, position))
+    if node is None:
+        node = SummaryNode(episode_id=episode_id, level=level, position=position)
+        nodes[(level, position)] = node
+    node.chunk_id = chunk_id
+    node.source_hash = source_hash
+    node.text = text
+    node.updated_at = datetime.utcnow()
+    db.add(node)
+
+
+def summarize_episode(db: Session, episode_id: int, workers: int = SUMMARY_WORKERS) -> str:
+    """
+    增量计算节目的分层摘要并写回 Episode.summary。指纹未变化的节点直接复用。
+
+    参数:
+        db: 数据库会话。
+        episode_id: 节目ID。
+        workers: map 阶段并行线程数（TextRank 的矩阵运算在 numpy 中释放 GIL）。
+    返回值:
+        整期摘要文本。
+    """
+    episode = db.query(Episode).get(episode_id)
+    if episode is None:
+        raise ValueError("节目不存在")
+    chunks = db.query(Chunk.id, Chunk.text, Chunk.embedding).filter(Chunk.episode_id == episode_id).order_by(Chunk.id).all()
+    if not chunks:
+        return episode.summary or ""
+    nodes = {(n.level, n.position): n for n in db.query(SummaryNode).filter(SummaryNode.episode_id == episode_id).all()}
+    # 已有结果按（层级, 指纹）查找；节点行仍按位置存放，位置移动时原地改写
+    cached = {(n.level, n.source_hash): n.text for n in nodes.values()}
+
+    # map：块级摘要，仅重算内容没有缓存的块
+    chunk_hashes = [_hash(text) for _, text, _ in chunks]
+    chunk_texts = [cached.get((LEVEL_CHUNK, h)) for h in chunk_hashes]
+    todo = {h: text for (_, text, _), h, cached_text in zip(chunks, chunk_hashes, chunk_texts) if cached_text is None}
+    with metrics.stage("summarize_map"):
+        if len(todo) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                computed_texts = dict(zip(todo, pool.map(summarize_chunk, todo.values())))
+        else:
+            computed_texts = {h: summarize_chunk(text) for h, text in todo.items()}
+    for i, h in enumerate(chunk_hashes):
+        if chunk_texts[i] is None:
+            chunk_texts[i] = computed_texts[h]
+        node = nodes.get((LEVEL_CHUNK, i))
+        if node is None or node.source_hash != h or node.chunk_id != chunks[i][0]:
+            _upsert(db, nodes, episode_id, LEVEL_CHUNK, i, h, chunk_texts[i], chunk_id=chunks[i][0])
+    metrics.inc("cognito_summary_nodes_total", len(todo), level="chunk", result="computed")
+    metrics.inc("cognito_summary_nodes_total", len(chunks) - len(todo), level="chunk", result="cached")
+
+    # reduce：章节级
+    section_hashes: List[str] = []
+    section_texts: List[str] = []
+    computed = 0
+    with metrics.stage("summarize_reduce"):
+        for pos, start in enumerate(range(0, len(chunks), SUMMARY_SECTION_CHUNKS)):
+            members = range(start, min(start + SUMMARY_SECTION_CHUNKS, len(chunks)))
+            # 中心度加权取决于哪些块已有向量（及其维度），一并计入指纹：向量写入后章节重算
+            h = _hash(*(f"{chunk_hashes[i]}:{len(chunks[i][2] or b'')}" for i in members))
+            text = cached.get((LEVEL_SECTION, h))
+            if text is None:
+                text = reduce_section([chunk_texts[i] for i in members], [chunks[i][2] for i in members])
+                computed += 1
+            node = nodes.get((LEVEL_SECTION, pos))
+            if node is None or node.source_hash != h:
+                _upsert(db, nodes, episode_id, LEVEL_SECTION, pos, h, text)
+            section_hashes.append(h)
+            section_texts.append(text)
+
+        # reduce：整期
+        h = _hash(str(SUMMARY_MAX_CHARS), *section_hashes)
+        node = nodes.get((LEVEL_EPISODE, 0))
+        if node is None or node.source_hash != h:
+            _upsert(db, nodes, episode_id, LEVEL_EPISODE, 0, h, reduce_episode(section_texts))
+            computed += 1
+    metrics.inc("cognito_summary_nodes_total", computed, level="reduce", result="computed")
+
+    # 块数减少时删除多余的节点
+    for (level, position), node in list(nodes.items()):
+        limit = {LEVEL_CHUNK: len(chunks), LEVEL_SECTION: len(section_hashes), LEVEL_EPISODE: 1}[level]
+        if position >= limit and node.id is not None:
+            db.delete(node)
+
+    episode.summary = nodes[(LEVEL_EPISODE, 0)].text
+    db.add(episode)
+    db.commit()
+    return episode.summary
+
@@ -0,0 +1,65 @@
+"""
+按主机限流：基于 Redis 为每个下载主机提供并发信号量与每分钟速率上限，避免批量摄入时无限并发调用 yt-dlp。
+
+函数:
+    acquire_host_slot(host, token): 尝试占用一个下载槽位，成功返回 True。
+    release_host_slot(host, token): 释放槽位。
+"""
+import os
+import time
+from loguru import logger
+from ..redis_client import get_redis
+
+
+HOST_CONCURRENCY = int(os.getenv("INTAKE_HOST_CONCURRENCY", "2"))
+HOST_RATE_PER_MIN = int(os.getenv("INTAKE_HOST_RATE_PER_MIN", "20"))
+# 槽位租约：worker 异常退出未释放时，超时后自动回收
+SLOT_LEASE_SECONDS = int(os.getenv("INTAKE_SLOT_LEASE_SECONDS", "1800"))
+
+
+def _slot_key(host: str) -> str:
+    return f"throttle:slots:{host}"
+
+
+def acquire_host_slot(host: str, token: str) -> bool:
+    """
+    占用主机下载槽位：先检查每分钟速率，再检查并发数。
+
+    参数:
+        host: 下载主机名（如 www.youtube.com）。
+        token: 占用者标识（通常为任务ID）。
+    返回值:
+        是否成功占用；Redis 不可用时放行。
+    """
+    try:
+        r = get_redis()
+        now = time.time()
+        slots = _slot_key(host)
+        pipe = r.pipeline()
+        pipe.zremrangebyscore(slots, 0, now - SLOT_LEASE_SECONDS)
+        pipe.zadd(slots, {token: now})
+        pipe.zrank(slots, token)
+        _, _, rank = pipe.execute()
+        if rank is None or rank >= HOST_CONCURRENCY:
+            r.zrem(slots, token)
+            return False
+        window = f"throttle:rate:{host}:{int(now // 60)}"
+        count = r.incr(window)
+        r.expire(window, 120)
+        if HOST_RATE_PER_MIN > 0 and count > HOST_RATE_PER_MIN:
+            r.zrem(slots, token)
+            return False
+        return True
+    except Exception as e:
+        logger.warning(f"限流不可用，直接放行: {e}")
+        return True
+
+
+def release_host_slot(host: str, token: str) -> None:
+    """
+    释放主机下载槽位。
+    """
+    try:
+        get_redis().zrem(_slot_key(host), token)
+    except Exception:
+        pass
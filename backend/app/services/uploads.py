@@ -0,0 +1,311 @@
+"""
+流式上传：按固定大小分块写盘并同步计算 SHA-256，内存占用与文件大小无关。
+
+- stream_to_file: 将异步字节流追加写入文件，超出上限时抛出 UploadTooLarge。
+- stream_multipart_to_file: 直接解析请求体的 multipart 流，只把文件字段写盘（不经 Starlette 先整体落盘再复制），
+  超出上限时立即中止。
+- 断点续传会话：create_session / load_session / save_session / session_part_path 以 JSON + .part 文件保存在 UPLOAD_TMP_DIR，
+  客户端按偏移量分段 PUT，断线后查询当前偏移量继续上传。
+- session_lock: 会话级文件锁（flock，跨进程有效），偏移量校验与追加写入在同一把锁内完成，同一会话的并发分段不会交错写入。
+- purge_stale_uploads: 删除超过 UPLOAD_SESSION_TTL 未活动的会话与残留临时文件（celery beat 周期执行）。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Optional, Tuple
+import aiofiles
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "data/audio")
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", os.path.join(UPLOAD_DIR, "incoming"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+ALLOWED_EXTS = {".mp3", ".mp4", ".wav", ".m4a"}
+# 断点续传会话与临时文件的保留时长（秒），超过后由周期任务清理
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+
+class UploadTooLarge(Exception):
+    """上传内容超过 UPLOAD_MAX_BYTES。"""
+
+
+class UploadBusy(Exception):
+    """同一会话正有另一个请求在写入或完成。"""
+
+
+class UploadFormError(Exception):
+    """请求体不是 multipart/form-data，或缺少文件字段。"""
+
+
+async def stream_to_file(chunks: AsyncIterator[bytes], path: str, start: int = 0, hasher=None, limit: int = UPLOAD_MAX_BYTES) -> int:
+    """
+    将字节流追加写入文件。
+
+    参数:
+        chunks: 异步字节块迭代器。
+        path: 目标文件路径（追加写入）。
+        start: 文件当前已有字节数，用于累计大小校验。
+        hasher: 可选的 hashlib 对象，写入时同步更新。
+        limit: 文件总大小上限。
+    返回值:
+        写入后的文件总字节数。
+    异常:
+        UploadTooLarge: 超出上限（已写入的部分由调用方清理）。
+    """
+    total = start
+    async with aiofiles.open(path, "ab") as out:
+        async for block in chunks:
+            if not block:
+                continue
+            total += len(block)
+            if total > limit:
+                raise UploadTooLarge()
+            if hasher is not None:
+                hasher.update(block)
+            await out.write(block)
+    return total
+
+
+async def stream_multipart_to_file(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    path: str,
+    field: str = "file",
+    hasher=None,
+    limit: int = UPLOAD_MAX_BYTES,
+    on_filename: Optional[Callable[[str], None]] = None,
+) -> Tuple[str, int]:
+    """
+    边接收边解析 multipart 请求体，把文件字段写入 path；其它字段丢弃。
+
+    参数:
+        chunks: 请求体的异步字节块迭代器（request.stream()）。
+        content_type: 请求的 Content-Type（含 boundary）。
+        path: 目标文件路径。
+        field: 文件字段名。
+        hasher: 可选的 hashlib 对象，写入时同步更新。
+        limit: 文件大小上限。
+        on_filename: 读到文件名时回调（可抛出异常拒绝上传，此时尚未写入文件内容）。
+    返回值:
+        (文件名, 字节数)。
+    异常:
+        UploadFormError: 请求体格式错误或缺少文件字段。
+        UploadTooLarge: 超出上限（已写入的部分由调用方清理）。
+    """
+    ctype, params = parse_options_header(content_type or "")
+    if ctype != b"multipart/form-data" or not params.get(b"boundary"):
+        raise UploadFormError("请求体须为 multipart/form-data")
+
+    # 解析器回调是同步的：先收集事件，每写入一块后再异步落盘
+    events: list = []
+    header = [b"", b""]
+    headers: dict = {}
+
+    def on_header_field(data, start, end):
+        header[0] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header[1] += data[start:end]
+
+    def on_header_end():
+        headers[header[0].lower()] = header[1]
+        header[0] = header[1] = b""
+
+    def on_headers_finished():
+        events.append(("headers", dict(headers)))
+        headers.clear()
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    filename: Optional[str] = None
+    in_file = False
+    total = 0
+    async with aiofiles.open(path, "wb") as out:
+        async for block in chunks:
+            if not block:
+                continue
+            parser.write(block)
+            for kind, payload in events:
+                if kind == "headers":
+                    _, disp = parse_options_header(payload.get(b"content-disposition", b""))
+                    if filename is None and disp.get(b"name") == field.encode() and b"filename" in disp:
+                        filename = disp[b"filename"].decode("utf-8", "replace")
+                        if on_filename is not None:
+                            on_filename(filename)
+                        in_file = True
+                elif kind == "data" and in_file:
+                    total += len(payload)
+                    if total > limit:
+                        raise UploadTooLarge()
+                    if hasher is not None:
+                        hasher.update(payload)
+                    await out.write(payload)
+                elif kind == "end":
+                    in_file = False
+            events.clear()
+        parser.finalize()
+    if filename is None:
+        raise UploadFormError(f"缺少文件字段 {field}")
+    return filename, total
+
+
+def new_tmp_path(suffix: str = ".part") -> str:
+    """返回临时目录下的新文件路径。"""
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    return os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}{suffix}")
+
+
+def hash_file(path: str) -> str:
+    """分块计算文件 SHA-256（断点续传完成时使用，避免跨请求保存哈希状态）。"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _session_meta_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_TMP_DIR, f"{upload_id}.json")
+
+
+def session_part_path(upload_id: str) -> str:
+    """断点续传会话的数据文件路径。"""
+    return os.path.join(UPLOAD_TMP_DIR, f"{upload_id}.part")
+
+
+def _session_lock_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_TMP_DIR, f"{upload_id}.lock")
+
+
+@contextmanager
+def session_lock(upload_id: str):
+    """
+    获取会话的独占锁（非阻塞，避免在事件循环中等待）。锁随文件描述符关闭释放，进程退出时由内核回收。
+
+    参数:
+        upload_id: 会话ID。
+    异常:
+        UploadBusy: 锁已被其它请求持有。
+    """
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    fd = os.open(_session_lock_path(upload_id), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy()
+        yield
+    finally:
+        os.close(fd)
+
+
+def create_session(filename: str, total_size: Optional[int], collection: str = "default") -> dict:
+    """
+    创建断点续传会话。
+
+    参数:
+        filename: 原始文件名。
+        total_size: 客户端声明的总大小（可选，用于完成时校验）。
+        collection: 完成后创建的节目所属知识库。
+    返回值:
+        会话信息字典。
+    """
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    session = {"upload_id": upload_id, "filename": filename, "total_size": total_size, "collection": collection}
+    open(session_part_path(upload_id), "wb").close()
+    save_session(session)
+    return session
+
+
+def save_session(session: dict) -> None:
+    """持久化会话元数据（先写临时文件再替换，避免中断时损坏）。"""
+    path = _session_meta_path(session["upload_id"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(session, f)
+    os.replace(tmp, path)
+
+
+def load_session(upload_id: str) -> Optional[dict]:
+    """读取会话元数据，不存在时返回 None。"""
+    if not upload_id.isalnum():
+        return None
+    path = _session_meta_path(upload_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def session_offset(upload_id: str) -> int:
+    """会话当前已接收的字节数（即下一段的起始偏移量）。"""
+    path = session_part_path(upload_id)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def drop_session(upload_id: str) -> None:
+    """删除会话元数据、残留数据文件与锁文件（调用方持有会话锁时，之后的请求会发现会话已不存在）。"""
+    for p in (_session_meta_path(upload_id), session_part_path(upload_id), _session_lock_path(upload_id)):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def purge_stale_uploads(max_age: float = UPLOAD_SESSION_TTL) -> int:
+    """
+    清理超过 max_age 秒未活动的断点续传会话（以元数据的修改时间为准，每次 PUT 都会更新），
+    以及不属于任何会话的残留临时文件（进程被杀死时未清理的整体上传等）。正在写入的会话（锁被持有）跳过。
+
+    参数:
+        max_age: 保留时长（秒）。
+    返回值:
+        删除的会话与文件数量。
+    """
+    if not os.path.isdir(UPLOAD_TMP_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(UPLOAD_TMP_DIR) as it:
+        entries = [e for e in it if e.is_file()]
+    sessions = {e.name[:-len(".json")] for e in entries if e.name.endswith(".json")}
+    for e in entries:
+        try:
+            if e.stat().st_mtime >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        stem = e.name.split(".", 1)[0]
+        if e.name.endswith(".json"):
+            try:
+                with session_lock(stem):
+                    drop_session(stem)
+                removed += 1
+            except UploadBusy:
+                pass
+        elif stem not in sessions:
+            try:
+                os.remove(e.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
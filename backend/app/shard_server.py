@@ -0,0 +1,68 @@
+"""
+分片检索服务：每个进程常驻加载一个分片编号下各知识库的 FAISS 索引，供 /query 并发检索（scatter-gather，见 services/shards.py）。
+
+启动（单机多进程示例，分片数与 INDEX_SHARDS 一致，地址按分片编号顺序写入 API 的 SHARD_ENDPOINTS）:
+
+    SHARD_ID=0 uvicorn backend.app.shard_server:app --port 8101
+    SHARD_ID=1 uvicorn backend.app.shard_server:app --port 8102
+
+索引在首次检索某知识库时加载，由 IndexCache 按 INDEX_CACHE_MAX_BYTES 做 LRU 淘汰；index 队列写入或切换代后，
+最多 INDEX_CACHE_CHECK_SECONDS 秒内按文件修改时间自动重新加载。
+服务不访问数据库；进程崩溃或变慢时 API 超时跳过该分片，返回其余分片的结果。
+"""
+import os
+from typing import List, Optional
+import numpy as np
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+from .services.embedder import IndexModelMismatch
+from .services.index_cache import IndexCache
+from .services.shards import COLLECTION_PATTERN, DEFAULT_COLLECTION, ShardedIndex, search_loaded
+
+
+SHARD_ID = int(os.getenv("SHARD_ID", "0"))
+
+app = FastAPI(title=f"Cognito shard {SHARD_ID}")
+_cache = IndexCache(name="shard")
+
+
+class SearchReq(BaseModel):
+    """分片检索请求：单个查询向量。"""
+    vector: List[float]
+    top_k: int = 10
+    model: Optional[str] = None
+    collection: str = Field(DEFAULT_COLLECTION, pattern=COLLECTION_PATTERN)
+
+
+def _shard_path(collection: str) -> str:
+    index = ShardedIndex(collection=collection, endpoints=[])
+    if SHARD_ID >= index.shards:
+        raise HTTPException(status_code=404, detail=f"知识库 {collection} 只有 {index.shards} 个分片")
+    return index.shard_dir(SHARD_ID)
+
+
+@app.post("/search")
+def search(req: SearchReq):
+    manager = _cache.get(_shard_path(req.collection))
+    if manager is None:
+        return {"shard": SHARD_ID, "results": []}
+    vec = np.asarray([req.vector], dtype="float32")
+    try:
+        results = search_loaded(manager, vec, req.top_k, req.model)
+    except IndexModelMismatch as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"shard": SHARD_ID, "results": results}
+
+
+@app.get("/health")
+def health(collection: str = DEFAULT_COLLECTION):
+    path = _shard_path(collection)
+    manager = _cache.get(path)
+    return {
+        "shard": SHARD_ID,
+        "collection": collection,
+        "path": path,
+        "model": manager.model if manager else None,
+        "count": int(manager.index.ntotal) if manager else 0,
+        "cache_bytes": _cache.total_bytes,
+    }
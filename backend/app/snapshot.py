@@ -0,0 +1,373 @@
+"""
+知识库快照：导出/导入节目、块（含时间戳与向量）与问答对，用于在环境之间迁移知识库或引导新副本，无需重新摄入。
+
+    python -m backend.app.snapshot export data/snapshots/kb-20261019 [--collection creator_a ...]
+    python -m backend.app.snapshot import data/snapshots/kb-20261019 [--no-index]
+
+快照目录:
+    manifest.json      格式版本、导出时间、向量模型与维度、索引类型与分片数、各表行数（最后写入，存在即表示导出完整）
+    episodes.parquet
+    chunks.parquet     embedding 为 fixed_size_list<float32, dim> 列，只含索引模型的向量，其余为空
+    qas.parquet        问答对，含问题向量（embedding 为 float32 字节）
+
+- 导出按主键分批流式读取、逐批写入 Parquet 行组，内存占用与总量无关；向量列直接包装 numpy 缓冲区构造。
+- 导入保留原主键（索引的 id 映射与近重复链接都引用块ID），目标库中主键区间已被占用时拒绝导入；
+  按批 executemany 插入，并由 simhash 重建近重复签名；问答对按知识库重建问答索引。随后逐批读取向量列，以 Arrow 缓冲区的视图写入新的索引代
+  （需训练的索引类型先用数据库抽样训练），最后原子切换 CURRENT。目标库导入前已有块时改为从数据库构建，包含已有块。
+- 导入应在 worker 停止时执行：切换索引等同于 index 队列的单写者操作。
+- 依赖 pyarrow（仅快照需要，按需导入）。
+"""
+import argparse
+import json
+import os
+import time
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+from .database import SessionLocal, init_engine
+from .logger import setup_logger
+from .models import QA, Chunk, ChunkSignature, Episode
+from .services import metrics, qa, reembed
+from .services.compression import train_from_db
+from .services.dedup import SIMHASH_MIN_CHARS, bands, to_unsigned
+from .services.embedder import FaissIndexManager, current_index_dir, new_generation, read_manifest, write_manifest
+from .services.shards import DEFAULT_COLLECTION, INDEX_SHARDS, ShardedIndex, shard_of
+
+
+SNAPSHOT_FORMAT = "cognito-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_BATCH = int(os.getenv("SNAPSHOT_BATCH", "10000"))
+
+_EPISODE_COLUMNS = ("id", "title", "file_path", "source_url", "source_key", "collection", "summary", "created_at", "status")
+_CHUNK_COLUMNS = ("id", "episode_id", "collection", "text", "start_time", "end_time", "embed_model", "simhash", "canonical_chunk_id")
+_QA_COLUMNS = ("id", "episode_id", "question", "answer", "source", "chunk_id", "weight", "collection", "embed_model", "embedding")
+
+
+def _pa():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("知识库快照需要 pyarrow：pip install pyarrow") from e
+    return pa, pq
+
+
+def _schemas(pa, dim: int) -> dict:
+    return {
+        "episodes": pa.schema([
+            ("id", pa.int64()), ("title", pa.string()), ("file_path", pa.string()), ("source_url", pa.string()),
+            ("source_key", pa.string()), ("collection", pa.string()), ("summary", pa.string()),
+            ("created_at", pa.timestamp("us")), ("status", pa.string()),
+        ]),
+        "chunks": pa.schema([
+            ("id", pa.int64()), ("episode_id", pa.int64()), ("collection", pa.string()), ("text", pa.string()),
+            ("start_time", pa.float64()), ("end_time", pa.float64()), ("embed_model", pa.string()),
+            ("simhash", pa.int64()), ("canonical_chunk_id", pa.int64()),
+            ("embedding", pa.list_(pa.float32(), dim)),
+        ]),
+        "qas": pa.schema([
+            ("id", pa.int64()), ("episode_id", pa.int64()), ("question", pa.string()), ("answer", pa.string()),
+            ("source", pa.string()), ("chunk_id", pa.int64()), ("weight", pa.int64()), ("collection", pa.string()),
+            ("embed_model", pa.string()), ("embedding", pa.binary()),
+        ]),
+    }
+
+
+def _index_model(db: Session) -> Tuple[Optional[str], int]:
+    """当前服务索引的模型与向量维度（旧索引没有清单时取最早的已存储向量）。"""
+    model = read_manifest(current_index_dir()).get("model")
+    query = db.query(Chunk.embedding, Chunk.embed_model).filter(Chunk.embedding.isnot(None))
+    if model:
+        query = query.filter(Chunk.embed_model == model)
+    row = query.order_by(Chunk.id).first()
+    if row is None:
+        return model, 0
+    return model or row[1], len(row[0]) // 4
+
+
+def _iter_rows(db: Session, entity, columns, filters, batch: int = SNAPSHOT_BATCH) -> Iterator[list]:
+    """按主键分批读取（键集分页，第一列须为 id）。"""
+    last = 0
+    while True:
+        rows = db.query(*columns).filter(entity.id > last, *filters).order_by(entity.id).limit(batch).all()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def _vector_array(pa, blobs: list, models: list, model: Optional[str], dim: int):
+    """把一批向量字节拼成 fixed_size_list 列；非索引模型或缺失的向量为空。"""
+    valid = np.array([b is not None and m == model and len(b) == 4 * dim for b, m in zip(blobs, models)], dtype=bool)
+    matrix = np.zeros((len(blobs), dim), dtype="float32")
+    idx = np.flatnonzero(valid)
+    if len(idx):
+        matrix[idx] = np.frombuffer(b"".join(blobs[i] for i in idx), dtype="float32").reshape(-1, dim)
+    values = pa.array(matrix.reshape(-1))
+    mask = None if valid.all() else pa.array(~valid)
+    return pa.FixedSizeListArray.from_arrays(values, dim, mask=mask)
+
+
+def _vectors(column, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    fixed_size_list 列的向量矩阵视图与有效位。
+
+    返回值:
+        (矩阵 (n, dim)，子数组没有空值时为 Arrow 缓冲区的只读视图；有效位 (n,))。
+    """
+    n = len(column)
+    valid = column.is_valid().to_numpy(zero_copy_only=False)
+    # values 不含父数组的偏移，按偏移截取
+    start = column.offset * dim
+    values = column.values.slice(start, n * dim)
+    matrix = values.to_numpy(zero_copy_only=values.null_count == 0).reshape(n, dim)
+    return matrix, valid
+
+
+def _write_parquet(pq, path: str, schema, tables: Iterator) -> int:
+    tmp = path + ".tmp"
+    rows = 0
+    with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+        for table in tables:
+            writer.write_table(table)
+            rows += table.num_rows
+    os.replace(tmp, path)
+    return rows
+
+
+def export_snapshot(db: Session, out_dir: str, collections: Optional[List[str]] = None) -> dict:
+    """
+    导出知识库快照。
+
+    参数:
+        db: 数据库会话。
+        out_dir: 输出目录（不存在时创建）。
+        collections: 只导出这些知识库；为空时导出全部。
+    返回值:
+        快照清单。
+    """
+    pa, pq = _pa()
+    os.makedirs(out_dir, exist_ok=True)
+    # 清单最后写入，覆盖已有快照时先删除旧清单，避免中断后留下“旧清单 + 新数据”
+    if os.path.exists(os.path.join(out_dir, "manifest.json")):
+        os.remove(os.path.join(out_dir, "manifest.json"))
+    start = time.perf_counter()
+    model, dim = _index_model(db)
+    schemas = _schemas(pa, dim)
+    ep_filters = [Episode.collection.in_(collections)] if collections else []
+    chunk_filters = [Chunk.collection.in_(collections)] if collections else []
+    qa_filters = [QA.collection.in_(collections)] if collections else []
+
+    def episode_tables():
+        cols = [getattr(Episode, c) for c in _EPISODE_COLUMNS]
+        for rows in _iter_rows(db, Episode, cols, ep_filters):
+            yield pa.Table.from_pylist([dict(zip(_EPISODE_COLUMNS, r)) for r in rows], schema=schemas["episodes"])
+
+    def chunk_tables():
+        cols = [getattr(Chunk, c) for c in _CHUNK_COLUMNS] + [Chunk.embedding]
+        n, model_col = len(_CHUNK_COLUMNS), _CHUNK_COLUMNS.index("embed_model")
+        for rows in _iter_rows(db, Chunk, cols, chunk_filters):
+            arrays = [pa.array([r[i] for r in rows], type=schemas["chunks"].field(i).type) for i in range(n)]
+            arrays.append(_vector_array(pa, [r[n] for r in rows], [r[model_col] for r in rows], model, dim))
+            yield pa.Table.from_arrays(arrays, schema=schemas["chunks"])
+
+    def qa_tables():
+        cols = [getattr(QA, c) for c in _QA_COLUMNS]
+        for rows in _iter_rows(db, QA, cols, qa_filters):
+            yield pa.Table.from_pylist([dict(zip(_QA_COLUMNS, r)) for r in rows], schema=schemas["qas"])
+
+    counts = {}
+    for table, tables in (("episodes", episode_tables()), ("chunks", chunk_tables()), ("qas", qa_tables())):
+        counts[table] = _write_parquet(pq, os.path.join(out_dir, f"{table}.parquet"), schemas[table], tables)
+        metrics.inc("cognito_snapshot_rows_total", counts[table], table=table, op="export")
+
+    index = read_manifest(current_index_dir())
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.time(),
+        "model": model,
+        "dim": dim,
+        "collections": collections,
+        "index": {k: index[k] for k in ("factory", "shards") if k in index},
+        "counts": counts,
+    }
+    write_manifest(out_dir, manifest)
+    logger.info(f"快照已导出到 {out_dir}: {counts}，用时 {time.perf_counter() - start:.1f}s")
+    return manifest
+
+
+def _check_free(db: Session, pq, path: str, entity) -> None:
+    """快照中的主键区间在目标库中必须空闲（保留原主键导入）。"""
+    ids = pq.read_table(path, columns=["id"]).column("id")
+    if len(ids) == 0:
+        return
+    lo, hi = int(ids.to_numpy().min()), int(ids.to_numpy().max())
+    taken = db.query(func.count(entity.id)).filter(entity.id.between(lo, hi)).scalar()
+    if taken:
+        raise ValueError(f"目标库 {entity.__tablename__} 中主键 {lo}..{hi} 区间已有 {taken} 行，无法保留原主键导入")
+
+
+def _insert_batches(db: Session, pq, path: str, entity, columns) -> int:
+    parquet = pq.ParquetFile(path)
+    # 旧版本快照缺少的列按模型默认值插入
+    present = set(parquet.schema_arrow.names)
+    rows = 0
+    for batch in parquet.iter_batches(batch_size=SNAPSHOT_BATCH, columns=[c for c in columns if c in present]):
+        data = batch.to_pylist()
+        if data:
+            db.execute(insert(entity), data)
+            db.commit()
+            rows += len(data)
+    return rows
+
+
+def _insert_chunks(db: Session, pa, pq, path: str, dim: int) -> int:
+    """插入块与近重复签名；向量字节取自 Arrow 列。"""
+    rows = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=SNAPSHOT_BATCH):
+        data = pa.Table.from_batches([batch]).select(list(_CHUNK_COLUMNS)).to_pylist()
+        matrix, valid = _vectors(batch.column("embedding"), dim)
+        signatures = []
+        for i, row in enumerate(data):
+            row["embedding"] = matrix[i].tobytes() if valid[i] else None
+            if row["canonical_chunk_id"] is None and row["simhash"] is not None and len(row["text"]) >= SIMHASH_MIN_CHARS:
+                signatures.extend(
+                    {"band": b, "value": v, "chunk_id": row["id"]} for b, v in enumerate(bands(to_unsigned(row["simhash"])))
+                )
+        if data:
+            db.execute(insert(Chunk), data)
+            if signatures:
+                db.execute(insert(ChunkSignature), signatures)
+            db.commit()
+            rows += len(data)
+    return rows
+
+
+def _build_from_arrow(db: Session, pq, path: str, generation: str, model: str, dim: int) -> int:
+    """从快照的向量列逐批写入新索引代的各知识库、各分片（不落盘，最后统一保存）。"""
+    root = reembed.generation_dir(generation)
+    indexes: dict[str, ShardedIndex] = {}
+    managers: dict[tuple, FaissIndexManager] = {}
+    total, last = 0, 0
+    columns = ["id", "episode_id", "collection", "canonical_chunk_id", "embedding"]
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=SNAPSHOT_BATCH, columns=columns):
+        matrix, valid = _vectors(batch.column("embedding"), dim)
+        ids = batch.column("id").to_numpy()
+        episodes = batch.column("episode_id").to_numpy()
+        keep = valid & batch.column("canonical_chunk_id").is_null().to_numpy(zero_copy_only=False)
+        collections = batch.column("collection").to_pylist()
+        if len(ids):
+            last = max(last, int(ids.max()))
+        groups: dict[tuple, list] = {}
+        for i in np.flatnonzero(keep):
+            collection = collections[i] or DEFAULT_COLLECTION
+            if collection not in indexes:
+                indexes[collection] = ShardedIndex(root=root, collection=collection)
+                indexes[collection].ensure_layout()
+            groups.setdefault((collection, shard_of(int(episodes[i]), indexes[collection].shards)), []).append(i)
+        for key, rows in groups.items():
+            if key not in managers:
+                managers[key] = indexes[key[0]].manager(key[1])
+                managers[key].load(dim=dim, model=model)
+            manager = managers[key]
+            # 花式索引得到可写副本，add_vectors 就地归一化
+            vectors = matrix[rows]
+            if manager.needs_training:
+                train_from_db(db, manager, vectors)
+            manager.add_vectors(vectors, [int(ids[i]) for i in rows], persist=False)
+            total += len(rows)
+    for manager in managers.values():
+        manager.manifest["built_through"] = last
+        manager.save()
+    return total
+
+
+def import_snapshot(db: Session, src_dir: str, build_index: bool = True) -> dict:
+    """
+    导入知识库快照并构建索引。
+
+    参数:
+        db: 数据库会话。
+        src_dir: 快照目录。
+        build_index: 是否构建新的索引代并切换（否则只导入数据，之后可执行 rebuild_index）。
+    返回值:
+        {"counts": 各表导入行数, "generation": 新索引代（未构建时为 None）, "vectors": 写入索引的向量数}。
+    """
+    pa, pq = _pa()
+    manifest = read_manifest(src_dir)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{src_dir} 不是完整的知识库快照（缺少 manifest.json）")
+    if manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"快照格式版本 {manifest['version']} 高于当前支持的 {SNAPSHOT_VERSION}")
+    start = time.perf_counter()
+    paths = {t: os.path.join(src_dir, f"{t}.parquet") for t in ("episodes", "chunks", "qas")}
+    for table, entity in (("episodes", Episode), ("chunks", Chunk), ("qas", QA)):
+        _check_free(db, pq, paths[table], entity)
+    had_chunks = db.query(Chunk.id).first() is not None
+
+    model, dim = manifest.get("model"), int(manifest.get("dim") or 0)
+    counts = {
+        "episodes": _insert_batches(db, pq, paths["episodes"], Episode, _EPISODE_COLUMNS),
+        "chunks": _insert_chunks(db, pa, pq, paths["chunks"], dim),
+        "qas": _insert_batches(db, pq, paths["qas"], QA, _QA_COLUMNS),
+    }
+    for table, rows in counts.items():
+        metrics.inc("cognito_snapshot_rows_total", rows, table=table, op="import")
+    logger.info(f"快照数据已导入: {counts}，用时 {time.perf_counter() - start:.1f}s")
+
+    result = {"counts": counts, "generation": None, "vectors": 0}
+    if not build_index:
+        return result
+    if not model or not dim:
+        logger.warning("快照未记录向量模型或不含向量，跳过索引构建；设置 EMBED_MODEL 后执行 migrate_embeddings")
+        return result
+    index = manifest.get("index") or {}
+    factory = os.getenv("FAISS_INDEX_FACTORY") or index.get("factory") or "Flat"
+    generation = new_generation(model, factory, shards=int(index.get("shards") or INDEX_SHARDS))
+    build_start = time.perf_counter()
+    if had_chunks:
+        # 目标库原有的块不在快照中，从数据库整体构建
+        result["vectors"] = reembed.build_shadow(db, generation)
+    else:
+        result["vectors"] = _build_from_arrow(db, pq, paths["chunks"], generation, model, dim)
+        path = reembed.generation_dir(generation)
+        gen_manifest = read_manifest(path)
+        gen_manifest.update(status="built", build_seconds=round(time.perf_counter() - build_start, 3))
+        write_manifest(path, gen_manifest)
+    reembed.cutover(db, generation)
+    result["generation"] = generation
+    for (collection,) in db.query(QA.collection).distinct().all():
+        qa.build_qa_index(db, collection or DEFAULT_COLLECTION, model)
+    logger.info(f"快照索引已构建并切换到 {generation}: {result['vectors']} 条向量，用时 {time.perf_counter() - build_start:.1f}s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="知识库快照导出/导入")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="导出快照")
+    exp.add_argument("out_dir")
+    exp.add_argument("--collection", action="append", help="只导出该知识库，可重复")
+    imp = sub.add_parser("import", help="导入快照并构建索引")
+    imp.add_argument("src_dir")
+    imp.add_argument("--no-index", action="store_true", help="只导入数据，不构建索引")
+    args = parser.parse_args()
+
+    log = setup_logger()
+    init_engine("script")
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            result = export_snapshot(db, args.out_dir, args.collection)
+        else:
+            result = import_snapshot(db, args.src_dir, build_index=not args.no_index)
+    finally:
+        db.close()
+    log.info(json.dumps(result, ensure_ascii=False, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,189 +1,492 @@
 """
-Celery任务：
-- fetch_video_meta: 使用yt-dlp抓取视频元数据、下载音频与字幕；创建Episode记录；根据字幕情况决定后续任务。
-- transcribe_audio: 使用faster-whisper进行ASR转写，将文本传递到处理流水线。
-- process_transcript_task: 文本清洗、分块、嵌入与索引更新，写入Episode状态与摘要占位。
-
-每个任务内部自行创建数据库会话，更新Task状态阶段。
+Celery任务：摄入流水线按阶段拆分为独立任务，通过 Celery chain 串联并路由到各自队列：
+
+    下载(download) → 字幕/弹幕/ASR(asr) → 清洗+分块(cpu) → 嵌入(embed) → 索引(index)
+
+- fetch_video_meta: 字幕优先的两阶段摄入：先用yt-dlp列出字幕轨道并只下载字幕/弹幕，无可用文本时才下载音频；创建Episode记录并组装后续链路。
+- transcribe_audio: 弹幕优先，否则使用faster-whisper/openai-whisper进行ASR转写；返回文本交给下一阶段。
+- chunk_transcript_stage / embed_chunks_stage / index_chunks_stage: 文本处理的三个阶段，可独立扩缩与重试。
+- migrate_embeddings / reembed_index_task / cutover_index_task: 嵌入模型变更后的后台重嵌入、影子索引构建与原子切换。
+- rebuild_index: 模型不变时按当前分片数与索引类型重建索引（复用影子索引与原子切换流程）。
+- summarize_episode_task: 索引完成后增量计算分层摘要（不阻塞任务完成）。
+- extract_qa_task / build_qa_index_task / refresh_qa_task: 索引完成后抽取问答对（块内自问自答与弹幕高频问题）并重建问答索引；
+  索引切换到新模型后重算问题向量。
+- process_transcript_task: 兼容入口，直接对已有文本启动处理链路。
+- purge_blobs: 清理过期的带外负载（大文本经 blobstore 存储，消息中只传引用）。
+- resume_pipeline / reconcile_missing_vectors: 按阶段检查点恢复失败的节目；周期对账重新嵌入缺少向量的块。
+- expand_bulk_intake: 批量摄入：展开播放列表/频道链接、按来源去重，为每个新视频创建子任务，按提交者的公平份额放行下载。
+- dispatch_backfill: 按公平份额放行回填子任务（子任务结束时与 celery beat 周期触发）。
+- rebuild_media_catalog: 扫描媒体目录回填产物目录（仅迁移旧缓存时使用）。
+- evict_media_cache: 周期执行（celery beat）媒体缓存的磁盘预算淘汰。
+- purge_upload_sessions: 周期清理过期的断点续传会话与残留上传临时文件（celery beat）。
+
+每个任务内部自行创建数据库会话，更新Task状态阶段（中间状态经 Redis 推送，终态落库）；阶段失败按退避自动重试，重试耗尽后由 on_failure 标记任务失败。
+入口处指定优先级（交互式提交 interactive，批量子任务与后台维护 backfill），之后的阶段继承父任务的优先级。
 """
 import os
-from typing import Optional
-from celery import shared_task
+import shutil
+from datetime import datetime, timedelta
+from typing import List, Optional
+from urllib.parse import urlsplit
+from celery import Task as CeleryTask, chain
+from celery.exceptions import Retry
+from loguru import logger
 from .celery_app import celery_app
 from sqlalchemy.orm import Session
 from .database import SessionLocal
-from .models import Episode, Task
-from .services.pipeline import process_transcript, simple_clean
-from .services.embedder import Embedder, FaissIndexManager
+from .models import QA, Chunk, Episode, Task
+from .services.pipeline import chunk_transcript, embed_chunks, index_chunks_sharded
+from .services.summarizer import summarize_episode
+from .services import blobstore, checkpoint, qa, reembed, scheduling
+from .services.embedder import Embedder
+from .services.media_catalog import lookup_artifact, resolve_artifact, rebuild_catalog
+from .services.media_cache import canonicalize_url, store_file, mark_processed, enforce_budget
+from .services.throttle import acquire_host_slot, release_host_slot
+from .services.uploads import purge_stale_uploads
+from .services import metrics, progress
+from .services.shards import DEFAULT_COLLECTION, ShardedIndex
 
 
 MEDIA_DIR = os.getenv("MEDIA_DIR", "data/media")
 os.makedirs(MEDIA_DIR, exist_ok=True)
+THROTTLE_RETRY_SECONDS = int(os.getenv("INTAKE_THROTTLE_RETRY_SECONDS", "15"))
+STAGE_MAX_RETRIES = int(os.getenv("PIPELINE_STAGE_MAX_RETRIES", "3"))
+# 字幕语言偏好（按顺序匹配，支持前缀，如 zh 可匹配 zh-Hans）；手动字幕优先于自动字幕
+CAPTION_LANGS = [l.strip() for l in os.getenv("CAPTION_LANGS", "zh-Hans,zh-CN,zh,zh-Hant,en").split(",") if l.strip()]
+# 字幕/弹幕转成的文本少于该字符数时视为不可用，回退下载音频做ASR
+CAPTION_MIN_CHARS = int(os.getenv("CAPTION_MIN_CHARS", "50"))
+_CAPTION_EXTS = ("vtt", "srt")
+# 缺失向量对账：只处理创建超过宽限期的节目中的块，单次最多处理的块数
+RECONCILE_GRACE_SECONDS = int(os.getenv("RECONCILE_GRACE_SECONDS", "1800"))
+RECONCILE_BATCH_LIMIT = int(os.getenv("RECONCILE_BATCH_LIMIT", "2000"))
+
+_embedder: Embedder | None = None
+_model_embedders: dict[str, Embedder] = {}
+
+
+def _get_embedder(model: Optional[str] = None) -> Embedder:
+    """
+    进程内复用嵌入器，避免每个任务重复加载模型。
+
+    参数:
+        model: 指定模型（重嵌入迁移使用）；为空时使用 EMBED_MODEL（含兜底）。
+    """
+    global _embedder
+    if _embedder is None:
+        _embedder = Embedder()
+    if model is None or model == _embedder.model_name:
+        return _embedder
+    if model not in _model_embedders:
+        _model_embedders[model] = Embedder(model=model)
+    return _model_embedders[model]
+
+
+def _start_reembed(model: str) -> None:
+    """发现新模型向量时启动重嵌入迁移（同一模型只启动一次）。"""
+    generation = reembed.start_generation(model)
+    if generation:
+        reembed_index_task.apply_async((generation,), priority=scheduling.PRIORITY_BACKFILL)
 
 
 def _update_task(db: Session, task_id: int, status: str, message: str, episode_id: Optional[int] = None):
+    """
+    更新任务状态：中间状态通过 Redis 推送（不写库），终态或 Redis 不可用时写入数据库。
+    """
+    published = progress.publish(task_id, status, message, episode_id)
+    if published and status not in progress.TERMINAL_STATUSES:
+        return
+    # 回填子任务结束：释放在途名额，放行下一条
+    if status in progress.TERMINAL_STATUSES and scheduling.release(task_id):
+        _dispatch_backfill()
     t = db.query(Task).get(task_id)
     if not t:
         return
     t.status = status
     t.message = message
+    if episode_id is None and published:
+        episode_id = (progress.get_state(task_id) or {}).get("episode_id")
     if episode_id is not None:
         t.episode_id = episode_id
+    t.updated_at = datetime.utcnow()
     db.add(t)
     db.commit()
+    if t.parent_id and status in progress.TERMINAL_STATUSES:
+        progress.notify(t.parent_id, {"child_id": t.id, "status": status, "message": message})
+        _finish_parent_if_done(db, t.parent_id)
 
 
-@celery_app.task(name="backend.app.tasks.fetch_video_meta")
-def fetch_video_meta(task_id: int, source_url: str):
+def _finish_parent_if_done(db: Session, parent_id: int) -> bool:
     """
-    抓取视频元数据与音频/字幕。
+    批量任务的全部子任务都到达终态时，为父任务写入终态（落库并广播），使其在 Redis 状态过期后仍可查询。
+    子任务在展开时一次性提交，因此 done == total 时不会再有新的子任务。
+
+    返回值:
+        父任务是否已结束。
+    """
+    p = progress.children_progress(db, parent_id)
+    if p["done"] < p["total"]:
+        return False
+    _update_task(db, parent_id, "completed", f"批量摄入完成：{p['total']} 个子任务，失败 {p['failed']} 个")
+    return True
+
+
+class PipelineStage(CeleryTask):
+    """
+    流水线阶段基类：异常按指数退避自动重试；重试耗尽后将关联的 Task 记录标记为失败。
+    子类通过 stage_label 提供失败信息前缀。
+    """
+    autoretry_for = (Exception,)
+    retry_backoff = True
+    retry_backoff_max = 300
+    retry_jitter = True
+    max_retries = STAGE_MAX_RETRIES
+    stage_label = "处理"
+
+    def on_retry(self, exc, celery_task_id, args, kwargs, einfo):
+        task_id = kwargs.get("task_id")
+        if task_id is None:
+            return
+        db = SessionLocal()
+        try:
+            _update_task(db, task_id, "retrying", f"{self.stage_label}失败，重试中: {exc}")
+        finally:
+            db.close()
+
+    def on_failure(self, exc, celery_task_id, args, kwargs, einfo):
+        task_id = kwargs.get("task_id")
+        if task_id is None:
+            return
+        db = SessionLocal()
+        try:
+            _update_task(db, task_id, "failed", f"{self.stage_label}失败: {exc}")
+        finally:
+            db.close()
+
+
+def _post_chunk_stages(task_id: int, episode_id: int) -> list:
+    """
+    分块之后的阶段签名：嵌入 → 索引。每个阶段接收上一阶段的返回值作为首个参数。
+    """
+    return [
+        embed_chunks_stage.s(task_id=task_id, episode_id=episode_id),
+        index_chunks_stage.s(task_id=task_id, episode_id=episode_id),
+    ]
+
+
+def _priority_options(priority: Optional[int]) -> dict:
+    # 未指定时不传 priority，由 Celery 继承父任务的优先级（在 worker 中调用时）或取默认优先级
+    return {} if priority is None else {"priority": priority}
+
+
+def start_transcription_pipeline(task_id: int, episode_id: int, audio_path: str, priority: Optional[int] = None):
+    """
+    启动 ASR 及后续处理链路：转写 → 清洗+分块 → 嵌入 → 索引。
+    priority 为整条链路的优先级（后续阶段继承）。
+    """
+    return chain(
+        transcribe_audio.si(task_id=task_id, episode_id=episode_id, audio_path=audio_path),
+        chunk_transcript_stage.s(task_id=task_id, episode_id=episode_id),
+        *_post_chunk_stages(task_id, episode_id),
+    ).apply_async(**_priority_options(priority))
+
+
+def start_text_pipeline(task_id: int, episode_id: int, transcript_text: str, priority: Optional[int] = None):
+    """
+    对已有文本（字幕/手动提交）启动处理链路：清洗+分块 → 嵌入 → 索引。
+    大文本写入负载存储，消息中只携带引用。
+    """
+    return chain(
+        chunk_transcript_stage.s(blobstore.put(transcript_text), task_id=task_id, episode_id=episode_id),
+        *_post_chunk_stages(task_id, episode_id),
+    ).apply_async(**_priority_options(priority))
+
+
+def resume_pipeline(db: Session, task_id: int, episode_id: int, priority: Optional[int] = None) -> Optional[str]:
+    """
+    按检查点从最后完成的阶段之后继续处理节目，不重复下载与ASR：
+
+        无检查点 → 转写；transcript/cleaned → 清洗+分块；chunks → 嵌入；embedded → 索引；indexed → 无需处理。
+
+    参数:
+        db: 数据库会话。
+        task_id: 用于状态更新的任务ID。
+        episode_id: 节目ID。
+        priority: 恢复链路的优先级。
+    返回值:
+        恢复起点的阶段名（"transcribe"/"chunk"/"embed"/"index"）；已全部完成时返回 None。
+    """
+    stage = checkpoint.latest(db, episode_id)
+    if stage == "indexed":
+        return None
+    if stage in {"chunks", "embedded"}:
+        chunk_ids = checkpoint.load_json(db, episode_id, "chunks")
+        index_sig = index_chunks_stage.s(task_id=task_id, episode_id=episode_id)
+        if stage == "chunks":
+            chain(embed_chunks_stage.si(chunk_ids, task_id=task_id, episode_id=episode_id), index_sig).apply_async(**_priority_options(priority))
+            return "embed"
+        index_chunks_stage.apply_async((chunk_ids,), {"task_id": task_id, "episode_id": episode_id}, **_priority_options(priority))
+        return "index"
+    if stage in {"transcript", "cleaned"}:
+        start_text_pipeline(task_id, episode_id, checkpoint.load(db, episode_id, "transcript"), priority=priority)
+        return "chunk"
+    ep = db.query(Episode).get(episode_id)
+    if ep is None or not ep.file_path:
+        raise ValueError("节目没有可恢复的检查点或音频")
+    start_transcription_pipeline(task_id, episode_id, ep.file_path, priority=priority)
+    return "transcribe"
+
+
+def _pick_text_track(info: dict, platform: str) -> Optional[tuple]:
+    """
+    从 yt-dlp 元数据中选择一条可用的文本轨道，不下载任何内容。
+    B站优先弹幕（xml），其余按 手动字幕 → 自动字幕 与 CAPTION_LANGS 顺序选择 vtt/srt 轨道。
+
+    参数:
+        info: extract_info(download=False) 的返回值。
+        platform: 来源平台。
+    返回值:
+        (语言, 是否自动字幕, 格式)；没有可用轨道时返回 None。
+    """
+    manual = info.get("subtitles") or {}
+    automatic = info.get("automatic_captions") or {}
+    if platform == "bilibili" and any(f.get("ext") == "xml" for f in manual.get("danmaku") or []):
+        return "danmaku", False, "xml"
+    for tracks, is_auto in ((manual, False), (automatic, True)):
+        usable = {
+            lang: next(ext for ext in _CAPTION_EXTS if any(f.get("ext") == ext for f in formats))
+            for lang, formats in tracks.items()
+            if lang not in {"danmaku", "live_chat"} and any(f.get("ext") in _CAPTION_EXTS for f in formats or [])
+        }
+        if not usable:
+            continue
+        if is_auto:
+            # 自动字幕含大量机器翻译轨道，有原语言轨道（-orig）时直接使用，它与ASR结果等价
+            orig = next((lang for lang in usable if lang.endswith("-orig")), None)
+            if orig is not None:
+                return orig, True, usable[orig]
+        for pref in CAPTION_LANGS:
+            for lang in usable:
+                if lang == pref or lang.startswith(pref + "-"):
+                    return lang, is_auto, usable[lang]
+        if not is_auto:
+            # 任意语言的手动字幕都比ASR可靠
+            lang = next(iter(usable))
+            return lang, False, usable[lang]
+    return None
+
+
+def _audio_size_estimate(info: dict) -> int:
+    """按元数据估算 bestaudio 的字节数（用于统计跳过下载节省的流量）。"""
+    sizes = [
+        f.get("filesize") or f.get("filesize_approx") or 0
+        for f in info.get("formats") or []
+        if f.get("vcodec") == "none"
+    ]
+    return int(max(sizes, default=0) or info.get("filesize") or info.get("filesize_approx") or 0)
+
+
+def _artifact_text(path: str) -> str:
+    """将已登记的字幕（vtt/srt）或弹幕（xml）转为文本，其他格式返回空串。"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in {".vtt", ".srt"}:
+        return _caption_to_text(path)
+    if ext == ".xml":
+        with metrics.stage("danmaku_parse"):
+            return _danmaku_to_text(path)
+    return ""
+
+
+def _cached_text(db: Session, source_key: str, video_id: str) -> Optional[str]:
+    """已缓存的字幕或弹幕文本（足够长时），用于命中缓存时跳过音频。"""
+    danmaku_candidates = [
+        os.path.join(MEDIA_DIR, f"{video_id}.xml"),
+        os.path.join(MEDIA_DIR, f"{video_id}.danmaku.xml"),
+    ]
+    for art in (lookup_artifact(db, source_key, "caption"), resolve_artifact(db, source_key, "danmaku", danmaku_candidates)):
+        if art is None:
+            continue
+        try:
+            text = _artifact_text(art.path)
+        except Exception:
+            continue
+        if len(text.strip()) >= CAPTION_MIN_CHARS:
+            return text
+    return None
+
+
+@celery_app.task(name="backend.app.tasks.fetch_video_meta", bind=True, max_retries=None)
+def fetch_video_meta(self, task_id: int, source_url: str, collection: str = DEFAULT_COLLECTION):
+    """
+    两阶段摄入：创建节目并启动后续链路（本任务只负责下载）。
+        1. 只取元数据（不下载），列出字幕轨道；有可用字幕（B站为弹幕）时只下载该轨道并直接进入文本处理；
+        2. 没有可用文本轨道时才下载 bestaudio，进入ASR。
+    字幕/弹幕与音频均按来源键缓存，命中时跳过网络请求。下载前按主机占用限流槽位，槽位已满时延迟重试。
 
     参数:
         task_id: 关联的Task记录ID，用于状态更新。
         source_url: 视频平台URL。
+        collection: 节目所属知识库。
     返回:
         episode_id（若成功创建），否则None。
     """
     from yt_dlp import YoutubeDL
     db = SessionLocal()
     try:
-        _update_task(db, task_id, "downloading", "正在抓取音频与字幕")
+        _update_task(db, task_id, "downloading", "正在获取字幕轨道")
 
-        # 快速路径：B站链接且本地已有缓存时，跳过网络下载，直接复用现有文件
+        # 规整链接：同一视频的不同URL形式映射到同一来源键，命中缓存时跳过下载
+        canon = canonicalize_url(source_url)
+        source_key = canon.key
         audio_path = None
-        title = "Untitled"
-        audio_id = None
-        if ("bilibili.com" in source_url) and ("/video/BV" in source_url):
-            try:
-                # 提取BV号
-                import re
-                m = re.search(r"/video/(BV\w+)", source_url)
-                if m:
-                    audio_id = m.group(1)
-                    candidate_audio = os.path.join(MEDIA_DIR, f"{audio_id}.m4a")
-                    if os.path.exists(candidate_audio):
-                        audio_path = candidate_audio
-                        title = audio_id
-                        _update_task(db, task_id, "downloading", "检测到本地缓存，跳过下载")
-            except Exception:
-                pass
-
-        if audio_path is None:
-            # 若为B站链接，但未命中本地缓存，则仍然尝试直接进入后续流程：
-            # 1) 推断音频文件的期望路径（即使文件暂不存在）；
-            # 2) 让后续ASR任务优先使用弹幕XML回退，避免网络下载阻塞。
-            if ("bilibili.com" in source_url) and ("/video/BV" in source_url) and audio_id:
-                # 构造期望的音频路径（缺失时也继续）
-                expected_audio = os.path.join(MEDIA_DIR, f"{audio_id}.m4a")
-                audio_path = expected_audio
-                title = audio_id
-                # 直接创建Episode并进入ASR（弹幕优先）
-                ep = Episode(title=title, file_path=audio_path, status="uploaded")
-                ep.source_url = source_url  # 需在模型中新增字段
-                db.add(ep)
-                db.commit()
-                db.refresh(ep)
-
-                _update_task(db, task_id, "transcribing", "未找到音频缓存，优先走弹幕回退", episode_id=ep.id)
-                # 显式选择队列，避免默认队列导致未被消费
-                # 为确保端到端闭环，在工作进程内直接调用转写任务
-                transcribe_audio(task_id=task_id, episode_id=ep.id, audio_path=audio_path)
-                return ep.id
-
-            ydl_opts = {
+        title = canon.video_id
+        text = _cached_text(db, source_key, canon.video_id)
+        if text is None:
+            legacy = [os.path.join(MEDIA_DIR, f"{canon.video_id}.m4a")] if canon.platform == "bilibili" else []
+            art = resolve_artifact(db, source_key, "audio", legacy)
+            if art is not None:
+                audio_path = art.path
+                # 复用的音频要为新节目重新处理，处理完成前不可淘汰
+                if art.processed:
+                    art.processed = False
+                    db.add(art)
+                    db.commit()
+        if text is not None or audio_path is not None:
+            metrics.inc("cognito_media_cache_hits_total", platform=canon.platform)
+            _update_task(db, task_id, "downloading", "检测到本地缓存，跳过下载")
+        else:
+            metrics.inc("cognito_media_cache_misses_total", platform=canon.platform)
+
+            # 每个主机限制并发与速率，槽位已满时退回队列稍后重试（内联执行时不限流）
+            host = urlsplit(canon.url).hostname or canon.platform
+            slot_token = str(task_id)
+            if not self.request.is_eager and not acquire_host_slot(host, slot_token):
+                _update_task(db, task_id, "pending", f"等待下载槽位（{host}）")
+                raise self.retry(countdown=THROTTLE_RETRY_SECONDS)
+
+            # 下载到临时目录，完成后按内容哈希移入对象存储
+            incoming = os.path.join(MEDIA_DIR, "incoming", str(task_id))
+            os.makedirs(incoming, exist_ok=True)
+            base_opts = {
                 "format": "bestaudio/best",
-                "outtmpl": os.path.join(MEDIA_DIR, "%(id)s.%(ext)s"),
-                "writesubtitles": True,
-                "writeautomaticsub": True,
-                "subtitlesformat": "vtt",
-                "skip_download": False,
+                "outtmpl": os.path.join(incoming, "%(id)s.%(ext)s"),
                 "noplaylist": True,
             }
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(source_url, download=True)
-            title = info.get("title") or "Untitled"
-            audio_ext = info.get("ext", "m4a")
-            audio_id = info.get("id")
-            audio_path = os.path.join(MEDIA_DIR, f"{audio_id}.{audio_ext}")
-
-        ep = Episode(title=title, file_path=audio_path, status="uploaded")
-        ep.source_url = source_url  # 需在模型中新增字段
+            try:
+                # 阶段一：只取元数据与字幕轨道列表
+                with metrics.stage("probe", platform=canon.platform), YoutubeDL(base_opts) as ydl:
+                    info = ydl.extract_info(canon.url, download=False)
+                title = info.get("title") or "Untitled"
+                track = _pick_text_track(info, canon.platform)
+                if track is not None:
+                    lang, is_auto, ext = track
+                    sub_opts = {
+                        **base_opts,
+                        "skip_download": True,
+                        "writesubtitles": not is_auto,
+                        "writeautomaticsub": is_auto,
+                        "subtitleslangs": [lang],
+                        "subtitlesformat": ext,
+                    }
+                    with metrics.stage("caption_download", platform=canon.platform), YoutubeDL(sub_opts) as ydl:
+                        sub_info = ydl.process_ie_result(info, download=True)
+                    sub_path = ((sub_info.get("requested_subtitles") or {}).get(lang) or {}).get("filepath")
+                    if sub_path and os.path.exists(sub_path):
+                        kind = "danmaku" if ext == "xml" else "caption"
+                        text = _artifact_text(store_file(db, sub_path, source_key, kind).path)
+                        if len(text.strip()) < CAPTION_MIN_CHARS:
+                            text = None
+
+                if text is not None:
+                    metrics.inc("cognito_intake_audio_skipped_total", platform=canon.platform)
+                    metrics.inc("cognito_intake_audio_bytes_avoided_total", _audio_size_estimate(info), platform=canon.platform)
+                else:
+                    # 阶段二：没有可用文本轨道，下载音频
+                    _update_task(db, task_id, "downloading", "无可用字幕，正在下载音频")
+                    with metrics.stage("download", platform=canon.platform), YoutubeDL(base_opts) as ydl:
+                        info = ydl.process_ie_result(info, download=True)
+                    downloaded = os.path.join(incoming, f"{info.get('id')}.{info.get('ext', 'm4a')}")
+                    if os.path.exists(downloaded):
+                        metrics.inc("cognito_media_download_bytes_total", os.path.getsize(downloaded), platform=canon.platform)
+                        audio_path = store_file(db, downloaded, source_key, "audio").path
+                    else:
+                        audio_path = downloaded
+            finally:
+                release_host_slot(host, slot_token)
+                shutil.rmtree(incoming, ignore_errors=True)
+
+        # 仅有字幕时不保存音频，file_path 为空
+        ep = Episode(title=title, file_path=audio_path or "", status="uploaded", source_key=source_key, collection=collection)
+        ep.source_url = source_url
         db.add(ep)
         db.commit()
         db.refresh(ep)
 
-        _update_task(db, task_id, "downloading", "抓取完成，检查字幕", episode_id=ep.id)
-
-        # 查找字幕文件（严格限定为 vtt/srt），避免弹幕XML被当作字幕导致超大文本
-        subtitles = {}
-        auto_subs = {}
-        # 当走本地缓存路径时，info可能不存在；此时字幕检测交由后续ASR任务内部的弹幕优先逻辑处理
-        try:
-            info  # noqa: F821
-            subtitles = info.get("subtitles") or {}
-            auto_subs = info.get("automatic_captions") or {}
-        except Exception:
-            pass
-        sub_text = None
-
-        def _caption_to_text(path: str) -> str:
-            """
-            将 VTT/SRT 字幕文件转为纯文本。
-
-            参数:
-                path: 字幕文件路径（仅支持 .vtt / .srt）。
-            返回值:
-                纯文本内容。
-            """
-            import re
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                raw = f.read()
-            # 去掉VTT头与时间戳、编号
-            raw = re.sub(r"^WEBVTT.*\n", "", raw)
-            raw = re.sub(r"^\d+\s*$", "", raw, flags=re.M)
-            raw = re.sub(r"\d{1,2}:\d{2}:\d{2}(?:\.\d+)?\s+-->\s+\d{1,2}:\d{2}:\d{2}(?:\.\d+)?(?:.*)?", "", raw, flags=re.M)
-            # 去掉HTML标签
-            raw = re.sub(r"<[^>]+>", "", raw)
-            lines = [l.strip() for l in raw.splitlines() if l.strip()]
-            return "\n".join(lines)
-
-        # 仅采纳 .vtt / .srt，忽略 xml（如B站弹幕）
-        def _pick_caption(caps: dict) -> str | None:
-            for _lang, tracks in caps.items():
-                if not tracks:
-                    continue
-                path = tracks[0].get("filepath")
-                if not path:
-                    continue
-                ext = os.path.splitext(path)[1].lower()
-                if ext in {".vtt", ".srt"} and os.path.exists(path):
-                    return _caption_to_text(path)
-            return None
-
-        # 优先人工字幕，其次自动字幕
-        sub_text = _pick_caption(subtitles) or _pick_caption(auto_subs)
-
-        if sub_text:
-            _update_task(db, task_id, "processing", "已有字幕，进入文本处理")
-            embedder = Embedder()
-            index = FaissIndexManager()
-            process_transcript(db, ep.id, sub_text, index, embedder)
-            _update_task(db, task_id, "completed", "字幕处理完成")
-            return ep.id
+        if text is not None:
+            metrics.inc("cognito_intake_total", source="text", platform=canon.platform)
+            _update_task(db, task_id, "processing", "已有字幕，跳过音频，进入文本处理", episode_id=ep.id)
+            start_text_pipeline(task_id, ep.id, text)
         else:
-            _update_task(db, task_id, "transcribing", "无字幕，进入ASR")
-            transcribe_audio(task_id=task_id, episode_id=ep.id, audio_path=audio_path)
-            return ep.id
+            metrics.inc("cognito_intake_total", source="audio", platform=canon.platform)
+            _update_task(db, task_id, "transcribing", "无字幕，进入ASR", episode_id=ep.id)
+            start_transcription_pipeline(task_id, ep.id, audio_path)
+        return ep.id
+    except Retry:
+        raise
     except Exception as e:
         _update_task(db, task_id, "failed", f"抓取失败: {e}")
     finally:
         db.close()
 
 
-@celery_app.task(name="backend.app.tasks.transcribe_audio")
-def transcribe_audio(task_id: int, episode_id: int, audio_path: str):
+def _save_transcript(db: Session, episode_id: int, text: str) -> None:
+    """写入转录检查点（替换旧转录时一并清除下游检查点）。"""
+    if checkpoint.load(db, episode_id, "transcript") != text:
+        checkpoint.clear(db, episode_id, "transcript")
+        checkpoint.save(db, episode_id, "transcript", text)
+        db.commit()
+
+
+def _caption_to_text(path: str) -> str:
+    """
+    将 VTT/SRT 字幕文件转为纯文本。
+
+    参数:
+        path: 字幕文件路径（仅支持 .vtt / .srt）。
+    返回值:
+        纯文本内容。
+    """
+    import re
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        raw = f.read()
+    # 去掉VTT头与时间戳、编号
+    raw = re.sub(r"^WEBVTT.*\n", "", raw)
+    raw = re.sub(r"^\d+\s*$", "", raw, flags=re.M)
+    raw = re.sub(r"\d{1,2}:\d{2}:\d{2}(?:\.\d+)?\s+-->\s+\d{1,2}:\d{2}:\d{2}(?:\.\d+)?(?:.*)?", "", raw, flags=re.M)
+    # 去掉HTML标签
+    raw = re.sub(r"<[^>]+>", "", raw)
+    lines = [l.strip() for l in raw.splitlines() if l.strip()]
+    return "\n".join(lines)
+
+
+def _danmaku_to_text(xml_path: str) -> str:
+    """
+    将B站弹幕 XML 转为逐行纯文本。
     """
-    使用 faster-whisper 进行 ASR 转录，并对 HuggingFace 缓存目录进行显式控制，
+    import re
+    from xml.etree import ElementTree as ET
+    root = ET.parse(xml_path).getroot()
+    lines = []
+    for d in root.findall(".//d"):
+        t = (d.text or "").strip()
+        if t:
+            lines.append(re.sub(r"<[^>]+>", "", t))
+    return "\n".join(lines)
+
+
+@celery_app.task(name="backend.app.tasks.transcribe_audio", base=PipelineStage, bind=True, stage_label="ASR")
+def transcribe_audio(self, task_id: int, episode_id: int, audio_path: str) -> blobstore.BlobRef:
+    """
+    转写阶段：优先使用弹幕XML；否则使用 faster-whisper 进行 ASR 转录，并对 HuggingFace 缓存目录进行显式控制，
     在模型下载/定位失败时增加自动回退重试（例如改用 tiny 模型）。
 
     参数:
@@ -192,45 +495,36 @@ def transcribe_audio(task_id: int, episode_id: int, audio_path: str):
         audio_path: 音频文件路径。
 
     返回:
-        无（结果通过后续处理写库）。
+        转写文本的负载引用（小文本为文本本身），作为“清洗+分块”阶段的输入。
     """
     db = SessionLocal()
     try:
+        # 重试或手动恢复时已有转录检查点，直接复用，不再重复ASR
+        saved = checkpoint.load(db, episode_id, "transcript")
+        if saved is not None:
+            _update_task(db, task_id, "processing", "已有转录检查点，跳过ASR，进入处理")
+            return blobstore.put(saved)
+
         _update_task(db, task_id, "transcribing", "ASR进行中")
+        ep = db.query(Episode).get(episode_id)
+        source_key = ep.source_key if ep else None
 
         # 0. 优先尝试弹幕XML（若存在），快速产出文本，避免网络下载模型导致阻塞
         try:
-            base = os.path.splitext(os.path.basename(audio_path))[0]
+            base = source_key.split(":", 1)[-1] if source_key else os.path.splitext(os.path.basename(audio_path))[0]
             candidates = [
                 os.path.join(MEDIA_DIR, f"{base}.xml"),
                 os.path.join(MEDIA_DIR, f"{base}.danmaku.xml"),
             ]
-            xml_path = next((p for p in candidates if os.path.exists(p)), None)
-            if not xml_path:
-                # 再扫描目录中以同id开头的xml
-                for fname in os.listdir(MEDIA_DIR):
-                    if fname.startswith(base) and fname.endswith(".xml"):
-                        xml_path = os.path.join(MEDIA_DIR, fname)
-                        break
-            if xml_path:
-                import re
-                from xml.etree import ElementTree as ET
-                tree = ET.parse(xml_path)
-                root = tree.getroot()
-                lines = []
-                for d in root.findall(".//d"):
-                    t = (d.text or "").strip()
-                    if t:
-                        t = re.sub(r"<[^>]+>", "", t)
-                        lines.append(t)
-                text = "\n".join(lines)
+            # 通过产物目录定位弹幕，未登记时仅探测约定文件名，不再扫描整个目录
+            art = resolve_artifact(db, source_key or base, "danmaku", candidates)
+            if art is not None:
+                with metrics.stage("danmaku_parse"):
+                    text = _danmaku_to_text(art.path)
                 if text.strip():
+                    _save_transcript(db, episode_id, text)
                     _update_task(db, task_id, "processing", "弹幕文本可用，跳过ASR，进入处理")
-                    embedder = Embedder()
-                    index = FaissIndexManager()
-                    process_transcript(db, episode_id, text, index, embedder)
-                    _update_task(db, task_id, "completed", "处理完成")
-                    return
+                    return blobstore.put(text)
         except Exception:
             # 弹幕不可用时继续ASR流程
             pass
@@ -248,9 +542,11 @@ def transcribe_audio(task_id: int, episode_id: int, audio_path: str):
         if not skip_faster:
             try:
                 from faster_whisper import WhisperModel
-                model = WhisperModel(model_name, device=device, compute_type=compute_type, download_root=download_root)
-                segments, _ = model.transcribe(audio_path)
-                text = "\n".join(s.text.strip() for s in segments)
+                # segments 为惰性生成器，转写耗时发生在拼接时，需一并计时
+                with metrics.stage("asr", model=f"faster-whisper:{model_name}"):
+                    model = WhisperModel(model_name, device=device, compute_type=compute_type, download_root=download_root)
+                    segments, _ = model.transcribe(audio_path)
+                    text = "\n".join(s.text.strip() for s in segments)
             except Exception as e:
                 # 继续走openai-whisper回退
                 pass
@@ -259,40 +555,446 @@ def transcribe_audio(task_id: int, episode_id: int, audio_path: str):
             try:
                 import whisper as oi_whisper
                 fallback_model = os.getenv("WHISPER_FALLBACK_MODEL", "tiny")
-                oi_model = oi_whisper.load_model(fallback_model, device="cpu")
-                res = oi_model.transcribe(audio_path)
+                with metrics.stage("asr", model=f"openai-whisper:{fallback_model}"):
+                    oi_model = oi_whisper.load_model(fallback_model, device="cpu")
+                    res = oi_model.transcribe(audio_path)
                 text = res.get("text", "").strip()
                 model_name = f"openai-whisper:{fallback_model}"
             except Exception as e2:
-                # 网络受限或模型不可用时，启用“占位文本”回退，以保证端到端成功
+                # 网络受限或模型不可用时，启用“占位文本”回退，以保证端到端成功（占位文本不写检查点，恢复时重新ASR）
                 placeholder = f"占位文本：ASR暂不可用，错误：{e2}"
                 text = placeholder
                 _update_task(db, task_id, "processing", "ASR不可用，使用占位文本回退，进入文本处理")
+                return blobstore.put(text)
+
+        if text:
+            _save_transcript(db, episode_id, text)
 
         _update_task(db, task_id, "processing", "ASR完成或回退成功，进入文本处理")
-        embedder = Embedder()
-        index = FaissIndexManager()
-        process_transcript(db, episode_id, text, index, embedder)
-        _update_task(db, task_id, "completed", "处理完成")
-    except Exception as e:
-        _update_task(db, task_id, "failed", f"ASR失败: {e}")
+        return blobstore.put(text)
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.chunk_transcript_stage", base=PipelineStage, bind=True, stage_label="文本处理")
+def chunk_transcript_stage(self, transcript: blobstore.BlobRef, task_id: int, episode_id: int) -> List[int]:
+    """
+    清洗+分块阶段：写入 Chunk 与摘要，返回块ID列表。
+    transcript 为负载引用（或小文本本身）；负载已过期时改用转录检查点。
+    """
+    db = SessionLocal()
+    try:
+        _update_task(db, task_id, "processing", "文本清洗与分块")
+        try:
+            transcript_text = blobstore.get(transcript)
+        except FileNotFoundError:
+            transcript_text = checkpoint.load(db, episode_id, "transcript")
+            if transcript_text is None:
+                raise
+        return chunk_transcript(db, episode_id, transcript_text)
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.embed_chunks_stage", base=PipelineStage, bind=True, stage_label="嵌入")
+def embed_chunks_stage(self, chunk_ids: List[int], task_id: int, episode_id: int) -> List[int]:
+    """
+    嵌入阶段：为块计算向量并写回数据库，返回块ID列表。已有向量的块跳过，重试是幂等的。
+    """
+    db = SessionLocal()
+    try:
+        _update_task(db, task_id, "embedding", f"正在嵌入 {len(chunk_ids)} 个块")
+        embed_chunks(db, chunk_ids, _get_embedder(), episode_id=episode_id)
+        return chunk_ids
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.index_chunks_stage", base=PipelineStage, bind=True, stage_label="索引")
+def index_chunks_stage(self, chunk_ids: List[int], task_id: int, episode_id: int) -> int:
+    """
+    索引阶段：将向量写入 FAISS 索引，并将节目标记为已处理。
+    索引文件为单写者，index 队列应以单并发运行。向量模型与当前索引不一致时启动重嵌入迁移。
+    """
+    db = SessionLocal()
+    try:
+        _update_task(db, task_id, "indexing", "写入向量索引")
+        added = index_chunks_sharded(db, chunk_ids, on_model_change=_start_reembed)
+        ep = db.query(Episode).get(episode_id)
+        if ep is not None:
+            ep.status = "processed"
+            db.add(ep)
+            checkpoint.save(db, episode_id, "indexed", {"chunks": len(chunk_ids), "added": added})
+            db.commit()
+            if ep.source_key:
+                mark_processed(db, ep.source_key)
+        _update_task(db, task_id, "completed", f"处理完成，已处理 {len(chunk_ids)} 个块")
+        summarize_episode_task.delay(episode_id)
+        extract_qa_task.delay(episode_id)
+        return added
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.migrate_embeddings")
+def migrate_embeddings(model: Optional[str] = None) -> Optional[str]:
+    """
+    手动触发重嵌入迁移：目标模型默认为本 worker 实际加载的模型（EMBED_MODEL 或兜底模型）。
+    当前索引已是该模型或已有进行中的迁移时不做任何事。
+
+    返回值:
+        新建的索引代名称。
+    """
+    model = model or _get_embedder().model_name
+    generation = reembed.start_generation(model)
+    if generation:
+        reembed_index_task.apply_async((generation,), priority=scheduling.PRIORITY_BACKFILL)
+    return generation
+
+
+@celery_app.task(name="backend.app.tasks.rebuild_index")
+def rebuild_index() -> Optional[str]:
+    """
+    手动触发索引重建（模型不变）：按当前 INDEX_SHARDS / FAISS_INDEX_FACTORY 新建一代，
+    从数据库向量构建后原子切换。修改分片数或索引类型后执行。
+
+    返回值:
+        新建的索引代名称；已有进行中的重建或迁移时为 None。
+    """
+    generation = reembed.start_generation(_get_embedder().model_name, rebuild=True)
+    if generation:
+        reembed_index_task.apply_async((generation,), priority=scheduling.PRIORITY_BACKFILL)
+    return generation
+
+
+@celery_app.task(name="backend.app.tasks.reembed_index_task", base=PipelineStage, bind=True, stage_label="重嵌入")
+def reembed_index_task(self, generation: str) -> None:
+    """
+    重嵌入迁移的一次执行：处理 REEMBED_BATCHES_PER_RUN 批后间隔 REEMBED_INTERVAL_SECONDS 重新入队（节流，
+    不长期占用嵌入 worker）；全部完成后构建影子索引并交给 index 队列切换。
+    """
+    db = SessionLocal()
+    try:
+        manifest = reembed.read_manifest(reembed.generation_dir(generation))
+        status = manifest.get("status")
+        if status == "building":
+            if not reembed.reembed_step(db, generation, _get_embedder(manifest["model"])):
+                reembed_index_task.apply_async((generation,), countdown=reembed.REEMBED_INTERVAL_SECONDS)
+                return
+            status = "embedded"
+        if status == "embedded":
+            with metrics.stage("shadow_build", model=manifest["model"]):
+                reembed.build_shadow(db, generation)
+            cutover_index_task.delay(generation)
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.cutover_index_task", base=PipelineStage, bind=True, stage_label="索引切换")
+def cutover_index_task(self, generation: str) -> int:
+    """
+    在 index 队列中补齐影子索引并原子切换 CURRENT 指针。
+    """
+    db = SessionLocal()
+    try:
+        total = reembed.cutover(db, generation)
+    finally:
+        db.close()
+    # 问题向量随索引模型更新，切换前问答索引因模型不一致被跳过
+    refresh_qa_task.delay()
+    return total
+
+
+@celery_app.task(name="backend.app.tasks.summarize_episode_task", base=PipelineStage, bind=True, stage_label="摘要")
+def summarize_episode_task(self, episode_id: int) -> str:
+    """
+    分层摘要：块级 TextRank → 章节 → 整期，仅重算内容变化的分支，结果写回 Episode.summary。
+    """
+    db = SessionLocal()
+    try:
+        with metrics.stage("summarize"):
+            return summarize_episode(db, episode_id)
+    finally:
+        db.close()
+
+
+def _danmaku_lines(db: Session, episode: Episode) -> List[str]:
+    """节目的弹幕文本行；转录本身来自弹幕（块即弹幕）或没有弹幕时返回空列表。"""
+    if not episode.source_key:
+        return []
+    art = lookup_artifact(db, episode.source_key, "danmaku")
+    if art is None:
+        return []
+    text = _danmaku_to_text(art.path)
+    if text == checkpoint.load(db, episode.id, "transcript"):
+        return []
+    return text.splitlines()
+
+
+@celery_app.task(name="backend.app.tasks.extract_qa_task", base=PipelineStage, bind=True, stage_label="问答抽取")
+def extract_qa_task(self, episode_id: int) -> int:
+    """
+    抽取节目的问答对（块内自问自答与弹幕高频问题），问题以当前服务索引的模型嵌入，随后在 index 队列重建该知识库的问答索引。
+    """
+    db = SessionLocal()
+    try:
+        episode = db.query(Episode).get(episode_id)
+        if episode is None:
+            return 0
+        embedder = _get_embedder(ShardedIndex(collection=episode.collection).model)
+        with metrics.stage("qa_extract"):
+            count = qa.extract_episode_qa(db, episode_id, embedder, _danmaku_lines(db, episode))
+        build_qa_index_task.delay(episode.collection, embedder.model_name)
+        return count
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.build_qa_index_task")
+def build_qa_index_task(collection: str, model: str) -> int:
+    """整体重建知识库的问答索引（index 队列，单写者）。"""
+    db = SessionLocal()
+    try:
+        return qa.build_qa_index(db, collection, model)
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.refresh_qa_task")
+def refresh_qa_task() -> int:
+    """
+    把问题向量重算为当前服务索引的模型并重建全部知识库的问答索引（索引切换后或导入手工问答后执行）。
+
+    返回值:
+        重算向量的问答数量。
+    """
+    db = SessionLocal()
+    try:
+        model = ShardedIndex().model
+        embedder = _get_embedder(model)
+        count = qa.reembed_questions(db, embedder)
+        for (collection,) in db.query(QA.collection).distinct().all():
+            build_qa_index_task.delay(collection, embedder.model_name)
+        return count
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.reconcile_missing_vectors")
+def reconcile_missing_vectors(limit: int = RECONCILE_BATCH_LIMIT) -> int:
+    """
+    周期对账（celery beat）：查找超过 RECONCILE_GRACE_SECONDS 仍没有向量的规范块（嵌入阶段失败且重试耗尽等），
+    重新嵌入并交给 index 队列写入索引。宽限期内的块可能仍在正常流水线中，不处理。
+
+    参数:
+        limit: 单次最多处理的块数。
+    返回值:
+        本次重新嵌入的块数量。
+    """
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=RECONCILE_GRACE_SECONDS)
+        chunk_ids = [
+            cid for (cid,) in db.query(Chunk.id)
+            .join(Episode, Episode.id == Chunk.episode_id)
+            .filter(Chunk.embedding.is_(None), Chunk.canonical_chunk_id.is_(None), Episode.created_at < cutoff)
+            .order_by(Chunk.id).limit(limit).all()
+        ]
+        metrics.set_gauge("cognito_reconcile_missing_vectors", len(chunk_ids))
+        if not chunk_ids:
+            return 0
+        done = embed_chunks(db, chunk_ids, _get_embedder())
+        logger.info(f"对账：{len(chunk_ids)} 个块缺少向量，已重新嵌入 {done} 个")
+        metrics.inc("cognito_reconcile_reembedded_total", done)
+        index_reconciled_chunks.delay(chunk_ids)
+        return done
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.index_reconciled_chunks", base=PipelineStage, bind=True, stage_label="对账索引")
+def index_reconciled_chunks(self, chunk_ids: List[int]) -> int:
+    """
+    将对账重新嵌入的块写入索引（已在索引中的块自动跳过），不改变节目与任务状态。
+    """
+    db = SessionLocal()
+    try:
+        return index_chunks_sharded(db, chunk_ids, on_model_change=_start_reembed)
     finally:
         db.close()
 
 
+@celery_app.task(name="backend.app.tasks.purge_blobs")
+def purge_blobs() -> int:
+    """周期清理过期的带外负载（celery beat）。"""
+    return blobstore.purge_expired()
+
+
+@celery_app.task(name="backend.app.tasks.evict_media_cache")
+def evict_media_cache() -> int:
+    """周期淘汰媒体缓存（celery beat）：超出 MEDIA_CACHE_MAX_BYTES 时按 LRU 删除已处理的音频，返回释放的字节数。"""
+    db = SessionLocal()
+    try:
+        return enforce_budget(db)
+    finally:
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.purge_upload_sessions")
+def purge_upload_sessions() -> int:
+    """周期清理超过 UPLOAD_SESSION_TTL 未活动的断点续传会话与残留临时文件（celery beat）。"""
+    return purge_stale_uploads()
+
+
 @celery_app.task(name="backend.app.tasks.process_transcript_task")
-def process_transcript_task(task_id: int, episode_id: int, transcript_text: str):
+def process_transcript_task(task_id: int, episode_id: int, transcript_text: blobstore.BlobRef):
     """
-    包装处理流水线为Celery任务，用于直接处理已有文本（例如手动上传/编辑场景）。
+    兼容入口：对已有文本（例如手动上传/编辑场景）启动处理链路。
+    调用方应传入 blobstore.put 的引用而非全文；直接传文本仍然可用。
+    """
+    start_text_pipeline(task_id, episode_id, blobstore.get(transcript_text))
+
+
+def _is_collection_url(url: str) -> bool:
+    """
+    判断链接是否可能为播放列表/频道（需要 yt-dlp 展开）。单视频链接可直接规整，无需联网。
+    """
+    canon = canonicalize_url(url)
+    if canon.platform == "web":
+        return True
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    path = parts.path
+    return (
+        "list=" in parts.query
+        or (path.startswith(("/playlist", "/channel/", "/c/", "/user/", "/@")) and "/video/" not in path)
+        or host.startswith("space.bilibili.com")
+    )
+
+
+def _expand_urls(urls: List[str]) -> List[str]:
+    """
+    展开播放列表/频道链接为视频链接列表（只抓取扁平元数据，不下载）。
+    """
+    from yt_dlp import YoutubeDL
+    out: List[str] = []
+    opts = {"extract_flat": "in_playlist", "skip_download": True, "quiet": True}
+    with YoutubeDL(opts) as ydl:
+        for url in urls:
+            if not _is_collection_url(url):
+                out.append(url)
+                continue
+            try:
+                info = ydl.extract_info(url, download=False)
+            except Exception:
+                out.append(url)
+                continue
+            if info.get("_type") in {"playlist", "multi_video"}:
+                for entry in info.get("entries") or []:
+                    u = (entry or {}).get("url") or (entry or {}).get("webpage_url")
+                    if u:
+                        out.append(u)
+            else:
+                out.append(info.get("webpage_url") or url)
+    return out
+
+
+def _dispatch_backfill() -> int:
+    """按公平份额放行回填子任务，返回入队数量。"""
+    jobs = scheduling.take_backfill()
+    for job in jobs:
+        fetch_video_meta.apply_async(kwargs=job, priority=scheduling.PRIORITY_BACKFILL)
+    return len(jobs)
+
+
+@celery_app.task(name="backend.app.tasks.dispatch_backfill")
+def dispatch_backfill() -> int:
+    """周期调度（celery beat）：回收超时的在途名额并放行回填子任务。"""
+    return _dispatch_backfill()
+
+
+@celery_app.task(name="backend.app.tasks.expand_bulk_intake", bind=True)
+def expand_bulk_intake(self, parent_task_id: int, urls: List[str], collection: str = DEFAULT_COLLECTION, user: Optional[str] = None):
+    """
+    批量摄入：展开链接、去重并为每个新视频创建子任务。
+
+    去重范围: 本批次内部、同一知识库中已有节目的来源键（Episode.source_key）与原始链接（Episode.source_url）；
+    同一视频可以分别收录到不同知识库（媒体缓存按来源键共享，不会重复下载）。
+    子任务以 backfill 优先级执行，先进入提交者的待调度列表，按公平份额放行（见 services/scheduling.py），
+    再由 fetch_video_meta 按主机限流下载；父任务进度通过子任务状态聚合。
+
+    参数:
+        parent_task_id: 汇总任务ID。
+        urls: 提交的链接列表（可包含播放列表/频道链接）。
+        collection: 新节目所属知识库。
+        user: 提交者，公平份额按用户划分。
+    返回:
+        新建的子任务数量。
     """
     db = SessionLocal()
     try:
-        _update_task(db, task_id, "processing", "进入文本处理")
-        embedder = Embedder()
-        index = FaissIndexManager()
-        process_transcript(db, episode_id, transcript_text, index, embedder)
-        _update_task(db, task_id, "completed", "处理完成")
+        _update_task(db, parent_task_id, "expanding", f"正在展开 {len(urls)} 个链接")
+        expanded = _expand_urls(urls)
+
+        unique: dict[str, str] = {}
+        for u in expanded:
+            unique.setdefault(canonicalize_url(u).key, u)
+        existing: set[str] = set()
+        keys = list(unique)
+        for i in range(0, len(keys), 500):
+            batch_keys = keys[i:i + 500]
+            batch_urls = [unique[k] for k in batch_keys]
+            rows = db.query(Episode.source_key, Episode.source_url).filter(
+                (Episode.source_key.in_(batch_keys)) | (Episode.source_url.in_(batch_urls)),
+                Episode.collection == collection,
+            ).all()
+            for key, url in rows:
+                if key:
+                    existing.add(key)
+                if url:
+                    existing.add(canonicalize_url(url).key)
+        todo = [(k, u) for k, u in unique.items() if k not in existing]
+
+        children: List[Task] = []
+        for _key, _url in todo:
+            child = Task(type="intake_url", status="pending", message="已接收URL，等待下载", parent_id=parent_task_id)
+            db.add(child)
+            children.append(child)
+        db.commit()
+        jobs = []
+        for child, (_key, url) in zip(children, todo):
+            progress.init_task(child)
+            jobs.append({"task_id": child.id, "source_url": url, "collection": collection})
+        # 内联执行时不经过 broker，公平调度没有意义
+        if not self.request.is_eager and scheduling.enqueue_backfill(user or "anonymous", jobs):
+            _dispatch_backfill()
+        else:
+            for job in jobs:
+                fetch_video_meta.apply_async(kwargs=job, priority=scheduling.PRIORITY_BACKFILL)
+
+        skipped = len(expanded) - len(todo)
+        _update_task(db, parent_task_id, "running", f"已创建 {len(todo)} 个子任务，跳过重复 {skipped} 个")
+        # 没有子任务，或子任务在写入 running 之前已全部结束（缓存命中、内联执行）时，由这里写入终态
+        _finish_parent_if_done(db, parent_task_id)
+        return len(todo)
     except Exception as e:
-        _update_task(db, task_id, "failed", f"处理失败: {e}")
+        _update_task(db, parent_task_id, "failed", f"批量摄入失败: {e}")
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+@celery_app.task(name="backend.app.tasks.rebuild_media_catalog")
+def rebuild_media_catalog(digest: bool = False) -> int:
+    """
+    一次性回填媒体产物目录（迁移已有缓存时使用）。
+
+    参数:
+        digest: 是否同时计算文件哈希。
+    返回:
+        登记的产物数量。
+    """
+    db = SessionLocal()
+    try:
+        return rebuild_catalog(db, MEDIA_DIR, digest=digest)
+    finally:
+        db.close()
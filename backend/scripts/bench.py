@@ -0,0 +1,474 @@
+"""
+摄入与检索基准测试：生成可复现的合成语料，在 SQLite + Celery eager 模式下跑完整流水线，
+按索引类型分别构建索引并压测检索，结果保存为 JSON 以便跨提交对比。
+
+用法（仓库根目录）:
+    python backend/scripts/bench.py --chunks 10000                       # 桩嵌入器，Flat/HNSW/IVF 三种索引
+    python backend/scripts/bench.py --chunks 100000 --ingest bulk --index-mode Flat --index-mode "IVF1024,Flat"
+    python backend/scripts/bench.py --chunks 2000 --embedder fastembed   # 真实模型端到端
+    python backend/scripts/bench.py --chunks 50000 --embedder fastembed --ingest bulk \
+        --index-mode Flat --index-mode SQfp16 --index-mode SQ8 --index-mode "PCA256,SQ8"   # 压缩索引的召回损失与内存
+    python backend/scripts/bench.py --chunks 10000 --compare bench-results/baseline.json --fail-over 20
+
+说明:
+    - 所有数据写入临时工作目录（--workdir 可指定并保留），SQLite 数据库、索引文件与媒体目录互不影响现有环境。
+    - --embedder stub 使用确定性的特征哈希嵌入（无需下载模型），用于比较流水线与索引本身的吞吐；
+      --embedder fastembed 使用 EMBED_MODEL 指定的真实模型。
+    - --ingest pipeline 逐节目跑 Celery 链路（分块 → 嵌入 → 索引，索引阶段每个节目读写一次索引文件）；
+      --ingest bulk 只跑分块与嵌入，索引统一在索引阶段构建，适合 10 万级以上语料。
+    - Redis 不可用时指标与进度自动退化为进程内/写库，不影响测试；阶段耗时分解取自指标直方图的增量。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_INDEX_MODES = ("Flat", "HNSW32", "IVF256,Flat")
+
+_ZH_WORDS = (
+    "知识", "模型", "数据", "检索", "向量", "索引", "播客", "视频", "字幕", "转写", "语音", "识别", "文本", "摘要",
+    "学习", "训练", "推理", "系统", "架构", "服务", "队列", "缓存", "存储", "网络", "延迟", "吞吐", "性能", "优化",
+    "经济", "市场", "投资", "历史", "文化", "科学", "宇宙", "物理", "化学", "生物", "医学", "健康", "教育", "心理",
+    "城市", "交通", "能源", "气候", "环境", "技术", "创新", "产品", "设计", "用户", "体验", "社区", "开源", "工程",
+    "我们", "今天", "讨论", "分析", "介绍", "问题", "方法", "结果", "研究", "发现", "重要", "可以", "需要", "通过",
+)
+_EN_WORDS = (
+    "knowledge", "model", "data", "retrieval", "vector", "index", "podcast", "video", "caption", "transcript",
+    "speech", "recognition", "text", "summary", "learning", "training", "inference", "system", "architecture",
+    "service", "queue", "cache", "storage", "network", "latency", "throughput", "performance", "optimization",
+    "economy", "market", "investment", "history", "culture", "science", "universe", "physics", "chemistry",
+    "biology", "medicine", "health", "education", "psychology", "city", "transport", "energy", "climate",
+    "environment", "technology", "innovation", "product", "design", "user", "experience", "community",
+    "the", "we", "today", "discuss", "analysis", "problem", "method", "result", "research", "important", "with",
+)
+
+
+class StubEmbedder:
+    """
+    确定性桩嵌入器：对英文单词与中文二元组做特征哈希（crc32 取桶与符号），相同文本永远得到相同向量，
+    词汇重叠的文本相似度更高，足以让检索结果有意义。
+
+    属性:
+        dim: 向量维度。
+        model_name: 指标标签中使用的模型名。
+    """
+
+    _TOKEN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.model_name = f"stub-hash-{dim}"
+
+    def _tokens(self, text: str) -> list[str]:
+        out = []
+        for tok in self._TOKEN.findall(text.lower()):
+            if tok[0].isascii():
+                out.append(tok)
+            else:
+                out.extend(tok[i:i + 2] for i in range(max(1, len(tok) - 1)))
+        return out
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            hashes = np.fromiter((zlib.crc32(t.encode()) for t in self._tokens(text)), dtype=np.uint64)
+            if hashes.size == 0:
+                out[row, 0] = 1.0
+                continue
+            signs = np.where((hashes >> np.uint64(16)) & np.uint64(1), 1.0, -1.0).astype("float32")
+            np.add.at(out[row], (hashes % np.uint64(self.dim)).astype(np.int64), signs)
+        return out
+
+
+def synth_episode(rng: random.Random, lang: str, target_chars: int) -> tuple[str, list[str]]:
+    """
+    生成一期节目的合成文本：每期从词表中抽取一组“主题词”提高出现频率，使不同节目可区分。
+
+    参数:
+        rng: 随机数生成器（保证可复现）。
+        lang: "zh" 或 "en"。
+        target_chars: 目标字符数（约为 块数 × 800）。
+    返回值:
+        (文本, 句子列表)；句子列表用于抽取查询。
+    """
+    words = _ZH_WORDS if lang == "zh" else _EN_WORDS
+    topic = rng.sample(words, 8)
+    sentences: list[str] = []
+    total = 0
+    while total < target_chars:
+        n = rng.randint(6, 14)
+        picked = [rng.choice(topic) if rng.random() < 0.4 else rng.choice(words) for _ in range(n)]
+        if lang == "zh":
+            s = "".join(picked) + rng.choice("。！？")
+        else:
+            s = " ".join(picked).capitalize() + rng.choice(".?!")
+        sentences.append(s)
+        total += len(s) + 1
+    return " ".join(sentences), sentences
+
+
+def rss_mb() -> dict:
+    """当前常驻内存与进程峰值内存（MB）。"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if sys.platform == "darwin":
+        peak /= 1024
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        pass
+    return {"rss_mb": round(current, 1) if current is not None else None, "peak_rss_mb": round(peak, 1)}
+
+
+def percentiles(samples: list[float]) -> dict:
+    """毫秒级 p50/p95/p99 与均值。"""
+    if not samples:
+        return {}
+    arr = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3), "mean_ms": round(float(arr.mean()), 3)}
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def stage_sums() -> dict:
+    """读取阶段耗时直方图的累计 (sum, count)，按 stage 聚合。"""
+    from backend.app.services import metrics
+    out: dict = {}
+    for series, value in metrics._read(metrics.HIST_KEY).items():
+        name = series.split("{", 1)[0]
+        if name not in ("cognito_stage_duration_seconds_sum", "cognito_stage_duration_seconds_count"):
+            continue
+        m = re.search(r'stage="([^"]+)"', series)
+        if not m:
+            continue
+        sums = out.setdefault(m.group(1), [0.0, 0.0])
+        sums[0 if name.endswith("_sum") else 1] += value
+    return out
+
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    out = {}
+    for stage, (total, count) in sorted(after.items()):
+        t0, c0 = before.get(stage, (0.0, 0.0))
+        if count - c0 > 0:
+            out[stage] = {"seconds": round(total - t0, 3), "calls": int(count - c0)}
+    return out
+
+
+def run_ingest(args, embedder) -> tuple[dict, list[str]]:
+    """
+    摄入阶段：逐期生成文本并跑流水线，返回统计与用于查询的句子样本。
+    """
+    from backend.app.database import SessionLocal
+    from backend.app.models import Chunk, Episode, Task
+    from backend.app.services.pipeline import chunk_transcript, embed_chunks
+    from backend.app import tasks
+
+    rng = random.Random(args.seed)
+    episodes = max(1, -(-args.chunks // args.episode_chunks))
+    query_pool: list[str] = []
+    before = stage_sums()
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        for i in range(episodes):
+            lang = args.lang if args.lang != "mixed" else ("zh" if i % 2 == 0 else "en")
+            text, sentences = synth_episode(rng, lang, args.episode_chunks * 780)
+            query_pool.extend(rng.sample(sentences, min(3, len(sentences))))
+            ep = Episode(title=f"bench-{i}", status="uploaded")
+            db.add(ep)
+            db.commit()
+            if args.ingest == "pipeline":
+                task = Task(episode_id=ep.id, type="transcript_process", status="pending", message="bench")
+                db.add(task)
+                db.commit()
+                tasks.start_text_pipeline(task.id, ep.id, text)
+            else:
+                embed_chunks(db, chunk_transcript(db, ep.id, text), embedder)
+            if args.progress and (i + 1) % args.progress == 0:
+                print(f"  ingest {i + 1}/{episodes} episodes, {time.perf_counter() - start:.1f}s", flush=True)
+        elapsed = time.perf_counter() - start
+        chunks = db.query(Chunk).count()
+    finally:
+        db.close()
+    stats = {
+        "mode": args.ingest,
+        "episodes": episodes,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(chunks / elapsed, 2) if elapsed else None,
+        "stages": stage_breakdown(before, stage_sums()),
+        **rss_mb(),
+    }
+    return stats, query_pool
+
+
+def load_vectors(batch: int = 50000) -> tuple[np.ndarray, list[int]]:
+    """按主键顺序分批读取全部已存储向量。"""
+    from backend.app.database import SessionLocal
+    from backend.app.models import Chunk
+    db = SessionLocal()
+    try:
+        ids: list[int] = []
+        parts: list[np.ndarray] = []
+        last = 0
+        while True:
+            rows = (
+                db.query(Chunk.id, Chunk.embedding)
+                .filter(Chunk.id > last, Chunk.embedding.isnot(None))
+                .order_by(Chunk.id).limit(batch).all()
+            )
+            if not rows:
+                break
+            ids.extend(cid for cid, _ in rows)
+            parts.append(np.vstack([np.frombuffer(emb, dtype="float32") for _, emb in rows]))
+            last = rows[-1][0]
+    finally:
+        db.close()
+    return (np.vstack(parts) if parts else np.zeros((0, 0), dtype="float32")), ids
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def run_index_modes(args, embedder, queries: list[str]) -> list[dict]:
+    """
+    对每种索引类型：整体构建索引（需训练的类型先用 --train-sample 条抽样训练），再逐条执行查询（嵌入 → 检索 → 回表），
+    统计延迟分位数与每条向量的索引字节数。若包含 Flat，则以其结果为基准计算其它类型的 recall@k 与压缩比。
+    """
+    from sqlalchemy import select
+    from backend.app.database import SessionLocal
+    from backend.app.models import Chunk
+    from backend.app.services.embedder import FaissIndexManager
+
+    vectors, ids = load_vectors()
+    if not ids:
+        return []
+    results = []
+    exact: list[list[int]] | None = None
+    for mode in args.index_mode:
+        base_dir = os.path.join("data", "bench_index", re.sub(r"[^A-Za-z0-9]+", "_", mode))
+        shutil.rmtree(base_dir, ignore_errors=True)
+        manager = FaissIndexManager(base_dir=base_dir, factory=mode, search_params=args.search_params)
+        start = time.perf_counter()
+        manager.load(dim=vectors.shape[1])
+        if manager.needs_training:
+            rng = np.random.default_rng(args.seed)
+            sample = rng.choice(len(ids), size=min(args.train_sample, len(ids)), replace=False)
+            manager.train(vectors[np.sort(sample)])
+        manager.add_vectors(vectors.copy(), list(ids))
+        build_s = time.perf_counter() - start
+        index_bytes = os.path.getsize(manager.index_path)
+
+        embed_t, search_t, hydrate_t, total_t = [], [], [], []
+        found: list[list[int]] = []
+        db = SessionLocal()
+        try:
+            for q in queries:
+                t0 = time.perf_counter()
+                vec = embedder.embed_texts([q])
+                t1 = time.perf_counter()
+                hits = manager.search(vec, top_k=args.top_k)
+                t2 = time.perf_counter()
+                db.execute(select(Chunk).where(Chunk.id.in_([cid for cid, _ in hits]))).scalars().all()
+                t3 = time.perf_counter()
+                embed_t.append(t1 - t0)
+                search_t.append(t2 - t1)
+                hydrate_t.append(t3 - t2)
+                total_t.append(t3 - t0)
+                found.append([cid for cid, _ in hits])
+        finally:
+            db.close()
+
+        entry = {
+            "mode": mode,
+            "index_type": manager.index_type,
+            "vectors": len(ids),
+            "build_s": round(build_s, 3),
+            "index_bytes": dir_size(base_dir),
+            "trained_on": manager.manifest.get("trained_on"),
+            "bytes_per_vector": round(index_bytes / len(ids), 1),
+            "mb_per_million": round(index_bytes / len(ids) * 1e6 / 2 ** 20, 1),
+            "query": {"embed": percentiles(embed_t), "search": percentiles(search_t),
+                      "hydrate": percentiles(hydrate_t), "total": percentiles(total_t)},
+            "qps": round(len(total_t) / sum(total_t), 1) if total_t else None,
+            **rss_mb(),
+        }
+        if mode == "Flat":
+            exact = found
+        results.append((entry, found))
+        print(f"  {mode}: build {build_s:.2f}s, {entry['bytes_per_vector']} B/向量, search p95 {entry['query']['search'].get('p95_ms')} ms", flush=True)
+
+    out = []
+    flat_bpv = next((e["bytes_per_vector"] for e, _ in results if e["mode"] == "Flat"), None)
+    for entry, found in results:
+        if exact is not None:
+            hit = sum(len(set(a) & set(b)) for a, b in zip(found, exact))
+            denom = sum(len(b) for b in exact)
+            entry[f"recall_at_{args.top_k}"] = round(hit / denom, 4) if denom else None
+        if flat_bpv:
+            entry["compression"] = round(flat_bpv / entry["bytes_per_vector"], 2)
+        out.append(entry)
+    return out
+
+
+def flatten(result: dict) -> dict:
+    """抽取用于跨提交对比的关键指标：(值, 越大越好)。"""
+    out = {}
+    ingest = result.get("ingest") or {}
+    if ingest.get("chunks_per_s"):
+        out["ingest.chunks_per_s"] = (ingest["chunks_per_s"], True)
+    for entry in result.get("index") or []:
+        m = entry["mode"]
+        out[f"{m}.build_s"] = (entry["build_s"], False)
+        if entry.get("bytes_per_vector"):
+            out[f"{m}.bytes_per_vector"] = (entry["bytes_per_vector"], False)
+        for key, value in entry.items():
+            if key.startswith("recall_at_") and value is not None:
+                out[f"{m}.{key}"] = (value, True)
+        for phase in ("search", "total"):
+            for p in ("p50_ms", "p95_ms", "p99_ms"):
+                v = entry["query"][phase].get(p)
+                if v is not None:
+                    out[f"{m}.{phase}.{p}"] = (v, False)
+    return out
+
+
+def compare(current: dict, baseline_path: str, fail_over: float | None) -> bool:
+    """
+    打印与基线结果的相对变化；超过 fail_over（百分比）的退化返回 True。
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    cur, base = flatten(current), flatten(baseline)
+    regressed = False
+    print(f"对比基线 {baseline_path}（{baseline.get('meta', {}).get('commit')}）:")
+    for key in sorted(cur.keys() & base.keys()):
+        (v, higher_better), (b, _) = cur[key], base[key]
+        if not b:
+            continue
+        change = (v - b) / b * 100
+        worse = -change if higher_better else change
+        flag = ""
+        if fail_over is not None and worse > fail_over:
+            flag = "  <-- 退化"
+            regressed = True
+        print(f"  {key:40s} {b:>12g} -> {v:>12g}  ({change:+.1f}%){flag}")
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="目标块数（实际块数以分块结果为准）")
+    parser.add_argument("--episode-chunks", type=int, default=50, help="每期节目的目标块数")
+    parser.add_argument("--lang", choices=("zh", "en", "mixed"), default="mixed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedder", choices=("stub", "fastembed"), default="stub")
+    parser.add_argument("--dim", type=int, default=384, help="桩嵌入器维度")
+    parser.add_argument("--ingest", choices=("pipeline", "bulk"), default="pipeline")
+    parser.add_argument("--index-mode", action="append", help="faiss index_factory 描述，可重复；默认 Flat / HNSW32 / IVF256,Flat")
+    parser.add_argument("--search-params", default="", help='检索参数，如 "nprobe=16" 或 "efSearch=64"')
+    parser.add_argument("--train-sample", type=int, default=65536, help="需训练的索引类型（IVF/SQ8/PCA）的训练样本数")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--workdir", help="工作目录（默认临时目录，结束后删除）")
+    parser.add_argument("--out", help="结果 JSON 路径（默认 bench-results/<时间>-<提交>.json）")
+    parser.add_argument("--compare", help="基线结果 JSON，打印相对变化")
+    parser.add_argument("--fail-over", type=float, help="与基线相比任一指标退化超过该百分比时以非零状态退出")
+    parser.add_argument("--progress", type=int, default=0, help="每 N 期打印一次摄入进度")
+    args = parser.parse_args()
+    args.index_mode = args.index_mode or list(DEFAULT_INDEX_MODES)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="cognito-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    out_path = args.out or os.path.join(ROOT, "bench-results", f"{datetime.now():%Y%m%d-%H%M%S}-{git_commit()}.json")
+    out_path = os.path.abspath(out_path)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    # 应用模块在导入时读取环境变量与相对路径，必须先切换到工作目录并设置好环境
+    os.environ["DB_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["RUN_INLINE_TASKS"] = "1"
+    os.environ.setdefault("MEDIA_DIR", os.path.join(workdir, "data", "media"))
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    from backend.app.logger import setup_logger
+    from backend.app.migrate import run_migrations
+    from backend.app.celery_app import celery_app
+    from backend.app import tasks
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    setup_logger()
+    run_migrations()
+    celery_app.conf.task_eager_propagates = True
+    if args.embedder == "stub":
+        embedder = StubEmbedder(args.dim)
+        # 流水线嵌入阶段复用进程内单例，替换为桩嵌入器即可
+        tasks._embedder = embedder
+    else:
+        embedder = tasks._get_embedder()
+
+    result: dict = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "embedder": embedder.model_name,
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "workdir")},
+        }
+    }
+    try:
+        import faiss
+        result["meta"]["faiss"] = faiss.__version__
+    except ImportError:
+        pass
+
+    try:
+        print(f"摄入 {args.chunks} 块（{args.ingest}，{embedder.model_name}）…", flush=True)
+        result["ingest"], pool = run_ingest(args, embedder)
+        print(f"  {result['ingest']['chunks']} 块，{result['ingest']['chunks_per_s']} 块/秒", flush=True)
+        queries = random.Random(args.seed + 1).choices(pool, k=args.queries) if pool else []
+        print(f"构建索引并执行 {len(queries)} 次查询…", flush=True)
+        result["index"] = run_index_modes(args, embedder, queries)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out_path}")
+
+    if baseline and compare(result, baseline, args.fail_over):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
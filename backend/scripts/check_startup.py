@@ -0,0 +1,76 @@
+"""
+API 冷启动预算检查：用 `python -X importtime` 导入 backend.app.main，校验累计导入耗时与重依赖。
+
+用法（仓库根目录）:
+    python backend/scripts/check_startup.py            # 默认预算 500ms
+    python backend/scripts/check_startup.py --budget-ms 300 --top 15
+
+失败时以非零状态码退出，可直接接入 CI。
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+# API 进程不应加载的重依赖：嵌入/索引/下载/ASR 全部在 Celery worker 中执行
+FORBIDDEN = ("faiss", "fastembed", "onnxruntime", "yt_dlp", "faster_whisper", "whisper", "torch", "celery")
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module: str) -> list[tuple[int, int, int, str]]:
+    """
+    在独立解释器中导入模块并解析 importtime 输出。
+
+    参数:
+        module: 待导入模块名。
+    返回值:
+        (自身耗时us, 累计耗时us, 嵌套深度, 模块名) 列表。
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"导入 {module} 失败")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.app.main")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "500")))
+    parser.add_argument("--top", type=int, default=10, help="打印累计耗时最高的顶层依赖数量")
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total = next((cum for _, cum, _, name in rows if name == args.module), None)
+    if total is None:
+        raise SystemExit(f"未在 importtime 输出中找到 {args.module}")
+
+    top_level = sorted((r for r in rows if r[2] == 0), key=lambda r: r[1], reverse=True)
+    print(f"{args.module}: {total / 1000:.1f} ms（预算 {args.budget_ms:.0f} ms）")
+    for _, cum, _, name in top_level[: args.top]:
+        print(f"  {cum / 1000:8.1f} ms  {name}")
+
+    loaded = sorted({name for *_, name in rows if name.split(".")[0] in FORBIDDEN})
+    failed = False
+    if loaded:
+        print(f"禁止在 API 启动时导入的模块: {', '.join(loaded)}")
+        failed = True
+    if total / 1000 > args.budget_ms:
+        print("超出冷启动预算")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
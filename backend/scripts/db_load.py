@@ -0,0 +1,109 @@
+"""
+数据库连接池压测：按进程角色的池配置，用多个线程并发“取会话 → 查询 → 持有一段时间 → 关闭”，
+统计取连接等待、同时占用的连接数、建立的连接数与超时次数，用于确定各角色的池大小。
+
+用法（仓库根目录，使用 .env 中的数据库配置）:
+    python backend/scripts/db_load.py --role api --threads 40 --seconds 20 --hold-ms 20
+    python backend/scripts/db_load.py --role worker --threads 2 --seconds 10
+    DB_POOL_SIZE_API=20 python backend/scripts/db_load.py --role api --threads 40
+
+说明:
+    - --threads 取 API 线程池大小（uvicorn 默认 40）或 worker 单进程并发；--hold-ms 模拟请求持有连接的时长。
+    - 等待时长包含池满排队与新建连接；超时（DB_POOL_TIMEOUT）计入 timeouts。
+    - 结果以 JSON 打印；同时写入 /metrics 的 cognito_db_* 指标（Redis 可用时）。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--role", default="api", help="进程角色（api/worker/script），决定池大小")
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--hold-ms", type=float, default=20, help="每次查询后持有连接的时长")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import event, text
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    from backend.app.database import SessionLocal, init_engine, pool_settings
+
+    engine = init_engine(args.role)
+    lock = threading.Lock()
+    state = {"checked_out": 0, "peak": 0, "opened": 0, "timeouts": 0, "queries": 0}
+    waits: list[float] = []
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(*_):
+        with lock:
+            state["opened"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(*_):
+        with lock:
+            state["checked_out"] += 1
+            state["peak"] = max(state["peak"], state["checked_out"])
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(*_):
+        with lock:
+            state["checked_out"] -= 1
+
+    deadline = time.monotonic() + args.seconds
+
+    def worker():
+        local_waits = []
+        while time.monotonic() < deadline:
+            db = SessionLocal()
+            try:
+                start = time.perf_counter()
+                db.connection()
+                local_waits.append(time.perf_counter() - start)
+                db.execute(text("SELECT 1"))
+                time.sleep(args.hold_ms / 1000)
+                with lock:
+                    state["queries"] += 1
+            except PoolTimeout:
+                with lock:
+                    state["timeouts"] += 1
+            finally:
+                db.close()
+        with lock:
+            waits.extend(local_waits)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    size, overflow = pool_settings(args.role)
+    w = np.array(waits or [0.0]) * 1000
+    result = {
+        "role": args.role,
+        "pool_size": size,
+        "max_overflow": overflow,
+        "threads": args.threads,
+        "queries_per_sec": round(state["queries"] / args.seconds, 1),
+        "checkout_wait_ms": {"p50": round(float(np.percentile(w, 50)), 3), "p95": round(float(np.percentile(w, 95)), 3), "max": round(float(w.max()), 3)},
+        "peak_checked_out": state["peak"],
+        "connections_opened": state["opened"],
+        "timeouts": state["timeouts"],
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+测试公共配置：仓库根目录加入导入路径，数据库指向临时 SQLite 文件（须在导入 backend.app 之前设置）。
+
+运行（仓库根目录）:
+    pip install -r backend/requirements-dev.txt
+    python -m pytest backend/tests
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="cognito-test-")
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(_TMP, 'test.db')}")
+os.environ.setdefault("MEDIA_DIR", os.path.join(_TMP, "media"))
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_TMP, "audio"))
+os.environ.setdefault("INDEX_DIR", os.path.join(_TMP, "index"))
+
+
+@pytest.fixture
+def db():
+    """每个测试一套空表的数据库会话。"""
+    from backend.app.database import Base, SessionLocal, get_engine
+    from backend.app import models  # noqa: F401  注册全部模型
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # 进程退出时指标模块会尝试写入 Redis（测试环境没有 Redis），此时 pytest 已关闭输出流
+    from loguru import logger
+    logger.remove()
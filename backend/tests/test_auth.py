@@ -0,0 +1,64 @@
+"""令牌缓存失效：用户变更在事务提交后失效缓存，令牌声明被吊销后回退到数据库确认。"""
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from backend.app import auth
+from backend.app.models import User
+
+
+@pytest.fixture
+def user(db, monkeypatch):
+    # 测试环境没有 Redis：不读取吊销时间戳
+    monkeypatch.setattr(auth, "_claims_revoked", lambda payload: False)
+    auth.token_cache.clear()
+    u = User(username="alice", password_hash=auth.hash_password("pw"), role="viewer")
+    db.add(u)
+    db.commit()
+    return u
+
+
+def _creds(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_role_change_invalidates_after_commit(db, user):
+    token = auth.create_access_token("alice", "viewer")
+    assert auth.get_current_user(_creds(token)).role == "viewer"
+
+    user.role = "admin"
+    db.flush()
+    # 尚未提交：其它会话读到的仍是旧角色，此时失效会被并发请求重新写回旧值
+    assert auth.token_cache.get(token) is not None
+    db.commit()
+    assert auth.token_cache.get(token) is None
+    assert auth.get_current_user(_creds(token)).role == "admin"
+
+
+def test_rollback_keeps_cache(db, user):
+    token = auth.create_access_token("alice", "viewer")
+    auth.get_current_user(_creds(token))
+    user.role = "admin"
+    db.flush()
+    db.rollback()
+    assert auth.token_cache.get(token) is not None
+    assert "auth_invalidate" not in db.info
+
+
+def test_delete_invalidates_after_commit(db, user):
+    token = auth.create_access_token("alice", "viewer")
+    auth.get_current_user(_creds(token))
+    db.delete(user)
+    db.commit()
+    assert auth.token_cache.get(token) is None
+
+
+def test_revoked_claims_are_checked_against_db(db, user, monkeypatch):
+    token = auth.create_access_token("alice", "admin")
+    monkeypatch.setattr(auth, "_claims_revoked", lambda payload: True)
+    resolved = auth.get_token_user(_creds(token))
+    assert resolved.role == "viewer" and resolved.id == user.id
+
+
+def test_unrevoked_claims_skip_db(user):
+    token = auth.create_access_token("bob", "viewer")
+    resolved = auth.get_token_user(_creds(token))
+    assert resolved == auth.AuthUser(id=None, username="bob", role="viewer")
@@ -0,0 +1,58 @@
+"""近重复检测：SimHash 指纹与入库时的批量去重（dedupe_chunks）。"""
+from backend.app.models import Chunk, ChunkSignature, Episode
+from backend.app.services import dedup
+
+
+AD = "本期节目由某某赞助播出，使用优惠码可以在官网享受八折优惠，活动截止到本月底，欢迎大家前往官网了解更多详情。" * 2
+TOPIC_A = "量子纠缠是指两个或多个粒子在相互作用之后，即使相隔很远，其量子态仍然不能被单独描述，只能作为整体来描述的现象。" * 2
+TOPIC_B = "黑洞是时空中引力极强的区域，任何物质和辐射一旦越过事件视界都无法逃逸，它通常由大质量恒星坍缩形成并不断吸积周围物质。" * 2
+
+
+def _add_chunks(db, collection, texts):
+    ep = Episode(title="t", file_path="", collection=collection)
+    db.add(ep)
+    db.flush()
+    chunks = [Chunk(episode_id=ep.id, text=t, collection=collection) for t in texts]
+    db.add_all(chunks)
+    db.flush()
+    return chunks
+
+
+def test_simhash_near_duplicates_are_close():
+    base = dedup.simhash(AD)
+    assert dedup.hamming(base, dedup.simhash(AD.replace("八折", "九折"))) <= 16
+    assert dedup.hamming(base, dedup.simhash(TOPIC_A)) > dedup.SIMHASH_MAX_DISTANCE
+    assert dedup.simhash(AD) == base
+
+
+def test_signed_roundtrip():
+    for fp in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        assert dedup.to_unsigned(dedup.to_signed(fp)) == fp
+        assert -(1 << 63) <= dedup.to_signed(fp) < (1 << 63)
+
+
+def test_in_batch_duplicate_links_to_first(db):
+    chunks = _add_chunks(db, "default", [AD, TOPIC_A, AD, "短句"])
+    assert dedup.dedupe_chunks(db, chunks) == 1
+    assert chunks[2].canonical_chunk_id == chunks[0].id
+    assert chunks[0].canonical_chunk_id is None and chunks[1].canonical_chunk_id is None
+    # 规范块写入签名，重复块与过短的块不写
+    signed = {cid for (cid,) in db.query(ChunkSignature.chunk_id).distinct()}
+    assert signed == {chunks[0].id, chunks[1].id}
+
+
+def test_duplicate_of_earlier_batch(db):
+    first = _add_chunks(db, "default", [AD, TOPIC_A])
+    dedup.dedupe_chunks(db, first)
+    second = _add_chunks(db, "default", [TOPIC_B, AD])
+    assert dedup.dedupe_chunks(db, second) == 1
+    assert second[1].canonical_chunk_id == first[0].id
+    assert second[0].canonical_chunk_id is None
+
+
+def test_other_collection_is_not_linked(db):
+    first = _add_chunks(db, "creator_a", [AD])
+    dedup.dedupe_chunks(db, first)
+    other = _add_chunks(db, "creator_b", [AD])
+    assert dedup.dedupe_chunks(db, other) == 0
+    assert other[0].canonical_chunk_id is None
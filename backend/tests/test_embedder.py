@@ -0,0 +1,28 @@
+"""索引文件的原子写入：写入失败时保留旧文件，成功后不残留临时文件。"""
+import os
+import pytest
+from backend.app.services import embedder
+
+
+def test_manifest_and_current_are_replaced(tmp_path):
+    root = str(tmp_path)
+    embedder.write_manifest(root, {"model": "m1"})
+    embedder.write_manifest(root, {"model": "m2"})
+    embedder.set_current("g1", root=root)
+    assert embedder.read_manifest(root) == {"model": "m2"}
+    assert embedder.current_generation(root) == "g1"
+    assert sorted(os.listdir(root)) == ["CURRENT", "manifest.json"]
+
+
+def test_failed_write_keeps_previous_manifest(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    embedder.write_manifest(root, {"model": "m1", "count": 10})
+
+    def broken_dump(obj, f, **kwargs):
+        f.write('{"model": "m2", "cou')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(embedder.json, "dump", broken_dump)
+    with pytest.raises(OSError):
+        embedder.write_manifest(root, {"model": "m2", "count": 20})
+    assert embedder.read_manifest(root) == {"model": "m1", "count": 10}
@@ -0,0 +1,54 @@
+"""节目列表：键集游标的编码往返，游标分页无重复、无遗漏，计数缓存有界。"""
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from backend.app.models import Episode
+from backend.app.routers import episodes
+
+
+def test_cursor_roundtrip():
+    ts = datetime(2026, 10, 19, 8, 30, 15, 123456)
+    cursor = episodes._encode_cursor(ts, 42)
+    assert "=" not in cursor
+    assert episodes._decode_cursor(cursor) == (ts, 42)
+
+
+def test_invalid_cursor_is_400():
+    with pytest.raises(HTTPException) as e:
+        episodes._decode_cursor("not-a-cursor")
+    assert e.value.status_code == 400
+
+
+def test_cursor_pages_cover_all_rows(db):
+    base = datetime(2026, 1, 1)
+    # 相同 created_at 的行按 id 区分，跨页不重复
+    for i in range(25):
+        db.add(Episode(title=f"e{i}", file_path="", status="processed" if i % 2 else "uploaded",
+                       created_at=base + timedelta(minutes=i // 3)))
+    db.commit()
+    episodes._count_cache = episodes._CountCache(8, 30)
+
+    seen, cursor = [], None
+    while True:
+        page = episodes.list_episodes(page=1, size=4, status=None, cursor=cursor, db=db)
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert page["total"] == 25
+    assert len(seen) == len(set(seen)) == 25
+    expected = [e.id for e in db.query(Episode).order_by(Episode.created_at.desc(), Episode.id.desc())]
+    assert seen == expected
+
+    first = episodes.list_episodes(page=1, size=20, status="processed", cursor=None, db=db)
+    assert first["total"] == 12 and len(first["items"]) == 12 and first["next_cursor"] is None
+
+
+def test_count_cache_is_bounded():
+    cache = episodes._CountCache(max_size=2, ttl=30)
+    for status in ("a", "b", "c"):
+        cache.put(status, 1)
+    assert cache.get("a") is None and cache.get("c") == 1
+    expired = episodes._CountCache(max_size=2, ttl=0)
+    expired.put("a", 1)
+    assert expired.get("a") is None
@@ -0,0 +1,74 @@
+"""媒体缓存：链接规整为来源键，旧文件名中的裸ID换算为同一套来源键。"""
+import pytest
+from backend.app.services.media_cache import canonicalize_url, object_path, source_key_for_id
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+    "youtube.com/watch?v=dQw4w9WgXcQ&feature=share&t=42",
+    "https://m.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ",
+])
+def test_youtube_forms_share_one_key(url):
+    canon = canonicalize_url(url)
+    assert canon.key == "youtube:dQw4w9WgXcQ"
+    assert canon.url == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def test_bilibili_pages_and_tracking():
+    assert canonicalize_url("https://www.bilibili.com/video/BV1xx411c7mD?spm_id_from=333&vd_source=x").key == "bilibili:BV1xx411c7mD"
+    assert canonicalize_url("https://m.bilibili.com/video/BV1xx411c7mD/?p=1").key == "bilibili:BV1xx411c7mD"
+    assert canonicalize_url("https://www.bilibili.com/video/BV1xx411c7mD?p=3").key == "bilibili:BV1xx411c7mD_p3"
+    assert canonicalize_url("https://www.bilibili.com/video/AV170001").key == "bilibili:av170001"
+
+
+def test_tiktok():
+    url = "https://www.tiktok.com/@someone/video/7234567890123456789?is_from_webapp=1"
+    assert canonicalize_url(url).key == "tiktok:7234567890123456789"
+
+
+def test_other_sites_ignore_tracking_and_fragment():
+    a = canonicalize_url("https://Example.com/talk/?utm_source=x&id=7#t=10")
+    b = canonicalize_url("https://example.com/talk?id=7")
+    c = canonicalize_url("https://example.com/talk?id=8")
+    assert a.platform == "web" and a.key == b.key != c.key
+
+
+@pytest.mark.parametrize("video_id, key", [
+    ("BV1xx411c7mD", "bilibili:BV1xx411c7mD"),
+    ("BV1xx411c7mD_p2", "bilibili:BV1xx411c7mD_p2"),
+    ("dQw4w9WgXcQ", "youtube:dQw4w9WgXcQ"),
+    ("7234567890123456789", "tiktok:7234567890123456789"),
+    ("20251117-093751-test", None),
+])
+def test_bare_ids_map_to_canonical_keys(video_id, key):
+    assert source_key_for_id(video_id) == key
+
+
+def test_object_path_buckets_by_hash():
+    sha = "ab" + "0" * 62
+    assert object_path(sha, ".M4A").endswith(f"objects/ab/{sha}.m4a")
+
+
+def test_enforce_budget_evicts_oldest_processed_only(db, tmp_path):
+    from datetime import datetime, timedelta
+    from backend.app.models import MediaArtifact
+    from backend.app.services.media_cache import enforce_budget
+
+    now = datetime.utcnow()
+    rows = []
+    for i, (name, processed) in enumerate([("old", True), ("pending", False), ("mid", True), ("new", True)]):
+        path = tmp_path / f"{name}.m4a"
+        path.write_bytes(b"x" * 100)
+        rows.append(MediaArtifact(source_id=f"youtube:{name}", kind="audio", path=str(path), size=100,
+                                  processed=processed, last_accessed_at=now + timedelta(minutes=i)))
+    db.add_all(rows)
+    db.commit()
+
+    # 400 字节，预算 250：淘汰最久未访问的已处理对象 old、mid；未处理的 pending 不能删除
+    assert enforce_budget(db, max_bytes=250) == 200
+    left = {a.source_id for a in db.query(MediaArtifact)}
+    assert left == {"youtube:pending", "youtube:new"}
+    assert not (tmp_path / "old.m4a").exists() and (tmp_path / "pending.m4a").exists()
+    assert enforce_budget(db, max_bytes=250) == 0
@@ -0,0 +1,19 @@
+"""指标序列名：标签值按 Prometheus 文本格式转义。"""
+from backend.app.services import metrics
+
+
+def test_label_values_are_escaped():
+    series = metrics._series("cognito_x", {"path": 'C:\\tmp\\"a"', "msg": "line1\nline2"})
+    assert series == 'cognito_x{msg="line1\\nline2",path="C:\\\\tmp\\\\\\"a\\""}'
+    assert "\n" not in series
+
+
+def test_plain_labels_unchanged():
+    assert metrics._series("cognito_x", {}) == "cognito_x"
+    assert metrics._series("cognito_x", {"b": 2, "a": "q"}) == 'cognito_x{a="q",b="2"}'
+
+
+def test_rendered_gauge_stays_on_one_line():
+    metrics.set_gauge("cognito_test_escape", 1, title='say "hi"\nbye')
+    lines = metrics.render_prometheus().splitlines()
+    assert 'cognito_test_escape{title="say \\"hi\\"\\nbye"} 1' in lines
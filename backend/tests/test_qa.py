@@ -0,0 +1,55 @@
+"""问答抽取：问句识别、块内自问自答配对、弹幕高频问题计数。"""
+import pytest
+from backend.app.services import qa
+
+
+@pytest.mark.parametrize("sentence", [
+    "为什么要用键集分页？",
+    "能不能离线运行",
+    "你们真的用过吗",
+    "How does the index get rebuilt",
+    "Is this free?",
+])
+def test_is_question(sentence):
+    assert qa.is_question(sentence)
+
+
+@pytest.mark.parametrize("sentence", [
+    "这就是答案。",
+    "嗯？",                      # 过短
+    "我们今天聊一聊数据库索引。",
+    "Whatever happens, keep going.",
+    "这个模型能不能离线运行",        # 疑问词只在句首识别
+    "为" * 130 + "？",            # 过长
+])
+def test_is_not_question(sentence):
+    assert not qa.is_question(sentence)
+
+
+def test_extract_pairs_question_with_following_answer():
+    text = ("为什么要做键集分页？因为 OFFSET 越往后越慢，数据库要先扫描并丢弃前面所有的行。"
+            "用上一页最后一行的时间和ID做条件，每页的代价就和页码无关了。"
+            "那要不要保留页码参数呢？短的。")
+    pairs = qa.extract_from_text(text)
+    assert len(pairs) == 1
+    question, answer = pairs[0]
+    assert question == "为什么要做键集分页？"
+    assert answer.startswith("因为 OFFSET") and "页码无关" in answer
+    assert qa.QA_ANSWER_MIN_CHARS <= len(answer) <= qa.QA_ANSWER_MAX_CHARS
+
+
+def test_extract_skips_short_answers_and_plain_text():
+    assert qa.extract_from_text("这是什么？一个例子。") == []
+    assert qa.extract_from_text("今天天气不错。我们出去走走。") == []
+
+
+def test_extract_caps_answer_length():
+    sentence = "这是一句用于凑长度的解释说明文字" * 3 + "。"
+    pairs = qa.extract_from_text("怎么控制答案长度？" + sentence * 20)
+    assert len(pairs) == 1
+    assert len(pairs[0][1]) <= qa.QA_ANSWER_MAX_CHARS
+
+
+def test_popular_questions_counts_normalized_lines():
+    lines = ["这是什么歌？", "这是什么歌?", "这是 什么歌？？", "好听", "这是什么歌", "up主是谁？"]
+    assert qa.popular_questions(lines, min_count=3) == [("这是什么歌？", 3)]
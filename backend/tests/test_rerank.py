@@ -0,0 +1,43 @@
+"""检索重排：MMR 去除重复候选，best_snippet 抽取与问题最相关的句子窗口。"""
+import numpy as np
+from backend.app.services.rerank import best_snippet, mmr
+
+
+def test_mmr_pure_relevance_matches_similarity_order():
+    q = np.array([1.0, 0.0, 0.0])
+    cands = np.array([[0.5, 0.5, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    assert mmr(q, cands, k=3, lambda_=1.0) == [1, 0, 2]
+
+
+def test_mmr_skips_near_duplicate():
+    q = np.array([1.0, 0.2, 0.0])
+    dup = np.array([1.0, 0.1, 0.0])
+    other = np.array([0.7, 0.7, 0.0])
+    cands = np.stack([dup, dup * 1.001, other])
+    # 纯相关性会连选两条重复片段；MMR 第二个选择不同的候选
+    assert sorted(mmr(q, cands, k=2, lambda_=1.0)) == [0, 1]
+    first, second = mmr(q, cands, k=2, lambda_=0.5)
+    assert first in (0, 1) and second == 2
+
+
+def test_mmr_edge_cases():
+    assert mmr(np.ones(4), np.zeros((0, 4)), k=3) == []
+    picked = mmr(np.ones(4), np.eye(4), k=10)
+    assert sorted(picked) == [0, 1, 2, 3]
+
+
+def test_best_snippet_picks_matching_sentence():
+    text = ("The weather was nice today. "
+            "Quantum entanglement links the states of two particles. "
+            "We also talked about cooking pasta.")
+    snippet = best_snippet(text, "what is quantum entanglement", max_chars=60)
+    assert snippet.startswith("Quantum entanglement")
+    assert len(snippet) <= 60
+
+
+def test_best_snippet_chinese_and_no_overlap():
+    text = "今天天气很好。黑洞是引力极强的天体。我们下次再见。"
+    assert "黑洞" in best_snippet(text, "黑洞是什么", max_chars=20)
+    # 没有问题词重叠时返回开头的句子
+    assert best_snippet(text, "毫无关系", max_chars=10) == "今天天气很好。"
+    assert best_snippet("", "问题", max_chars=10) == ""
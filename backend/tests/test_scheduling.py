@@ -0,0 +1,32 @@
+"""优先级映射：指标标签与 broker 中各优先级子队列的键。"""
+import pytest
+from backend.app.services import scheduling
+
+
+def test_priority_order():
+    assert scheduling.PRIORITY_INTERACTIVE < scheduling.PRIORITY_NORMAL < scheduling.PRIORITY_BACKFILL
+    # 每个具名优先级都有对应的子队列，且子队列按优先级升序（worker 按此顺序取消息）
+    assert set(scheduling.PRIORITY_NAMES) == set(scheduling.PRIORITY_STEPS)
+    assert scheduling.PRIORITY_STEPS == sorted(scheduling.PRIORITY_STEPS)
+
+
+@pytest.mark.parametrize("priority, name", [
+    (None, "normal"),
+    (0, "interactive"),
+    (3, "normal"),
+    (6, "backfill"),
+    ("6", "backfill"),
+    (9, "low"),
+    (5, "5"),
+])
+def test_priority_name(priority, name):
+    assert scheduling.priority_name(priority) == name
+
+
+@pytest.mark.parametrize("queue, priority, key", [
+    ("download", scheduling.PRIORITY_INTERACTIVE, "download"),
+    ("cpu", scheduling.PRIORITY_NORMAL, "cpu:3"),
+    ("embed", scheduling.PRIORITY_BACKFILL, "embed:6"),
+])
+def test_queue_key(queue, priority, key):
+    assert scheduling.queue_key(queue, priority) == key
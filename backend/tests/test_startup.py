@@ -0,0 +1,51 @@
+"""
+API 冷启动预算（见 backend/scripts/check_startup.py）：禁止加载的重依赖，以及应用自身导入耗时。
+
+- 应用耗时 = 导入 backend.app.main 的累计耗时 − 仅导入框架（fastapi / sqlalchemy.orm / pydantic）的耗时。
+  预算按框架耗时的倍数给出（STARTUP_APP_BUDGET_RATIO，默认 1.0：应用自身不超过框架本身），随机器快慢等比缩放。
+- 设置 STARTUP_BUDGET_MS 时另外校验绝对耗时（与脚本的 --budget-ms 一致，在目标机器的 CI 中使用）。
+各取三次中的最小值以降低抖动。
+"""
+import importlib.util
+import os
+import pytest
+from conftest import ROOT
+
+
+_spec = importlib.util.spec_from_file_location("check_startup", os.path.join(ROOT, "backend", "scripts", "check_startup.py"))
+check_startup = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(check_startup)
+
+APP_MODULE = "backend.app.main"
+FRAMEWORK = "fastapi, sqlalchemy.orm, pydantic"
+APP_BUDGET_RATIO = float(os.getenv("STARTUP_APP_BUDGET_RATIO", "1.0"))
+
+
+def _total_ms(rows) -> float:
+    """顶层导入的累计耗时之和（毫秒）。"""
+    return sum(cum for _, cum, depth, _ in rows if depth == 0) / 1000
+
+
+@pytest.fixture(scope="module")
+def app_rows():
+    os.chdir(ROOT)
+    runs = [check_startup.measure(APP_MODULE) for _ in range(3)]
+    return min(runs, key=_total_ms)
+
+
+def test_no_forbidden_modules(app_rows):
+    loaded = sorted({name for *_, name in app_rows if name.split(".")[0] in check_startup.FORBIDDEN})
+    assert loaded == []
+
+
+def test_app_import_budget(app_rows):
+    framework = min(_total_ms(check_startup.measure(FRAMEWORK)) for _ in range(3))
+    app_ms = _total_ms(app_rows) - framework
+    budget = framework * APP_BUDGET_RATIO
+    assert app_ms <= budget, f"应用自身导入 {app_ms:.0f} ms，超出预算 {budget:.0f} ms（框架 {framework:.0f} ms）"
+
+
+@pytest.mark.skipif("STARTUP_BUDGET_MS" not in os.environ, reason="未设置绝对预算 STARTUP_BUDGET_MS")
+def test_absolute_budget(app_rows):
+    total = next(cum for _, cum, _, name in app_rows if name == APP_MODULE) / 1000
+    assert total <= float(os.environ["STARTUP_BUDGET_MS"])
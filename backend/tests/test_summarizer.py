@@ -0,0 +1,57 @@
+"""分层摘要：中心度只对有向量的块计算；缓存按内容指纹复用，块位置移动时不重算。"""
+import numpy as np
+from backend.app.models import Chunk, Episode, SummaryNode
+from backend.app.services import summarizer
+
+
+def _vec(*values):
+    return np.array(values, dtype="float32").tobytes()
+
+
+def test_centrality_scores_chunks_with_embeddings():
+    weights = summarizer._centrality([_vec(1, 0), None, _vec(0.9, 0.1), _vec(0, 1)])
+    assert weights[0] > weights[3] and weights[2] > weights[3]
+    assert np.isclose(weights[1], np.mean(weights[[0, 2, 3]]))
+    assert all(0.5 <= w <= 1.0 for w in weights)
+
+
+def test_centrality_ignores_minority_dimension():
+    weights = summarizer._centrality([_vec(1, 0), _vec(0, 1), _vec(1, 0, 0)])
+    assert np.isclose(weights[0], weights[1]) and np.isclose(weights[2], weights[0])
+
+
+def test_centrality_unweighted_without_enough_vectors():
+    assert list(summarizer._centrality([None, None])) == [1.0, 1.0]
+    assert list(summarizer._centrality([_vec(1, 0), None])) == [1.0, 1.0]
+
+
+def _texts(n):
+    return [f"第{i}段讲的是话题{i}。话题{i}很重要，因为它和话题{i}的细节有关。最后顺便提一句别的。" for i in range(n)]
+
+
+def test_inserted_chunk_reuses_cached_nodes(db, monkeypatch):
+    ep = Episode(title="t", file_path="")
+    db.add(ep)
+    db.commit()
+    texts = _texts(10)
+    db.add_all(Chunk(episode_id=ep.id, text=t) for t in texts)
+    db.commit()
+
+    calls = []
+    original = summarizer.summarize_chunk
+    monkeypatch.setattr(summarizer, "summarize_chunk", lambda text: calls.append(text) or original(text))
+    monkeypatch.setattr(summarizer, "SUMMARY_SECTION_CHUNKS", 4)
+    first = summarizer.summarize_episode(db, ep.id, workers=1)
+    assert len(calls) == 10 and first
+
+    # 重新分块后开头多出一块：其余块的位置全部后移，但内容未变
+    db.query(Chunk).filter(Chunk.episode_id == ep.id).delete()
+    db.add_all(Chunk(episode_id=ep.id, text=t) for t in ["新增的开场白。今天聊点别的。"] + texts)
+    db.commit()
+    calls.clear()
+    summarizer.summarize_episode(db, ep.id, workers=1)
+    assert calls == ["新增的开场白。今天聊点别的。"]
+
+    nodes = db.query(SummaryNode).filter(SummaryNode.episode_id == ep.id, SummaryNode.level == summarizer.LEVEL_CHUNK)
+    chunk_ids = [c.id for c in db.query(Chunk).filter(Chunk.episode_id == ep.id).order_by(Chunk.id)]
+    assert [n.chunk_id for n in nodes.order_by(SummaryNode.position)] == chunk_ids